@@ -62,6 +62,7 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'expensetracker.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -70,10 +71,12 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'expensetracker.middleware.TokenAuthMiddleware',
+    'expensetracker.middleware.ReplicaRoutingMiddleware',
 ]
 
 if HAS_WHITENOISE:
-    MIDDLEWARE.insert(1, 'whitenoise.middleware.WhiteNoiseMiddleware')
+    MIDDLEWARE.insert(2, 'whitenoise.middleware.WhiteNoiseMiddleware')
 
 # MIDDLEWARE = [
 #     'corsheaders.middleware.CorsMiddleware',
@@ -111,6 +114,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'backend.wsgi.application'
 
+# Set by backend/asgi.py: route the AI endpoints to their async views, which
+# keep slow provider calls in flight without a thread each. Serve with e.g.
+#   gunicorn backend.asgi:application -k uvicorn.workers.UvicornWorker
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', 'False').lower() == 'true'
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -122,9 +130,15 @@ USE_EXTERNAL_DATABASE = (
     or os.environ.get('DJANGO_USE_DATABASE_URL', '').lower() == 'true'
 )
 
+# Connections are kept open between requests and checked before reuse, so a
+# restarted database server costs one failed ping instead of a failed request.
+# Not under ASGI: Django runs each request's ORM calls on a fresh thread there,
+# so a kept connection would never be reused.
+DATABASE_CONN_MAX_AGE = int(os.environ.get('DATABASE_CONN_MAX_AGE', '0' if ASYNC_VIEWS else '600'))
+
 if DATABASE_URL and USE_EXTERNAL_DATABASE:
     DATABASES = {
-        'default': dj_database_url.parse(DATABASE_URL, conn_max_age=600),
+        'default': dj_database_url.parse(DATABASE_URL, conn_max_age=DATABASE_CONN_MAX_AGE, conn_health_checks=True),
     }
 else:
     # Default to SQLite for local development only.
@@ -132,8 +146,161 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Seconds a connection waits on another writer's lock before
+                # raising "database is locked".
+                'timeout': float(os.environ.get('SQLITE_BUSY_TIMEOUT', '5')),
+            },
+        }
+    }
+
+# Read replicas: comma-separated database URLs, registered as replica1,
+# replica2, ... Views marked @replica_reads read from one of them; writes and
+# everything else go to default. After a write the client reads from the
+# primary for DATABASE_REPLICA_STICKY_SECONDS so it sees its own changes; the
+# pin is kept in the cache, so replicas require REDIS_URL. Anonymous clients
+# cannot be pinned and always read from the primary.
+# Locally, two SQLite files work: DATABASE_REPLICA_URLS=sqlite:////abs/path/replica.sqlite3
+DATABASE_REPLICAS = []
+for index, url in enumerate(
+    (url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()), start=1
+):
+    alias = f'replica{index}'
+    DATABASES[alias] = dj_database_url.parse(url, conn_max_age=DATABASE_CONN_MAX_AGE, conn_health_checks=True)
+    # Tests run replica reads against the test primary.
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['expensetracker.routers.PrimaryReplicaRouter']
+DATABASE_REPLICA_STICKY_SECONDS = int(os.environ.get('DATABASE_REPLICA_STICKY_SECONDS', '10'))
+
+# Applied to every new SQLite connection (see expensetracker/apps.py). WAL lets
+# readers run alongside the writer; NORMAL syncs at checkpoints rather than on
+# every commit, which is still crash-safe in WAL mode.
+SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+
+# Single expense inserts. "direct" commits each request on its own; "coalesce"
+# hands them to one writer thread per process that commits whatever is queued
+# (up to EXPENSE_WRITE_BATCH_SIZE rows, waiting at most
+# EXPENSE_WRITE_MAX_DELAY_MS for more) in one transaction.
+EXPENSE_WRITE_MODE = os.environ.get('EXPENSE_WRITE_MODE', 'direct')
+EXPENSE_WRITE_BATCH_SIZE = int(os.environ.get('EXPENSE_WRITE_BATCH_SIZE', '256'))
+EXPENSE_WRITE_MAX_DELAY_MS = float(os.environ.get('EXPENSE_WRITE_MAX_DELAY_MS', '2'))
+EXPENSE_WRITE_TIMEOUT = float(os.environ.get('EXPENSE_WRITE_TIMEOUT', '10'))
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# LocMemCache evicts least-recently-used entries once MAX_ENTRIES is reached.
+# Set REDIS_URL to share the cache between workers.
+
+REDIS_URL = os.environ.get('REDIS_URL')
+
+if REDIS_URL and find_spec('redis') is not None:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
         }
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'expensetracker',
+            'OPTIONS': {
+                'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', '1000')),
+            },
+        }
+    }
+
+AI_INSIGHT_CACHE_TTL = int(os.environ.get('AI_INSIGHT_CACHE_TTL', '3600'))
+
+# AI providers
+# Connect and read timeouts are separate: a dead endpoint should fail fast,
+# while a slow generation may legitimately take a while to stream back.
+
+AI_HTTP_CONNECT_TIMEOUT = float(os.environ.get('AI_HTTP_CONNECT_TIMEOUT', '3.05'))
+AI_HTTP_READ_TIMEOUT = float(os.environ.get('AI_HTTP_READ_TIMEOUT', '30'))
+AI_HTTP_POOL_SIZE = int(os.environ.get('AI_HTTP_POOL_SIZE', '10'))
+# Async views wait on a socket rather than a thread, so their pool can be large.
+AI_HTTP_ASYNC_POOL_SIZE = int(os.environ.get('AI_HTTP_ASYNC_POOL_SIZE', '256'))
+AI_HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('AI_HTTP_KEEPALIVE_EXPIRY', '60'))
+GEMINI_API_BASE = os.environ.get('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1beta')
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL') or None
+
+# Insight prompts: "compact" sends aggregated features cut to
+# AI_PROMPT_TOKEN_BUDGET (estimated) tokens; "detailed" sends the older
+# summary plus the 30 latest raw expenses.
+AI_PROMPT_STYLE = os.environ.get('AI_PROMPT_STYLE', 'compact')
+AI_PROMPT_TOKEN_BUDGET = int(os.environ.get('AI_PROMPT_TOKEN_BUDGET', '250'))
+AI_MAX_OUTPUT_TOKENS = int(os.environ.get('AI_MAX_OUTPUT_TOKENS', '300'))
+
+# ?provider=hedged races every healthy provider and gives up after this many
+# seconds, answering with local insights instead.
+AI_HEDGE_DEADLINE = float(os.environ.get('AI_HEDGE_DEADLINE', '4'))
+AI_HEDGE_POOL_SIZE = int(os.environ.get('AI_HEDGE_POOL_SIZE', '8'))
+
+# ?async=1 insight jobs. "thread" runs them on a bounded pool inside each web
+# worker; "queue" only records them for `manage.py run_insight_jobs` to drain.
+AI_INSIGHT_JOB_MODE = os.environ.get('AI_INSIGHT_JOB_MODE', 'thread')
+AI_INSIGHT_JOB_WORKERS = int(os.environ.get('AI_INSIGHT_JOB_WORKERS', '4'))
+AI_INSIGHT_JOB_POLL_INTERVAL = float(os.environ.get('AI_INSIGHT_JOB_POLL_INTERVAL', '0.5'))
+AI_INSIGHT_JOB_STREAM_TIMEOUT = float(os.environ.get('AI_INSIGHT_JOB_STREAM_TIMEOUT', '60'))
+# A job stream served by a sync (WSGI) view holds a worker thread while it
+# polls, so it closes much sooner and the client reconnects.
+AI_INSIGHT_JOB_SYNC_STREAM_TIMEOUT = float(os.environ.get('AI_INSIGHT_JOB_SYNC_STREAM_TIMEOUT', '5'))
+# In-flight jobs untouched for this long are treated as abandoned (their
+# worker died or restarted) instead of being joined by new requests.
+AI_INSIGHT_JOB_STALE_AFTER = int(os.environ.get('AI_INSIGHT_JOB_STALE_AFTER', '300'))
+
+# Token buckets for insight requests that would reach a provider: each user,
+# and the deployment as a whole, refill PER_MINUTE tokens up to BURST (0
+# disables a limit). Over the limit, answer 429 with Retry-After, or serve
+# the local fallback insight when AI_RATE_LIMIT_FALLBACK is on. The buckets
+# are only shared across workers when the cache is (REDIS_URL).
+AI_RATE_LIMIT_USER_PER_MINUTE = float(os.environ.get('AI_RATE_LIMIT_USER_PER_MINUTE', '6'))
+AI_RATE_LIMIT_USER_BURST = int(os.environ.get('AI_RATE_LIMIT_USER_BURST', '3'))
+AI_RATE_LIMIT_GLOBAL_PER_MINUTE = float(os.environ.get('AI_RATE_LIMIT_GLOBAL_PER_MINUTE', '600'))
+AI_RATE_LIMIT_GLOBAL_BURST = int(os.environ.get('AI_RATE_LIMIT_GLOBAL_BURST', '100'))
+AI_RATE_LIMIT_FALLBACK = os.environ.get('AI_RATE_LIMIT_FALLBACK', 'False').lower() == 'true'
+
+# Circuit breaker: open after this many failures inside the window (or on any
+# quota error), back off exponentially, honour Retry-After when it is longer.
+AI_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('AI_BREAKER_FAILURE_THRESHOLD', '3'))
+AI_BREAKER_FAILURE_WINDOW = int(os.environ.get('AI_BREAKER_FAILURE_WINDOW', '60'))
+AI_BREAKER_BASE_BACKOFF = float(os.environ.get('AI_BREAKER_BASE_BACKOFF', '30'))
+AI_BREAKER_MAX_BACKOFF = float(os.environ.get('AI_BREAKER_MAX_BACKOFF', '900'))
+AI_BREAKER_RESET_TIMEOUT = int(os.environ.get('AI_BREAKER_RESET_TIMEOUT', '3600'))
+
+# API auth: login issues a token signed with SECRET_KEY, and requests without
+# one are refused. AUTH_TOKEN_REQUIRED=false lets legacy clients that don't
+# send it yet act on the user id they name; each such request logs a
+# deprecation warning.
+AUTH_TOKEN_MAX_AGE = int(os.environ.get('AUTH_TOKEN_MAX_AGE', str(7 * 24 * 3600)))
+AUTH_TOKEN_REQUIRED = os.environ.get('AUTH_TOKEN_REQUIRED', 'True').lower() == 'true'
+AUTH_USER_CACHE_SIZE = int(os.environ.get('AUTH_USER_CACHE_SIZE', '1024'))
+
+# Metrics served at /api/metrics. With several worker processes, point
+# METRICS_DIR at a directory they share (and empty it on deploy): each worker
+# snapshots its counts there every METRICS_FLUSH_INTERVAL seconds and the
+# endpoint sums them. Unset, the endpoint reports the answering worker only.
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+
+# Spending alerts, checked as each expense is written and polled from
+# /api/alerts/<user>/. An expense is unusual when its log cost is
+# SPENDING_ALERT_ZSCORE standard deviations above the user's running mean for
+# the category, once SPENDING_ALERT_MIN_SAMPLES earlier expenses are known.
+# Budgets alert as a month's spend crosses each of BUDGET_ALERT_PERCENTS.
+# Turning alerts off also stops the running stats; `manage.py rebuild_rollups`
+# recomputes them.
+SPENDING_ALERTS = os.environ.get('SPENDING_ALERTS', 'True').lower() == 'true'
+SPENDING_ALERT_ZSCORE = float(os.environ.get('SPENDING_ALERT_ZSCORE', '3'))
+SPENDING_ALERT_MIN_SAMPLES = int(os.environ.get('SPENDING_ALERT_MIN_SAMPLES', '10'))
+BUDGET_ALERT_PERCENTS = tuple(int(p) for p in os.environ.get('BUDGET_ALERT_PERCENTS', '80,100').split(','))
 
 DJANGO_READ_DOT_ENV_FILE = True
 
@@ -1,10 +1,14 @@
 from django.contrib import admin
-from . models import UserDetails , ExpenseDetails
+from . models import UserDetails , ExpenseDetails , UserMonthlyRollup , UserMonthlyItemRollup , InsightJob , ExpenseTombstone
 from . models import *
 
 # Register your models here.
 
 admin.site.register(UserDetails)
 admin.site.register(ExpenseDetails)
+admin.site.register(UserMonthlyRollup)
+admin.site.register(UserMonthlyItemRollup)
+admin.site.register(InsightJob)
+admin.site.register(ExpenseTombstone)
 
 
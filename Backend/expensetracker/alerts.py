@@ -0,0 +1,361 @@
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import F
+
+from .fields import from_minor, to_minor
+from .models import (
+    SpendingAlert, SpendingStats, UserBudget, UserMonthlyItemRollup, UserMonthlyRollup, normalize_category,
+)
+from .rollups import item_label, month_of, upsert
+
+# Category key of the stats row and budget covering all of a user's spending.
+ALL = ''
+
+BUDGET_CACHE_PREFIX = 'budgets'
+# Saving a budget clears its cache entry; the timeout bounds how long a
+# worker with its own (LocMem) cache can go on using an old one.
+BUDGET_CACHE_TTL = 300
+
+
+def spend_value(cost):
+    """What the stats track for a cost: log(1 + rupees).
+
+    Spending is heavy-tailed; on a log scale "three deviations above the
+    mean" means several times the usual amount rather than any large but
+    ordinary bill.
+    """
+    return math.log1p(max(float(cost), 0.0))
+
+
+class RunningStats:
+    """Welford's running count, mean and sum of squared deviations."""
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def without(self, part):
+        """These stats with ``part``, an earlier-merged batch, taken back out."""
+        count = self.count - part.count
+        if count <= 0:
+            return None
+        mean = (self.mean * self.count - part.mean * part.count) / count
+        delta = part.mean - mean
+        m2 = self.m2 - part.m2 - delta * delta * count * part.count / self.count
+        return RunningStats(count, mean, max(m2, 0.0))
+
+    def zscore(self, value):
+        if self.count < 2:
+            return None
+        std = math.sqrt(max(self.m2, 0.0) / (self.count - 1))
+        # Identical amounts leave only rounding noise; nothing stands out.
+        if std < 1e-6:
+            return None
+        return (value - self.mean) / std
+
+
+def _merge_into(rows, count, mean, m2):
+    # Chan et al.'s pairwise update folds a batch's (count, mean, M2) into
+    # each row; a count of -1 takes one value back out. Every right-hand
+    # side must read the old row and MySQL applies SET left to right, so M2
+    # is assigned before Mean and Mean before ExpenseCount.
+    total = F('ExpenseCount') + count
+    delta = mean - F('Mean')
+    rows.update(
+        M2=F('M2') + m2 + delta * delta * F('ExpenseCount') * count / total,
+        Mean=F('Mean') + delta * count / total,
+        ExpenseCount=total,
+    )
+
+
+def _save_stats(batches):
+    """Fold ``{(user_id, category): RunningStats}`` of new values into the table.
+
+    Returns the merged rows as ``(user_id, category, count, mean, m2)`` when
+    the backend can hand them back from the upsert, otherwise None.
+    """
+    if not connection.features.supports_update_conflicts_with_target:
+        for (user_id, category), stats in batches.items():
+            SpendingStats.objects.get_or_create(User_id=user_id, Category=category)
+            _merge_into(
+                SpendingStats.objects.filter(User_id=user_id, Category=category), stats.count, stats.mean, stats.m2
+            )
+        return None
+
+    # The same merge as _merge_into, in one upsert for every touched row.
+    total = '({table}."ExpenseCount" + excluded."ExpenseCount")'
+    delta = '(excluded."Mean" - {table}."Mean")'
+    columns = ['User_id', 'Category', 'ExpenseCount', 'Mean', 'M2']
+    returning = connection.features.can_return_columns_from_insert
+    merged = upsert(
+        SpendingStats,
+        ['User_id', 'Category'],
+        columns,
+        [(user_id, category, s.count, s.mean, s.m2) for (user_id, category), s in batches.items()],
+        {
+            'M2': f'{{table}}."M2" + excluded."M2" + {delta} * {delta} * {{table}}."ExpenseCount" * excluded."ExpenseCount" / {total}',
+            'Mean': f'{{table}}."Mean" + {delta} * excluded."ExpenseCount" / {total}',
+            'ExpenseCount': total,
+        },
+        returning=columns if returning else (),
+    )
+    return merged if returning else None
+
+
+def check_new_expenses(expenses):
+    """Fold new expenses into the spending stats and record any alerts.
+
+    Run inside the insert's transaction, after the rollups. A check touches
+    the (user, category) stats rows, the user's (cached) budgets and, when
+    there are budgets, the month's rollup rows, never the expense history,
+    so the cost per write does not grow with it.
+    """
+    if settings.SPENDING_ALERTS:
+        _evaluate(list(expenses))
+
+
+def check_edited_expense(expense, previous):
+    """Re-file an edited expense; ``previous`` is its old (date, item, cost).
+
+    Its new cost is checked for anomalies only if the cost or category
+    changed, and budgets only see the difference the edit made.
+    """
+    if not settings.SPENDING_ALERTS:
+        return
+    old_date, old_item, old_cost = previous
+    restated = (
+        to_minor(old_cost) != to_minor(expense.ExpenseCost)
+        or normalize_category(old_item) != normalize_category(expense.ExpenseItem)
+    )
+    if restated:
+        forget_expense(expense.User_id, old_item, old_cost)
+    _evaluate([expense], previous=previous, update_stats=restated)
+
+
+def forget_expense(user_id, item, cost):
+    """Take a deleted (or re-filed) expense back out of the stats."""
+    if not settings.SPENDING_ALERTS:
+        return
+    rows = SpendingStats.objects.filter(User_id=user_id, Category__in=[normalize_category(item), ALL])
+    rows.filter(ExpenseCount__lte=1).delete()
+    _merge_into(rows, -1, spend_value(cost), 0.0)
+
+
+def _evaluate(expenses, previous=None, update_stats=True):
+    alerts = []
+    if update_stats:
+        alerts += _anomaly_alerts(expenses)
+    alerts += _budget_alerts(expenses, previous)
+    if alerts:
+        SpendingAlert.objects.bulk_create(alerts)
+
+
+def _anomaly_alerts(expenses):
+    users = {expense.User_id for expense in expenses}
+    values = []
+    added = defaultdict(RunningStats)
+    for expense in expenses:
+        category = normalize_category(expense.ExpenseItem)
+        value = spend_value(expense.ExpenseCost)
+        keys = ((expense.User_id, category), (expense.User_id, ALL))
+        values.append((expense, category, value, keys))
+        for key in keys:
+            added[key].add(value)
+
+    # The stats as they stood before this write are the merged rows with the
+    # write backed out again, so checking costs no statement beyond the merge.
+    merged = _save_stats(added)
+    if merged is None:
+        # The merge has locked these rows until commit.
+        merged = SpendingStats.objects.filter(
+            User_id__in=users, Category__in={category for _, category in added}
+        ).values_list('User_id', 'Category', 'ExpenseCount', 'Mean', 'M2')
+    known = {}
+    for user_id, category, count, mean, m2 in merged:
+        key = (user_id, category)
+        before = RunningStats(count, mean, m2).without(added[key]) if key in added else None
+        if before is not None:
+            known[key] = before
+
+    # Expenses in one batch are checked in order against everything before them.
+    alerts = []
+    for expense, category, value, keys in values:
+        alert = _anomaly_alert(expense, category, value, *(known.get(key) for key in keys))
+        if alert is not None:
+            alerts.append(alert)
+        for key in keys:
+            known.setdefault(key, RunningStats()).add(value)
+    return alerts
+
+
+def _anomaly_alert(expense, category, value, in_category, overall):
+    # A category without enough history of its own is compared with all of
+    # the user's spending, so a first-ever big purchase still stands out.
+    minimum = settings.SPENDING_ALERT_MIN_SAMPLES
+    for stats in (in_category, overall):
+        if stats is not None and stats.count >= minimum:
+            break
+    else:
+        return None
+    zscore = stats.zscore(value)
+    if zscore is None or zscore < settings.SPENDING_ALERT_ZSCORE:
+        return None
+
+    cost = float(expense.ExpenseCost)
+    usual = math.expm1(stats.mean)
+    label = item_label(expense.ExpenseItem)
+    compared = f'your usual ₹{usual:,.0f} for {label}' if stats is in_category else f'your usual ₹{usual:,.0f} per expense'
+    return SpendingAlert(
+        User_id=expense.User_id,
+        Kind=SpendingAlert.ANOMALY,
+        Category=category,
+        ExpenseId=expense.pk,
+        Month=month_of(expense.ExpenseDate),
+        Amount=cost,
+        Baseline=round(usual, 2),
+        Message=f'₹{cost:,.0f} on {label} is far above {compared}'[:255],
+    )
+
+
+def _budget_alerts(expenses, previous=None):
+    budgets = user_budgets({expense.User_id for expense in expenses})
+    if not budgets:
+        return []
+
+    # (expense, (user, month, budget category), paise it added to that month).
+    steps = []
+    for expense in expenses:
+        month = month_of(expense.ExpenseDate)
+        if month is None:
+            continue
+        category = normalize_category(expense.ExpenseItem)
+        for scope in (ALL, category):
+            if (expense.User_id, scope) not in budgets:
+                continue
+            added = to_minor(expense.ExpenseCost)
+            if previous is not None and month_of(previous[0]) == month and scope in (ALL, normalize_category(previous[1])):
+                added -= to_minor(previous[2])
+            steps.append((expense, (expense.User_id, month, scope), added))
+    if not steps:
+        return []
+
+    # The rollups already include this write: step back to where each month
+    # stood before it, then forward one expense at a time.
+    spent = _month_totals({key for _, key, _ in steps})
+    for _, key, added in steps:
+        spent[key] -= added
+    alerts = []
+    for expense, key, added in steps:
+        before = spent[key]
+        spent[key] += added
+        user_id, month, scope = key
+        limit = budgets[(user_id, scope)]
+        crossed = [percent for percent in settings.BUDGET_ALERT_PERCENTS if before < limit * percent / 100 <= spent[key]]
+        if crossed:
+            alerts.append(_budget_alert(expense, key, max(crossed), spent[key], limit))
+    return alerts
+
+
+def user_budgets(user_ids):
+    """``{(user_id, category): limit in paise}`` for these users, through the cache."""
+    keys = {f'{BUDGET_CACHE_PREFIX}:{user_id}': user_id for user_id in user_ids}
+    cached = cache.get_many(keys)
+    missing = [user_id for key, user_id in keys.items() if key not in cached]
+    if missing:
+        loaded = {user_id: {} for user_id in missing}
+        for user_id, category, limit in UserBudget.objects.filter(User_id__in=missing).values_list(
+            'User_id', 'Category', 'MonthlyLimit'
+        ):
+            loaded[user_id][category] = to_minor(limit)
+        cache.set_many({f'{BUDGET_CACHE_PREFIX}:{user_id}': limits for user_id, limits in loaded.items()},
+                       timeout=BUDGET_CACHE_TTL)
+        cached.update((f'{BUDGET_CACHE_PREFIX}:{user_id}', limits) for user_id, limits in loaded.items())
+    return {
+        (keys[key], category): limit
+        for key, limits in cached.items() for category, limit in limits.items()
+    }
+
+
+def invalidate_user_budgets(user_id):
+    cache.delete(f'{BUDGET_CACHE_PREFIX}:{user_id}')
+
+
+def _budget_alert(expense, key, percent, spent, limit):
+    user_id, month, scope = key
+    budget = f'{scope} budget' if scope else 'monthly budget'
+    reached = 'over' if percent >= 100 else f'at {percent}% of'
+    return SpendingAlert(
+        User_id=user_id,
+        Kind=SpendingAlert.BUDGET,
+        Category=scope,
+        ExpenseId=expense.pk,
+        Month=month,
+        Amount=from_minor(spent),
+        Baseline=from_minor(limit),
+        Message=f'{month:%B %Y}: ₹{from_minor(spent):,.0f} spent, {reached} your ₹{from_minor(limit):,.0f} {budget}'[:255],
+    )
+
+
+def _month_totals(keys):
+    """Spend in paise for each ``(user_id, month, category)``, '' meaning all of it.
+
+    One hand-written statement over both rollup tables: on the single-row
+    write path, compiling two ORM queries costs several times running them.
+    """
+    quote = connection.ops.quote_name
+    users = sorted({user_id for user_id, _, _ in keys})
+    months = {month.isoformat(): month for _, month, _ in keys}
+    categories = sorted({category for _, _, category in keys if category != ALL})
+
+    def where(column, values):
+        return f'{quote(column)} IN ({", ".join(["%s"] * len(values))})'
+
+    month_params = [connection.ops.adapt_datefield_value(month) for month in months.values()]
+    parts, params = [], []
+    if any(category == ALL for _, _, category in keys):
+        parts.append(
+            f'SELECT {quote("User_id")}, {quote("Month")}, %s, {quote("TotalCost")} '
+            f'FROM {quote(UserMonthlyRollup._meta.db_table)} '
+            f'WHERE {where("User_id", users)} AND {where("Month", month_params)}'
+        )
+        params += [ALL, *users, *month_params]
+    if categories:
+        parts.append(
+            f'SELECT {quote("User_id")}, {quote("Month")}, {quote("Category")}, {quote("TotalCost")} '
+            f'FROM {quote(UserMonthlyItemRollup._meta.db_table)} '
+            f'WHERE {where("User_id", users)} AND {where("Month", month_params)} AND {where("Category", categories)}'
+        )
+        params += [*users, *month_params, *categories]
+
+    totals = dict.fromkeys(keys, 0)
+    with connection.cursor() as cursor:
+        cursor.execute(' UNION ALL '.join(parts), params)
+        for user_id, month, category, total in cursor.fetchall():
+            # SQLite hands dates back as text; str() of a date is the same text.
+            key = (user_id, months.get(str(month)), category)
+            if key in totals:
+                totals[key] = total
+    return totals
+
+
+def stats_for_expenses(rows):
+    """``{(user_id, category): RunningStats}`` from ``(user_id, category, cost)`` rows."""
+    stats = defaultdict(RunningStats)
+    for user_id, category, cost in rows:
+        value = spend_value(cost)
+        stats[(user_id, category)].add(value)
+        stats[(user_id, ALL)].add(value)
+    return stats
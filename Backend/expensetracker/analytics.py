@@ -0,0 +1,195 @@
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+
+from .models import ExpenseDetails
+from .rollups import item_label
+
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+SECONDS_PER_DAY = 86400
+
+
+class ExpenseColumns:
+    """A user's history as parallel arrays: one entry per expense.
+
+    ``timestamps`` are UTC epoch seconds, ``item_codes`` index into
+    ``item_names`` so grouping is an integer bincount rather than string work.
+    Codes follow the normalised ``Category``; names keep the first spelling seen.
+    """
+
+    def __init__(self, timestamps, costs, item_codes, item_names):
+        self.timestamps = timestamps
+        self.costs = costs
+        self.item_codes = item_codes
+        self.item_names = item_names
+
+    def __len__(self):
+        return len(self.costs)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build columns from ``(ExpenseDate, Category, ExpenseItem, ExpenseCost)`` rows in one pass."""
+        timestamps, costs, codes = [], [], []
+        names, lookup = [], {}
+        for expense_date, category, item, cost in rows:
+            code = lookup.get(category)
+            if code is None:
+                code = lookup[category] = len(names)
+                names.append(item_label(item))
+            timestamps.append(expense_date.timestamp() if expense_date else 0)
+            costs.append(cost or 0)
+            codes.append(code)
+        return cls(
+            np.array(timestamps, dtype=np.int64),
+            np.array(costs, dtype=np.float64),
+            np.array(codes, dtype=np.int32),
+            names,
+        )
+
+    @classmethod
+    def for_user(cls, user_id, chunk_size=5000):
+        rows = (
+            ExpenseDetails.objects.filter(User_id=user_id, ExpenseDate__isnull=False)
+            .values_list('ExpenseDate', 'Category', 'ExpenseItem', 'ExpenseCost')
+            .iterator(chunk_size=chunk_size)
+        )
+        return cls.from_rows(rows)
+
+
+class SpendingAnalytics:
+    def __init__(self, columns):
+        self.columns = columns
+        self.count = len(columns)
+        self.total = float(columns.costs.sum()) if self.count else 0.0
+        self.mean = self.total / self.count if self.count else 0.0
+        self.std = float(columns.costs.std()) if self.count else 0.0
+        self._days = columns.timestamps // SECONDS_PER_DAY
+        self._months = columns.timestamps.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+
+    def item_stats(self, limit=None, by='total'):
+        """Return ``[(name, total, count)]`` sorted by total spend or frequency."""
+        if not self.count:
+            return []
+        size = len(self.columns.item_names)
+        totals = np.bincount(self.columns.item_codes, weights=self.columns.costs, minlength=size)
+        counts = np.bincount(self.columns.item_codes, minlength=size)
+        keys = totals if by == 'total' else counts
+        order = np.argsort(-keys, kind='stable')
+        if limit is not None:
+            order = order[:limit]
+        return [(self.columns.item_names[i], float(totals[i]), int(counts[i])) for i in order]
+
+    def _grouped(self, buckets):
+        # Buckets are small dense integers (month or week numbers), so an
+        # offset bincount groups them in O(n) without sorting.
+        low = int(buckets.min())
+        offsets = buckets - low
+        totals = np.bincount(offsets, weights=self.columns.costs)
+        counts = np.bincount(offsets)
+        present = np.flatnonzero(counts)
+        return present + low, totals[present], counts[present]
+
+    def monthly_totals(self, limit=None):
+        """Return ``[('YYYY-MM', total, count)]`` oldest first."""
+        if not self.count:
+            return []
+        labels, totals, counts = self._grouped(self._months)
+        rows = [
+            (str(np.datetime64(int(month), 'M')), float(total), int(count))
+            for month, total, count in zip(labels, totals, counts)
+        ]
+        return rows[-limit:] if limit else rows
+
+    def category_changes(self, limit=5):
+        """Return ``[(name, previous month total, latest month total)]`` for the
+        items whose spend moved most between the two latest months with data."""
+        if not self.count:
+            return []
+        latest = int(self._months.max())
+        recent = self._months >= latest - 1
+        size = len(self.columns.item_names)
+        # One bincount over (item, month) slots gives both months per item.
+        slots = self.columns.item_codes[recent].astype(np.int64) * 2 + (self._months[recent] - (latest - 1))
+        totals = np.bincount(slots, weights=self.columns.costs[recent], minlength=size * 2).reshape(size, 2)
+        change = totals[:, 1] - totals[:, 0]
+        order = np.argsort(-np.abs(change), kind='stable')[:limit]
+        return [(self.columns.item_names[i], float(totals[i, 0]), float(totals[i, 1])) for i in order if change[i]]
+
+    def recurring_items(self, window=6, min_months=3, limit=5):
+        """Return ``[(name, months seen, average cost)]`` for items bought in at
+        least ``min_months`` of the last ``window`` months, most regular first."""
+        if not self.count:
+            return []
+        first = int(self._months.max()) - window + 1
+        recent = self._months >= first
+        codes = self.columns.item_codes[recent].astype(np.int64)
+        size = len(self.columns.item_names)
+        months_seen = np.bincount(np.unique(codes * window + (self._months[recent] - first)) // window, minlength=size)
+        totals = np.bincount(codes, weights=self.columns.costs[recent], minlength=size)
+        counts = np.bincount(codes, minlength=size)
+        flagged = np.flatnonzero(months_seen >= min_months)
+        flagged = flagged[np.lexsort((-totals[flagged], -months_seen[flagged]))][:limit]
+        return [
+            (self.columns.item_names[i], int(months_seen[i]), float(totals[i] / counts[i]))
+            for i in flagged
+        ]
+
+    def weekly_totals(self, limit=None):
+        """Return ``[('YYYY-MM-DD' of the week's Monday, total, count)]`` oldest first."""
+        if not self.count:
+            return []
+        # 1970-01-01 was a Thursday, so shifting by 3 days aligns weeks to Monday.
+        weeks = (self._days + 3) // 7
+        labels, totals, counts = self._grouped(weeks)
+        rows = [
+            (str(np.datetime64(int(week) * 7 - 3, 'D')), float(total), int(count))
+            for week, total, count in zip(labels, totals, counts)
+        ]
+        return rows[-limit:] if limit else rows
+
+    def day_of_week_totals(self):
+        """Return ``[(weekday name, total, count)]`` Monday first."""
+        if not self.count:
+            return []
+        weekdays = (self._days + 3) % 7
+        totals = np.bincount(weekdays, weights=self.columns.costs, minlength=7)
+        counts = np.bincount(weekdays, minlength=7)
+        return [(WEEKDAYS[i], float(totals[i]), int(counts[i])) for i in range(7)]
+
+    def percentiles(self, points=(25, 50, 75, 90, 95)):
+        if not self.count:
+            return {}
+        values = np.percentile(self.columns.costs, points)
+        return {f'p{point}': float(value) for point, value in zip(points, values)}
+
+    def outliers(self, threshold=2.5, limit=5):
+        """Return the largest spends whose z-score exceeds ``threshold``."""
+        if self.count < 3 or not self.std:
+            return []
+        scores = (self.columns.costs - self.mean) / self.std
+        flagged = np.flatnonzero(scores > threshold)
+        flagged = flagged[np.argsort(-scores[flagged], kind='stable')][:limit]
+        return [
+            {
+                'item': self.columns.item_names[self.columns.item_codes[i]],
+                'cost': float(self.columns.costs[i]),
+                'date': datetime.fromtimestamp(int(self.columns.timestamps[i]), dt_timezone.utc).date().isoformat(),
+                'z_score': round(float(scores[i]), 2),
+            }
+            for i in flagged
+        ]
+
+    def small_spend_count(self, ratio=0.5):
+        if not self.count:
+            return 0
+        return int(np.count_nonzero(self.columns.costs < self.mean * ratio))
+
+    def recent(self, limit=30):
+        """Return ``[(item, cost)]`` for the most recent expenses, newest first."""
+        limit = min(limit, self.count)
+        if not limit:
+            return []
+        # Partial selection of the newest rows instead of sorting the full history.
+        newest = np.argpartition(-self.columns.timestamps, limit - 1)[:limit]
+        order = newest[np.argsort(-self.columns.timestamps[newest], kind='stable')]
+        return [(self.columns.item_names[self.columns.item_codes[i]], float(self.columns.costs[i])) for i in order]
@@ -1,6 +1,43 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_migrate
 
 
 class ExpensetrackerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'expensetracker'
+
+    def ready(self):
+        from .routers import check_replica_sticky_cache
+
+        checks.register(check_replica_sticky_cache, checks.Tags.caches)
+        connection_created.connect(_configure_sqlite)
+        connection_created.connect(_count_queries)
+        post_migrate.connect(_restore_search_triggers, sender=self)
+
+
+def _configure_sqlite(connection, **kwargs):
+    from django.conf import settings
+
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        if settings.SQLITE_JOURNAL_MODE:
+            cursor.execute(f'PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}')
+        if settings.SQLITE_SYNCHRONOUS:
+            cursor.execute(f'PRAGMA synchronous = {settings.SQLITE_SYNCHRONOUS}')
+
+
+def _count_queries(connection, **kwargs):
+    from .metrics import install_query_counter
+
+    install_query_counter(connection)
+
+
+def _restore_search_triggers(using, **kwargs):
+    from django.db import connections
+
+    from .search import install_sqlite_triggers
+
+    install_sqlite_triggers(connections[using])
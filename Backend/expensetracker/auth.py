@@ -0,0 +1,124 @@
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core import signing
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import JsonResponse
+
+from .models import UserDetails
+
+TOKEN_SALT = 'expensetracker.auth'
+
+logger = logging.getLogger(__name__)
+
+UserRecord = namedtuple('UserRecord', ['id', 'Fullname', 'Email'])
+
+
+def issue_token(user_id):
+    """Return a signed, timestamped token naming ``user_id``."""
+    return signing.dumps({'uid': user_id}, salt=TOKEN_SALT)
+
+
+def read_token(token):
+    """Return the user id in ``token``; raises ``signing.BadSignature`` if it is forged or expired."""
+    payload = signing.loads(token, salt=TOKEN_SALT, max_age=settings.AUTH_TOKEN_MAX_AGE)
+    user_id = payload.get('uid') if isinstance(payload, dict) else None
+    if not isinstance(user_id, int):
+        raise signing.BadSignature('Token has no user id')
+    return user_id
+
+
+def require_token(request):
+    """Return a 401 response for a request without a token, else None.
+
+    With AUTH_TOKEN_REQUIRED off, tokenless requests from legacy clients are
+    let through with a deprecation warning.
+    """
+    if getattr(request, 'auth_user_id', None) is not None:
+        return None
+    if settings.AUTH_TOKEN_REQUIRED:
+        return JsonResponse({'message': 'Authentication required'}, status=401)
+    logger.warning(
+        'Deprecated: served %s %s without an auth token; these requests are refused '
+        'once AUTH_TOKEN_REQUIRED is back on.', request.method, request.path,
+    )
+    return None
+
+
+def authorize(request, user_id):
+    """Return an error response unless the caller may act for ``user_id``, else None.
+
+    Requests carrying a token may only touch their own user's data; see
+    ``require_token`` for requests without one.
+    """
+    token_user = getattr(request, 'auth_user_id', None)
+    if token_user is None:
+        return require_token(request)
+    if str(token_user) != str(user_id):
+        return JsonResponse({'message': 'Not allowed for this user'}, status=403)
+    return None
+
+
+class UserRecordCache:
+    """Small per-process LRU of the user fields the API reads on hot paths."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, user_ids):
+        found, missing = {}, []
+        with self._lock:
+            for user_id in user_ids:
+                record = self._records.get(user_id)
+                if record is None:
+                    missing.append(user_id)
+                else:
+                    self._records.move_to_end(user_id)
+                    found[user_id] = record
+        if missing:
+            # Unknown ids are not cached, so a user created later is seen at once.
+            for row in UserDetails.objects.filter(id__in=missing).values_list('id', 'Fullname', 'Email'):
+                record = found[row[0]] = UserRecord(*row)
+                self.put(record)
+        return found
+
+    def get(self, user_id):
+        return self.get_many([user_id]).get(user_id)
+
+    def put(self, record):
+        with self._lock:
+            self._records[record.id] = record
+            self._records.move_to_end(record.id)
+            while len(self._records) > self.maxsize:
+                self._records.popitem(last=False)
+
+    def forget(self, user_id):
+        with self._lock:
+            self._records.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+user_records = UserRecordCache(settings.AUTH_USER_CACHE_SIZE)
+
+
+def get_user_record(user_id):
+    try:
+        return user_records.get(int(user_id))
+    except (TypeError, ValueError):
+        return None
+
+
+@receiver(post_save, sender=UserDetails)
+@receiver(post_delete, sender=UserDetails)
+def _forget_user(sender, instance, **kwargs):
+    # Covers edits made in this process (e.g. the admin); other workers rely
+    # on the FK constraint to reject writes for a user deleted elsewhere.
+    user_records.forget(instance.id)
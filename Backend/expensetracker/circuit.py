@@ -0,0 +1,89 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+BREAKER_CACHE_PREFIX = 'ai-breaker'
+
+
+class CircuitBreaker:
+    """Per-provider breaker whose state lives in the cache so every worker sees it.
+
+    closed    -> calls go through; consecutive failures are counted.
+    open      -> calls are skipped until ``open_until``.
+    half-open -> after ``open_until`` one worker wins a probe slot; success
+                 closes the breaker, failure reopens it with a longer backoff.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.failures_key = f'{BREAKER_CACHE_PREFIX}:{name}:failures'
+        self.open_key = f'{BREAKER_CACHE_PREFIX}:{name}:open_until'
+        self.trips_key = f'{BREAKER_CACHE_PREFIX}:{name}:trips'
+        self.probe_key = f'{BREAKER_CACHE_PREFIX}:{name}:probe'
+
+    def _open_until(self):
+        return cache.get(self.open_key)
+
+    def state(self):
+        open_until = self._open_until()
+        if open_until is None:
+            return 'closed'
+        return 'open' if time.time() < open_until else 'half_open'
+
+    def is_open(self):
+        return self.state() == 'open'
+
+    def retry_in(self):
+        open_until = self._open_until()
+        return max(0, open_until - time.time()) if open_until else 0
+
+    def allow(self):
+        state = self.state()
+        if state == 'closed':
+            return True
+        if state == 'open':
+            return False
+        # Only one in-flight probe across all workers while half-open.
+        probe_ttl = settings.AI_HTTP_CONNECT_TIMEOUT + settings.AI_HTTP_READ_TIMEOUT
+        return cache.add(self.probe_key, 1, timeout=probe_ttl)
+
+    def record_success(self):
+        cache.delete_many([self.failures_key, self.open_key, self.trips_key, self.probe_key])
+
+    def record_failure(self, retry_after=None, quota=False):
+        if cache.add(self.failures_key, 1, timeout=settings.AI_BREAKER_FAILURE_WINDOW):
+            failures = 1
+        else:
+            try:
+                failures = cache.incr(self.failures_key)
+            except ValueError:
+                failures = 1
+
+        was_tripped = self._open_until() is not None
+        if not (quota or was_tripped or failures >= settings.AI_BREAKER_FAILURE_THRESHOLD):
+            return
+
+        if cache.add(self.trips_key, 1, timeout=settings.AI_BREAKER_RESET_TIMEOUT):
+            trips = 1
+        else:
+            try:
+                trips = cache.incr(self.trips_key)
+            except ValueError:
+                trips = 1
+        backoff = min(settings.AI_BREAKER_BASE_BACKOFF * 2 ** (trips - 1), settings.AI_BREAKER_MAX_BACKOFF)
+        delay = max(backoff, retry_after or 0)
+
+        # Keep the marker past open_until so the next caller sees half-open
+        # rather than closed and only one worker probes.
+        cache.set(self.open_key, time.time() + delay, timeout=delay + settings.AI_BREAKER_RESET_TIMEOUT)
+        cache.delete(self.probe_key)
+
+
+_breakers = {}
+
+
+def breaker_for(name):
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    return _breakers[name]
@@ -0,0 +1,63 @@
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import models
+
+MINOR_UNITS = 100
+# The column is a 64-bit integer.
+MAX_MINOR = 2 ** 63 - 1
+
+
+def to_minor(value):
+    """Convert an amount in rupees (float, int, str or Decimal) to whole paise.
+
+    Raises ValueError for anything that is not a finite amount the column can hold.
+    """
+    try:
+        amount = Decimal(str(value)) * MINOR_UNITS
+        minor = int(amount.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError) as exc:
+        raise ValueError(f'Invalid amount: {value!r}') from exc
+    if abs(minor) > MAX_MINOR:
+        raise ValueError(f'Amount out of range: {value!r}')
+    return minor
+
+
+def from_minor(value):
+    return None if value is None else float(value) / MINOR_UNITS
+
+
+class MoneyField(models.Field):
+    """An amount stored as integer paise and exposed in Python as float rupees.
+
+    Sums, comparisons and rollup updates in the database are exact integer
+    arithmetic, while model attributes and ``values()`` rows keep the float
+    shape the API has always returned. Expressions that are not a plain sum,
+    min or max of the column (e.g. a product) need an explicit output_field.
+    """
+
+    description = 'Amount stored in minor units'
+
+    def get_internal_type(self):
+        # Not an IntegerField subclass on purpose: its lookups would round
+        # float query values to whole rupees before they reach get_prep_value.
+        return 'BigIntegerField'
+
+    def from_db_value(self, value, expression, connection):
+        return from_minor(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, float):
+            return value
+        try:
+            return from_minor(to_minor(value))
+        except ValueError:
+            raise ValidationError(f"'{value}' is not a valid amount.", code='invalid')
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        return None if value is None else to_minor(value)
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{'form_class': forms.FloatField, **kwargs})
@@ -0,0 +1,220 @@
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+
+from . import providers
+from .analytics import ExpenseColumns, SpendingAnalytics
+from .metrics import record_provider_call
+from .prompts import build_prompt, estimate_tokens
+from .models import UserMonthlyRollup
+
+INSIGHT_CACHE_PREFIX = 'ai-insight'
+
+
+def _version_key(user_id):
+    return f'{INSIGHT_CACHE_PREFIX}:version:{user_id}'
+
+
+def data_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted counter can never restart at a
+        # value that still names an older cached insight.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_user_insights(user_id):
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout=None)
+
+
+def expense_fingerprint(user_id):
+    # Rollups make this O(months); the version counter catches edits such as
+    # renames that leave count and total unchanged.
+    totals = UserMonthlyRollup.objects.filter(User_id=user_id).aggregate(
+        count=Sum('ExpenseCount'), total=Sum('TotalCost')
+    )
+    return f"{data_version(user_id)}:{totals['count'] or 0}:{totals['total'] or 0:.2f}"
+
+
+def insight_cache_key(user_id, provider, fingerprint):
+    digest = hashlib.sha1(fingerprint.encode()).hexdigest()[:16]
+    return f'{INSIGHT_CACHE_PREFIX}:{user_id}:{provider}:{digest}'
+
+
+def get_cached_insight(key):
+    return cache.get(key)
+
+
+async def aget_cached_insight(key):
+    return await cache.aget(key)
+
+
+def cache_insight(key, payload):
+    cache.set(key, payload, timeout=settings.AI_INSIGHT_CACHE_TTL)
+
+
+def load_analytics(user_id):
+    return SpendingAnalytics(ExpenseColumns.for_user(user_id))
+
+
+def _month_change(analytics):
+    months = analytics.monthly_totals(limit=2)
+    if len(months) < 2 or not months[0][1]:
+        return None
+    (_, previous, _), (label, latest, _) = months
+    return label, (latest - previous) / previous * 100
+
+
+def generate_fallback_insights(analytics):
+    avg_expense = analytics.mean
+    top_items = analytics.item_stats(limit=3)
+    frequent_items = analytics.item_stats(limit=2, by='count')
+
+    lines = []
+    if top_items:
+        parts = [f"{name}: ₹{amt:,.0f}" for name, amt, _ in top_items]
+        lines.append(f"Top spend categories -> {', '.join(parts)}.")
+    if frequent_items:
+        freq = [f"{name} x{cnt}" for name, _, cnt in frequent_items]
+        lines.append(f"Most frequent items -> {', '.join(freq)}.")
+    change = _month_change(analytics)
+    if change and abs(change[1]) >= 10:
+        direction = 'up' if change[1] > 0 else 'down'
+        lines.append(f"Spending in {change[0]} is {direction} {abs(change[1]):.0f}% on the previous month.")
+    weekdays = [row for row in analytics.day_of_week_totals() if row[2]]
+    if len(weekdays) >= 3:
+        busiest = max(weekdays, key=lambda row: row[1])
+        lines.append(f"{busiest[0]} is your heaviest spending day; plan purchases ahead of it.")
+    outliers = analytics.outliers(limit=2)
+    if outliers:
+        spikes = [f"{o['item']} ₹{o['cost']:,.0f} on {o['date']}" for o in outliers]
+        lines.append(f"Unusually large spends -> {', '.join(spikes)}.")
+    if analytics.small_spend_count() >= 3:
+        lines.append("Many small purchases detected; try batching or weekly caps.")
+    if avg_expense:
+        lines.append(f"Average per expense: ₹{avg_expense:,.0f}. Set a per-purchase limit to stay on budget.")
+    lines.append("Pick one top category and aim to trim 10-15% this month.")
+
+    return "\n".join(f"- {line}" for line in lines) if lines else "- Keep tracking; not enough data for insights yet."
+
+
+def _route_provider(provider):
+    """Return (provider, note). While a provider's breaker is open, route to
+    the other one if it is healthy, otherwise answer locally instead of
+    waiting on a doomed call."""
+    if provider in providers.PROVIDERS and providers.is_tripped(provider):
+        healthy = [name for name in providers.PROVIDERS if name != provider and providers.is_available(name)]
+        if healthy:
+            return healthy[0], None
+        return 'fallback', f"{providers.PROVIDER_LABELS[provider]} temporarily unavailable; showing local insights."
+    return provider, None
+
+
+class _InsightAnswer:
+    """Builds the (payload, status) responses for one insight request."""
+
+    def __init__(self, analytics, cache_key, provider):
+        self.analytics = analytics
+        self.cache_key = cache_key
+        self.provider = provider
+        self.stats = {
+            'total_expenses': analytics.total,
+            'average_expense': analytics.mean,
+            'expense_count': analytics.count,
+        }
+
+    def prompt(self):
+        prompt = build_prompt(self.analytics)
+        self.stats['prompt_tokens_estimate'] = estimate_tokens(prompt)
+        return prompt
+
+    def fallback(self, note, **extra):
+        record_provider_call(self.provider, 'fallback')
+        return {
+            'insight': generate_fallback_insights(self.analytics),
+            'provider': 'fallback',
+            'note': note,
+            **extra,
+            **self.stats,
+            'cached': False,
+        }, 200
+
+    def answered(self, insight, name, **extra):
+        payload = {'insight': insight, 'provider': name, **extra, **self.stats}
+        cache_insight(self.cache_key, payload)
+        return {**payload, 'cached': False}, 200
+
+    def hedged(self, winner, insight, err, latencies):
+        latencies_ms = {name: round(elapsed * 1000) if elapsed is not None else None for name, elapsed in latencies.items()}
+        if winner:
+            return self.answered(insight, winner, latencies_ms=latencies_ms)
+        return self.fallback(err, latencies_ms=latencies_ms)
+
+    def single(self, provider, insight, err):
+        if insight == 'quota':
+            return self.fallback(f"{providers.PROVIDER_LABELS[provider]} quota exceeded; showing local insights.")
+        if insight:
+            return self.answered(insight, provider)
+        # If provider missing or errors, return fallback insights
+        return self.fallback(err or 'Using local fallback insights.')
+
+
+def _no_expenses():
+    return {'message': 'No expenses found for user', 'provider': 'none'}, 404
+
+
+def generate_insight(user_id, provider, cache_key, deadline=None):
+    """Run the provider (or local fallback) for a user; returns (payload, status)."""
+    analytics = load_analytics(user_id)
+    if not analytics.count:
+        return _no_expenses()
+
+    answer = _InsightAnswer(analytics, cache_key, provider)
+    provider, err = _route_provider(provider)
+    prompt = answer.prompt()
+
+    if provider == 'hedged':
+        return answer.hedged(*providers.call_hedged(prompt, deadline or settings.AI_HEDGE_DEADLINE))
+    if provider in providers.PROVIDERS:
+        return answer.single(provider, *providers.call_provider(provider, prompt))
+    return answer.fallback(err or 'Using local fallback insights.')
+
+
+def local_insight(user_id, provider, note):
+    """Answer from the local fallback without calling ``provider``."""
+    analytics = load_analytics(user_id)
+    if not analytics.count:
+        return _no_expenses()
+    return _InsightAnswer(analytics, None, provider).fallback(note)
+
+
+async def agenerate_insight(user_id, provider, cache_key, deadline=None):
+    """generate_insight for async views: the provider call is awaited on the
+    event loop; database and cache work (data load, breaker reads, caching
+    the answer) runs on a thread."""
+    analytics = await sync_to_async(load_analytics)(user_id)
+    if not analytics.count:
+        return _no_expenses()
+
+    answer = _InsightAnswer(analytics, cache_key, provider)
+    provider, err = await sync_to_async(_route_provider)(provider)
+    prompt = answer.prompt()
+
+    if provider == 'hedged':
+        result = await providers.acall_hedged(prompt, deadline or settings.AI_HEDGE_DEADLINE)
+        return await sync_to_async(answer.hedged)(*result)
+    if provider in providers.PROVIDERS:
+        result = await providers.acall_provider(provider, prompt)
+        return await sync_to_async(answer.single)(provider, *result)
+    return answer.fallback(err or 'Using local fallback insights.')
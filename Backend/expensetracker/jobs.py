@@ -0,0 +1,206 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .insights import generate_insight
+from .models import InsightJob
+
+_lock = threading.Lock()
+_pool = None
+_owner_pid = None
+
+
+def get_job_pool():
+    global _pool, _owner_pid
+    with _lock:
+        if _pool is None or _owner_pid != os.getpid():
+            _pool = ThreadPoolExecutor(
+                max_workers=settings.AI_INSIGHT_JOB_WORKERS,
+                thread_name_prefix='ai-insight-job',
+            )
+            _owner_pid = os.getpid()
+        return _pool
+
+
+def job_payload(job):
+    payload = {
+        'job_id': job.id,
+        'status': job.Status,
+        'provider': job.Provider,
+        'created_at': job.CreatedAt.isoformat() if job.CreatedAt else None,
+    }
+    if job.Status in (InsightJob.DONE, InsightJob.FAILED):
+        payload['status_code'] = job.StatusCode
+        payload['result'] = job.Result
+    return payload
+
+
+def enqueue_insight_job(user_id, provider, cache_key, deadline=None):
+    """Return (job, created); an in-flight job for the same fingerprint is reused."""
+    in_flight = InsightJob.objects.filter(User_id=user_id, CacheKey=cache_key, Status__in=InsightJob.IN_FLIGHT)
+    job = in_flight.first()
+    if job is not None and not _expire_if_stale(job):
+        return job, False
+
+    try:
+        with transaction.atomic():
+            job = InsightJob.objects.create(User_id=user_id, Provider=provider, CacheKey=cache_key, Deadline=deadline)
+    except IntegrityError:
+        # Lost the race to a concurrent request for the same data.
+        job = in_flight.first()
+        if job is None:
+            raise
+        return job, False
+
+    if settings.AI_INSIGHT_JOB_MODE == 'thread':
+        job_id = job.id
+        transaction.on_commit(lambda: get_job_pool().submit(_run_in_pool, job_id))
+    return job, True
+
+
+def _expire_if_stale(job):
+    """Release an in-flight job nobody has touched for AI_INSIGHT_JOB_STALE_AFTER.
+
+    In thread mode such a job belonged to a pool that died with its worker
+    and will never finish; it is failed so a new one can take its place.
+    In queue mode a stale running job goes back on the queue, as
+    ``run_insight_jobs`` would do. Returns True if the caller should start
+    a new job instead of joining this one.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.AI_INSIGHT_JOB_STALE_AFTER)
+    if job.UpdatedAt >= cutoff:
+        return False
+    stale = InsightJob.objects.filter(id=job.id, Status=job.Status, UpdatedAt__lt=cutoff)
+    if settings.AI_INSIGHT_JOB_MODE == 'thread':
+        stale.update(
+            Status=InsightJob.FAILED, StatusCode=504,
+            Result={'message': 'Insight job was abandoned'}, UpdatedAt=timezone.now(),
+        )
+        return True
+    if job.Status == InsightJob.RUNNING and stale.update(Status=InsightJob.QUEUED, UpdatedAt=timezone.now()):
+        job.Status = InsightJob.QUEUED
+    return False
+
+
+def run_insight_job(job_id):
+    # The conditional update is the claim: only one runner moves it to running.
+    claimed = InsightJob.objects.filter(id=job_id, Status=InsightJob.QUEUED).update(
+        Status=InsightJob.RUNNING, UpdatedAt=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    job = InsightJob.objects.get(id=job_id)
+    try:
+        job.Result, job.StatusCode = generate_insight(job.User_id, job.Provider, job.CacheKey, job.Deadline)
+        job.Status = InsightJob.DONE
+    except Exception as exc:
+        job.Result = {'message': 'Insight generation failed', 'error': str(exc)}
+        job.StatusCode = 500
+        job.Status = InsightJob.FAILED
+    job.save(update_fields=['Result', 'StatusCode', 'Status', 'UpdatedAt'])
+    return True
+
+
+def _run_in_pool(job_id):
+    try:
+        run_insight_job(job_id)
+    finally:
+        # Pool threads each hold their own DB connection; do not leak it.
+        connection.close()
+
+
+def requeue_stale_jobs(stale_after):
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    return InsightJob.objects.filter(Status=InsightJob.RUNNING, UpdatedAt__lt=cutoff).update(
+        Status=InsightJob.QUEUED, UpdatedAt=timezone.now()
+    )
+
+
+def drain_insight_jobs(limit=None):
+    done = 0
+    while limit is None or done < limit:
+        job_id = (
+            InsightJob.objects.filter(Status=InsightJob.QUEUED)
+            .order_by('CreatedAt', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            break
+        if run_insight_job(job_id):
+            done += 1
+    return done
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class _JobEvents:
+    """Turns successive polls of a job into server-sent events."""
+
+    def __init__(self, job_id, timeout):
+        self.job_id = job_id
+        self.timeout = timeout
+        self.finished = False
+        self.last_status = None
+        self.last_write = self.started = time.monotonic()
+
+    def poll(self, job):
+        if job is None:
+            self.finished = True
+            return [_sse('error', {'message': 'Job not found'})]
+        events = []
+        if job.Status != self.last_status:
+            self.last_status = job.Status
+            self.last_write = time.monotonic()
+            events.append(_sse('status', job_payload(job)))
+        if job.Status in (InsightJob.DONE, InsightJob.FAILED):
+            self.finished = True
+            return events
+
+        now = time.monotonic()
+        if now - self.started >= self.timeout:
+            self.finished = True
+            # "retry" has EventSource reconnect after the poll interval, so a
+            # client picks the job up again on a fresh request.
+            retry = round(settings.AI_INSIGHT_JOB_POLL_INTERVAL * 1000)
+            events.append(f"retry: {retry}\n" + _sse('timeout', {'job_id': self.job_id, 'status': job.Status}))
+        elif now - self.last_write >= 15:
+            self.last_write = now
+            events.append(": keep-alive\n\n")
+        return events
+
+
+def job_event_stream(job_id):
+    """Yield server-sent events for a job until it finishes or the stream times out.
+
+    Each open stream holds a WSGI worker thread, so it gives up after
+    AI_INSIGHT_JOB_SYNC_STREAM_TIMEOUT and leaves the client to reconnect.
+    """
+    events = _JobEvents(job_id, settings.AI_INSIGHT_JOB_SYNC_STREAM_TIMEOUT)
+    while True:
+        yield from events.poll(InsightJob.objects.filter(id=job_id).first())
+        if events.finished:
+            return
+        time.sleep(settings.AI_INSIGHT_JOB_POLL_INTERVAL)
+
+
+async def ajob_event_stream(job_id):
+    """job_event_stream for ASGI: waiting between polls holds no thread."""
+    events = _JobEvents(job_id, settings.AI_INSIGHT_JOB_STREAM_TIMEOUT)
+    while True:
+        for event in events.poll(await InsightJob.objects.filter(id=job_id).afirst()):
+            yield event
+        if events.finished:
+            return
+        await asyncio.sleep(settings.AI_INSIGHT_JOB_POLL_INTERVAL)
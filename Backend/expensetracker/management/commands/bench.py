@@ -0,0 +1,370 @@
+import itertools
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+from collections import namedtuple
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from expensetracker.auth import issue_token
+from expensetracker.insights import invalidate_user_insights
+from expensetracker.management.stub_provider import start_stub_provider
+from expensetracker.models import ExpenseDetails, UserDetails
+from expensetracker.writer import insert_expenses
+
+BENCH_EMAIL_DOMAIN = "bench.invalid"
+ITEMS = [
+    "coffee", "tea", "lunch", "dinner", "taxi", "metro", "rent", "groceries", "milk", "bread",
+    "petrol", "movie", "book", "phone bill", "electricity", "internet", "gym", "medicine", "pizza",
+]
+
+# One timed request: the client method, its path, the query or JSON body,
+# and the statuses that count as success.
+Call = namedtuple("Call", "method path data ok", defaults=(None, (200,)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed bench users and expenses with bulk inserts, drive every endpoint in expensetracker/urls.py "
+        "through the Django test client from concurrent threads (AI providers answered by a local stub) "
+        "and print JSON throughput, latency percentiles, SQL queries per request and peak RSS per endpoint. "
+        "Query counts cover the request's own connection, not the job pool or write-coalescing threads. "
+        "Bench users are removed afterwards unless --keep is given; run it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--expenses-per-user", type=int, default=100)
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per bulk insert while seeding.")
+        parser.add_argument("--requests", type=int, default=200, help="Timed requests per endpoint.")
+        parser.add_argument("--concurrency", type=int, default=8, help="Client threads per endpoint.")
+        parser.add_argument("--endpoints", help="Comma-separated endpoint names to run (default: all).")
+        parser.add_argument("--provider-delay", type=float, default=0.0, help="Seconds the stub provider takes to answer.")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--output", help="Also write the JSON report to this file.")
+        parser.add_argument("--baseline", help="Earlier report to compare throughput and p95 against.")
+        parser.add_argument("--keep", action="store_true", help="Leave the bench users and rows in place.")
+
+    def handle(self, *args, **options):
+        endpoints = self._endpoints()
+        if options["endpoints"]:
+            names = [name.strip() for name in options["endpoints"].split(",") if name.strip()]
+            unknown = sorted(set(names) - set(endpoints))
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(unknown)}. Choose from: {', '.join(endpoints)}")
+            endpoints = {name: endpoints[name] for name in names}
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as handle:
+                baseline = json.load(handle)
+
+        self.rng = random.Random(options["seed"])
+        self.signups = itertools.count()
+        self.lock = threading.Lock()
+
+        started = time.perf_counter()
+        self.users = self._seed(options)
+        report = {
+            "database": connection.vendor,
+            "users": len(self.users),
+            "expenses": len(self.users) * options["expenses_per_user"],
+            "seed_seconds": round(time.perf_counter() - started, 1),
+            "seed_peak_rss_mb": _peak_rss_mb(),
+            "requests": options["requests"],
+            "concurrency": options["concurrency"],
+            "provider_delay_s": options["provider_delay"],
+            "endpoints": {},
+        }
+        self.expenses = self._sample_expenses(2 * options["requests"])
+
+        stub = start_stub_provider(options["provider_delay"])
+        saved_keys = {name: os.environ.get(name) for name in ("GEMINI_API_KEY", "OPENAI_API_KEY")}
+        os.environ.update(GEMINI_API_KEY="bench", OPENAI_API_KEY="bench")
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                GEMINI_API_BASE=stub.url,
+                OPENAI_BASE_URL=stub.url,
+                # Measure the endpoints, not the insight rate limiter.
+                AI_RATE_LIMIT_USER_PER_MINUTE=0,
+                AI_RATE_LIMIT_GLOBAL_PER_MINUTE=0,
+            ):
+                for name, scenario in endpoints.items():
+                    self.stderr.write(f"Running {name}")
+                    result = self._run(scenario, options["requests"], options["concurrency"])
+                    result["peak_rss_mb"] = _peak_rss_mb()
+                    report["endpoints"][name] = result
+        finally:
+            stub.shutdown()
+            for name, value in saved_keys.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+            if not options["keep"]:
+                UserDetails.objects.filter(Email__endswith="@" + BENCH_EMAIL_DOMAIN).delete()
+
+        if baseline:
+            _compare(report, baseline)
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as handle:
+                handle.write(output + "\n")
+        self.stdout.write(output)
+
+    # Seeding
+
+    def _seed(self, options):
+        batch_size = max(1, options["batch_size"])
+        for offset in range(0, options["users"], batch_size):
+            UserDetails.objects.bulk_create([
+                UserDetails(Fullname=f"Bench {i}", Email=f"user{i}@{BENCH_EMAIL_DOMAIN}", Password="bench")
+                for i in range(offset, min(offset + batch_size, options["users"]))
+            ])
+        users = list(
+            UserDetails.objects.filter(Email__startswith="user", Email__endswith="@" + BENCH_EMAIL_DOMAIN)
+            .order_by("id").values_list("id", "Email")
+        )
+        user_ids = [user_id for user_id, _ in users]
+
+        start = timezone.now() - timedelta(days=730)
+        rows = ((user_id, n) for user_id in user_ids for n in range(options["expenses_per_user"]))
+        seeded = 0
+        while True:
+            batch = [
+                ExpenseDetails(
+                    User_id=user_id,
+                    ExpenseDate=start + timedelta(minutes=self.rng.randrange(730 * 24 * 60)),
+                    ExpenseItem=self.rng.choice(ITEMS),
+                    ExpenseCost=round(self.rng.uniform(10, 5000), 2),
+                )
+                for user_id, _ in itertools.islice(rows, batch_size)
+            ]
+            if not batch:
+                break
+            with transaction.atomic():
+                insert_expenses(batch)
+            seeded += len(batch)
+            self.stderr.write(f"Seeded {seeded} expenses")
+        return [(user_id, email, issue_token(user_id)) for user_id, email in users]
+
+    def _sample_expenses(self, count):
+        # Distinct rows for the update and delete endpoints, spread over the users.
+        owners = self.rng.sample(self.users, min(count, len(self.users)))
+        per_user = -(-count // max(1, len(owners)))
+        expenses = []
+        for user_id, _, token in owners:
+            ids = ExpenseDetails.objects.filter(User_id=user_id).values_list("id", flat=True)[:per_user]
+            expenses.extend((expense_id, token) for expense_id in ids)
+        self.rng.shuffle(expenses)
+        return expenses
+
+    # Endpoints
+
+    def _endpoints(self):
+        return {
+            "signup": self._signup,
+            "login": self._login,
+            "add-expense": self._add_expense,
+            "bulk-add-expense": self._bulk_add_expense,
+            "manage-expense": self._manage_expense,
+            "export-expenses": self._export,
+            "expense-search": self._search,
+            "expense-summary": self._summary,
+            "expense-changes": self._changes,
+            "expense-detail-patch": self._patch_expense,
+            "expense-detail-delete": self._delete_expense,
+            "expense-ai-insights": self._insights,
+            "expense-ai-insights-cached": self._cached_insights,
+            "expense-ai-insights-job": self._insights_job,
+            "insight-job": self._job_status,
+            "insight-job-stream": self._job_stream,
+        }
+
+    def _user(self):
+        with self.lock:
+            return self.rng.choice(self.users)
+
+    def _signup(self, client, user):
+        n = next(self.signups)
+        return Call("post", reverse("signup"), {
+            "Fullname": f"Signup {n}", "Email": f"signup{n}@{BENCH_EMAIL_DOMAIN}", "Password": "bench",
+        }, ok=(201,))
+
+    def _login(self, client, user):
+        return Call("post", reverse("login"), {"Email": user[1], "Password": "bench"}, ok=(201,))
+
+    def _add_expense(self, client, user):
+        return Call("post", reverse("add-expense"), {
+            "UserId": user[0], "ExpenseItem": self.rng.choice(ITEMS), "ExpenseCost": 120,
+        }, ok=(201,))
+
+    def _bulk_add_expense(self, client, user):
+        today = timezone.localdate().isoformat()
+        return Call("post", reverse("bulk-add-expense"), [
+            {"UserId": user[0], "ExpenseItem": item, "ExpenseCost": 50, "ExpenseDate": today} for item in ITEMS
+        ], ok=(201,))
+
+    def _manage_expense(self, client, user):
+        return Call("get", reverse("manage-expense", args=[user[0]]))
+
+    def _export(self, client, user):
+        return Call("get", reverse("export-expenses", args=[user[0]]))
+
+    def _search(self, client, user):
+        return Call("get", reverse("expense-search", args=[user[0]]), {"q": self.rng.choice(ITEMS)[:4]})
+
+    def _summary(self, client, user):
+        return Call("get", reverse("expense-summary", args=[user[0]]))
+
+    def _changes(self, client, user):
+        return Call("get", reverse("expense-changes"), {"user_id": user[0], "since": 0})
+
+    def _seeded_expense(self):
+        with self.lock:
+            if not self.expenses:
+                raise CommandError("Ran out of seeded expenses; seed more expenses per user.")
+            return self.expenses.pop()
+
+    def _patch_expense(self, client, user):
+        expense_id, token = self._seeded_expense()
+        client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        return Call("patch", reverse("expense-detail", args=[expense_id]), {"ExpenseCost": 99})
+
+    def _delete_expense(self, client, user):
+        expense_id, token = self._seeded_expense()
+        client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+        return Call("delete", reverse("expense-detail", args=[expense_id]))
+
+    def _insights(self, client, user):
+        # Every timed request misses the cache and goes to the stub provider.
+        invalidate_user_insights(user[0])
+        return Call("post", reverse("expense-ai-insights", args=[user[0]]))
+
+    def _cached_insights(self, client, user):
+        path = reverse("expense-ai-insights", args=[user[0]])
+        client.post(path)
+        return Call("post", path)
+
+    def _insights_job(self, client, user):
+        invalidate_user_insights(user[0])
+        return Call("post", reverse("expense-ai-insights", args=[user[0]]) + "?async=1", ok=(202,))
+
+    def _new_job(self, client, user):
+        invalidate_user_insights(user[0])
+        response = client.post(reverse("expense-ai-insights", args=[user[0]]) + "?async=1")
+        if response.status_code != 202:
+            raise CommandError(f"Could not start an insight job: {response.content[:200]!r}")
+        return response.json()["job_id"]
+
+    def _job_status(self, client, user):
+        return Call("get", reverse("insight-job", args=[self._new_job(client, user)]))
+
+    def _job_stream(self, client, user):
+        return Call("get", reverse("insight-job-stream", args=[self._new_job(client, user)]))
+
+    # Load
+
+    def _run(self, scenario, total, concurrency):
+        timings, query_counts, failures = [], [], []
+        remaining = itertools.count()
+
+        def worker():
+            client = Client()
+            counter = QueryCounter()
+            try:
+                with ExitStack() as stack:
+                    for conn in connections.all():
+                        stack.enter_context(conn.execute_wrapper(counter))
+                    while next(remaining) < total:
+                        user = self._user()
+                        client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {user[2]}"
+                        call = scenario(client, user)
+                        counter.count = 0
+                        began = time.perf_counter()
+                        kwargs = {} if call.method == "get" else {"content_type": "application/json"}
+                        if call.data is not None:
+                            kwargs["data"] = call.data
+                        response = getattr(client, call.method)(call.path, **kwargs)
+                        if response.streaming:
+                            b"".join(response.streaming_content)
+                        elapsed = (time.perf_counter() - began) * 1000
+                        with self.lock:
+                            timings.append(elapsed)
+                            query_counts.append(counter.count)
+                            if response.status_code not in call.ok:
+                                failures.append(f"{response.status_code}: {response.content[:200]!r}"
+                                                if not response.streaming else str(response.status_code))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(max(1, concurrency))]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        timings.sort()
+        return {
+            "requests": len(timings),
+            "seconds": round(elapsed, 2),
+            "requests_per_second": round(len(timings) / elapsed, 1),
+            "failed": len(failures),
+            "first_error": failures[0] if failures else None,
+            "p50_ms": round(statistics.median(timings), 2),
+            "p95_ms": round(_percentile(timings, 0.95), 2),
+            "p99_ms": round(_percentile(timings, 0.99), 2),
+            "max_ms": round(timings[-1], 2),
+            "queries_per_request": round(statistics.mean(query_counts), 1),
+            "max_queries": max(query_counts),
+        }
+
+
+class QueryCounter:
+    """``execute_wrapper`` that counts the statements run on a connection."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _percentile(ordered, fraction):
+    return ordered[max(0, int(len(ordered) * fraction) - 1)]
+
+
+def _peak_rss_mb():
+    # ru_maxrss is the process-wide high-water mark (KiB on Linux, bytes on
+    # macOS); endpoints run one after another, so a jump points at the one
+    # that grew memory.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _compare(report, baseline):
+    for name, result in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before:
+            continue
+        result["vs_baseline"] = {
+            "requests_per_second": round(result["requests_per_second"] / before["requests_per_second"], 2)
+            if before["requests_per_second"] else None,
+            "p95_ms": round(result["p95_ms"] / before["p95_ms"], 2) if before["p95_ms"] else None,
+            "queries_per_request": round(result["queries_per_request"] - before["queries_per_request"], 1),
+        }
@@ -0,0 +1,132 @@
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from expensetracker.alerts import invalidate_user_budgets
+from expensetracker.models import ExpenseDetails, SpendingAlert, UserBudget, UserDetails
+from expensetracker.views import add_expense
+from expensetracker.writer import insert_expenses
+
+BENCH_EMAIL_DOMAIN = "bench-alerts.invalid"
+ITEMS = ["coffee", "rent", "groceries", "taxi", "pizza delivery", "pharmacy", "movie tickets", "electricity bill"]
+# (name, spending alerts on, users have budgets)
+SCENARIOS = (("alerts_off", False, False), ("alerts_on", True, False), ("alerts_on_with_budgets", True, True))
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the add-expense view with spending alerts off, on, and on with budgets, for users with short "
+        "and long histories, and print JSON latency and queries per insert. Run it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="100,5000", help="Comma-separated existing expenses per user.")
+        parser.add_argument("--users-per-size", type=int, default=10)
+        parser.add_argument("--requests", type=int, default=600, help="Inserts per size and scenario.")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        report = {"requests": options["requests"], "sizes": {}}
+        try:
+            for size in sizes:
+                users = {name: self._seed(rng, size, options["users_per_size"], name, budgets)
+                         for name, _, budgets in SCENARIOS}
+                results = self._run(rng, users, options["requests"])
+                baseline = results["alerts_off"]["mean_ms"]
+                for result in results.values():
+                    result["overhead_ms"] = round(result["mean_ms"] - baseline, 3)
+                results["alerts_raised"] = SpendingAlert.objects.filter(
+                    User__Email__endswith="@" + BENCH_EMAIL_DOMAIN
+                ).count()
+                report["sizes"][size] = results
+                UserDetails.objects.filter(Email__endswith="@" + BENCH_EMAIL_DOMAIN).delete()
+        finally:
+            UserDetails.objects.filter(Email__endswith="@" + BENCH_EMAIL_DOMAIN).delete()
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _seed(self, rng, size, count, scenario, budgets):
+        UserDetails.objects.bulk_create([
+            UserDetails(Fullname=f"Bench {scenario} {n}", Email=f"{scenario}-{size}-{n}@{BENCH_EMAIL_DOMAIN}", Password="bench")
+            for n in range(count)
+        ])
+        user_ids = list(
+            UserDetails.objects.filter(Email__startswith=f"{scenario}-{size}-", Email__endswith="@" + BENCH_EMAIL_DOMAIN)
+            .values_list("id", flat=True)
+        )
+        now = timezone.now()
+        expenses = [
+            ExpenseDetails(
+                User_id=user_id,
+                ExpenseDate=now - timedelta(minutes=rng.randrange(365 * 24 * 60)),
+                ExpenseItem=rng.choice(ITEMS),
+                ExpenseCost=round(rng.lognormvariate(5, 0.6), 2),
+            )
+            for user_id in user_ids for _ in range(size)
+        ]
+        # Seeded with alerts on so every user starts with warm running stats.
+        with override_settings(SPENDING_ALERTS=True):
+            for start in range(0, len(expenses), 5000):
+                with transaction.atomic():
+                    insert_expenses(expenses[start:start + 5000])
+        if budgets:
+            UserBudget.objects.bulk_create(
+                [UserBudget(User_id=user_id, Category="", MonthlyLimit=50000) for user_id in user_ids]
+                + [UserBudget(User_id=user_id, Category=item, MonthlyLimit=5000) for user_id in user_ids for item in ITEMS]
+            )
+            # Seeding cached "no budgets" for these users.
+            for user_id in user_ids:
+                invalidate_user_budgets(user_id)
+        SpendingAlert.objects.filter(User_id__in=user_ids).delete()
+        return user_ids
+
+    def _run(self, rng, users, requests):
+        factory = RequestFactory()
+        timings = {name: [] for name, _, _ in SCENARIOS}
+        queries = {name: 0 for name, _, _ in SCENARIOS}
+        counted = [0]
+
+        def count(execute, sql, params, many, context):
+            counted[0] += 1
+            return execute(sql, params, many, context)
+
+        # Scenarios take turns request by request so drift in disk or CPU
+        # speed lands on all of them alike.
+        with connection.execute_wrapper(count):
+            for i in range(requests * len(SCENARIOS)):
+                name, enabled, _ = SCENARIOS[i % len(SCENARIOS)]
+                user_id = rng.choice(users[name])
+                request = factory.post("/api/add-expense/", json.dumps({
+                    "UserId": user_id,
+                    "ExpenseItem": rng.choice(ITEMS),
+                    # Mostly ordinary amounts with the odd outlier.
+                    "ExpenseCost": round(rng.lognormvariate(5, 0.6) * (20 if rng.random() < 0.02 else 1), 2),
+                }), content_type="application/json")
+                request.auth_user_id = user_id
+                with override_settings(SPENDING_ALERTS=enabled, EXPENSE_WRITE_MODE="direct"):
+                    before = counted[0]
+                    began = time.perf_counter()
+                    response = add_expense(request)
+                    timings[name].append((time.perf_counter() - began) * 1000)
+                    queries[name] += counted[0] - before
+                if response.status_code != 201:
+                    raise RuntimeError(f"Insert failed: {response.content!r}")
+
+        results = {}
+        for name, values in timings.items():
+            values.sort()
+            results[name] = {
+                "mean_ms": round(statistics.mean(values), 3),
+                "p50_ms": round(statistics.median(values), 3),
+                "p95_ms": round(values[max(0, int(len(values) * 0.95) - 1)], 3),
+                "queries_per_insert": round(queries[name] / len(values), 2),
+            }
+        return results
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from datetime import timedelta
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from expensetracker.auth import issue_token
+from expensetracker.management.stub_provider import start_stub_provider
+from expensetracker.models import ExpenseDetails, UserDetails
+from expensetracker.writer import insert_expenses
+
+BENCH_EMAIL_DOMAIN = "bench-insights.invalid"
+SERVERS = ("wsgi", "asgi")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the AI insights endpoint against a slow local stub provider, served once by "
+        "gunicorn (WSGI, threads) and once by uvicorn (ASGI, async views), and print JSON stats. "
+        "Point DATABASE_URL (with DJANGO_USE_DATABASE_URL=true) at a scratch database first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=400, help="Insight requests per server.")
+        parser.add_argument("--concurrency", type=int, default=200, help="Requests kept in flight by the client.")
+        parser.add_argument("--provider-delay", type=float, default=1.0, help="Seconds the stub takes to answer.")
+        parser.add_argument("--workers", type=int, default=1, help="Worker processes for both servers.")
+        parser.add_argument("--threads", type=int, default=16, help="Threads per gunicorn worker.")
+        parser.add_argument("--server", choices=SERVERS + ("both",), default="both")
+
+    def handle(self, *args, **options):
+        if settings.DATABASES["default"]["ENGINE"].endswith("sqlite3") and ":memory:" in str(settings.DATABASES["default"]["NAME"]):
+            raise CommandError("The servers run in separate processes and need a file or server database.")
+
+        stub = start_stub_provider(options["provider_delay"])
+
+        user_ids = self._seed(options["requests"])
+        report = {
+            "requests": options["requests"],
+            "concurrency": options["concurrency"],
+            "provider_delay_s": options["provider_delay"],
+            "workers": options["workers"],
+        }
+        try:
+            for server in SERVERS if options["server"] == "both" else (options["server"],):
+                stub.peak = 0
+                report[server] = self._run(server, stub, user_ids, options)
+                report[server]["provider_peak_in_flight"] = stub.peak
+        finally:
+            stub.shutdown()
+            UserDetails.objects.filter(Email__endswith="@" + BENCH_EMAIL_DOMAIN).delete()
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _seed(self, count):
+        # One user per request, so every request misses the insight cache.
+        UserDetails.objects.bulk_create([
+            UserDetails(Fullname=f"Bench {i}", Email=f"user{i}@{BENCH_EMAIL_DOMAIN}", Password="bench")
+            for i in range(count)
+        ])
+        user_ids = list(UserDetails.objects.filter(Email__endswith="@" + BENCH_EMAIL_DOMAIN).values_list("id", flat=True))
+        now = timezone.now()
+        expenses = [
+            ExpenseDetails(User_id=user_id, ExpenseDate=now - timedelta(days=day * 3), ExpenseItem=item, ExpenseCost=cost)
+            for user_id in user_ids
+            for day, (item, cost) in enumerate([("coffee", 120), ("groceries", 1450), ("taxi", 300), ("rent", 15000), ("lunch", 240)])
+        ]
+        with transaction.atomic():
+            insert_expenses(expenses)
+        return user_ids
+
+    def _run(self, server, stub, user_ids, options):
+        port = _free_port()
+        workers = str(options["workers"])
+        if server == "wsgi":
+            command = [
+                sys.executable, "-m", "gunicorn", "backend.wsgi:application", "-b", f"127.0.0.1:{port}",
+                "-w", workers, "-k", "gthread", "--threads", str(options["threads"]), "--timeout", "300",
+            ]
+        else:
+            command = [
+                sys.executable, "-m", "uvicorn", "backend.asgi:application", "--host", "127.0.0.1",
+                "--port", str(port), "--workers", workers, "--no-access-log", "--log-level", "warning",
+            ]
+        env = {
+            **os.environ,
+            "GEMINI_API_BASE": stub.url,
+            "GEMINI_API_KEY": "bench",
+            "AI_HTTP_READ_TIMEOUT": "300",
+            "AI_RATE_LIMIT_USER_PER_MINUTE": "0",
+            "AI_RATE_LIMIT_GLOBAL_PER_MINUTE": "0",
+        }
+        process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            base = f"http://127.0.0.1:{port}"
+            self._wait_until_up(base, process)
+            return asyncio.run(self._load(base, user_ids, options["concurrency"]))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    def _wait_until_up(self, base, process):
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"Server exited: {process.stderr.read().decode()[-2000:]}")
+            try:
+                httpx.get(f"{base}/api/", timeout=1)
+                return
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        raise CommandError("Server did not start within 30s")
+
+    async def _load(self, base, user_ids, concurrency):
+        timings, failures = [], []
+        queue = asyncio.Queue()
+        for user_id in user_ids:
+            queue.put_nowait(user_id)
+
+        async def client_loop(client):
+            while not queue.empty():
+                user_id = queue.get_nowait()
+                began = time.perf_counter()
+                try:
+                    response = await client.post(
+                        f"{base}/api/ai/insights/{user_id}/",
+                        headers={"Authorization": f"Bearer {issue_token(user_id)}"},
+                    )
+                    ok = response.status_code == 200 and response.json().get("provider") == "gemini"
+                    detail = response.text[:200]
+                except httpx.HTTPError as exc:
+                    ok, detail = False, repr(exc)
+                timings.append((time.perf_counter() - began) * 1000)
+                if not ok:
+                    failures.append(detail)
+
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=600) as client:
+            started = time.perf_counter()
+            await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+
+        timings.sort()
+        return {
+            "seconds": round(elapsed, 2),
+            "requests_per_second": round(len(timings) / elapsed, 1),
+            "failed": len(failures),
+            "first_error": failures[0] if failures else None,
+            "p50_ms": round(statistics.median(timings), 1),
+            "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 1),
+            "p99_ms": round(timings[int(len(timings) * 0.99) - 1], 1),
+        }
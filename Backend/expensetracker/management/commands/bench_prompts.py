@@ -0,0 +1,121 @@
+import json
+import os
+import random
+import statistics
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from expensetracker.insights import invalidate_user_insights
+from expensetracker.management.stub_provider import start_stub_provider
+from expensetracker.models import ExpenseDetails, UserDetails
+from expensetracker.views import expense_ai_insights
+from expensetracker.writer import insert_expenses
+
+BENCH_EMAIL_DOMAIN = "bench-prompts.invalid"
+STYLES = ("detailed", "compact")
+ITEMS = [
+    "coffee", "rent", "groceries", "taxi", "gym membership", "electricity bill", "pizza delivery",
+    "metro card top-up", "movie tickets", "mobile recharge", "pharmacy", "online shopping order",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the AI insights endpoint with the detailed and the compact prompt against a stub provider "
+        "whose latency grows with prompt size, and print JSON prompt sizes and latencies per history size. "
+        "Run it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="20,200,2000", help="Comma-separated expenses per user.")
+        parser.add_argument("--users-per-size", type=int, default=5)
+        parser.add_argument("--rounds", type=int, default=4, help="Insight requests per user and style.")
+        parser.add_argument("--provider-delay", type=float, default=0.2, help="Fixed seconds per provider call.")
+        parser.add_argument("--ms-per-token", type=float, default=0.5, help="Extra stub latency per input token.")
+        parser.add_argument("--budget", type=int, help="AI_PROMPT_TOKEN_BUDGET for the compact prompt.")
+        parser.add_argument("--seed", type=int, default=42)
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        users = self._seed(random.Random(options["seed"]), sizes, options["users_per_size"])
+        stub = start_stub_provider(options["provider_delay"], options["ms_per_token"] / 1000)
+        overrides = {
+            "GEMINI_API_BASE": stub.url,
+            "AI_RATE_LIMIT_USER_PER_MINUTE": 0,
+            "AI_RATE_LIMIT_GLOBAL_PER_MINUTE": 0,
+        }
+        if options["budget"]:
+            overrides["AI_PROMPT_TOKEN_BUDGET"] = options["budget"]
+
+        report = {"provider_delay_s": options["provider_delay"], "ms_per_token": options["ms_per_token"], "sizes": {}}
+        try:
+            with override_settings(**overrides), mock.patch.dict(os.environ, {"GEMINI_API_KEY": "bench"}):
+                for size in sizes:
+                    report["sizes"][size] = {
+                        style: self._run(stub, style, users[size], options["rounds"]) for style in STYLES
+                    }
+                    compact, detailed = report["sizes"][size]["compact"], report["sizes"][size]["detailed"]
+                    report["sizes"][size]["prompt_reduction"] = round(
+                        1 - compact["prompt_tokens_estimate"] / detailed["prompt_tokens_estimate"], 2
+                    )
+                    report["sizes"][size]["p50_speedup"] = round(detailed["p50_ms"] / compact["p50_ms"], 2)
+        finally:
+            stub.shutdown()
+            UserDetails.objects.filter(Email__endswith="@" + BENCH_EMAIL_DOMAIN).delete()
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _seed(self, rng, sizes, per_size):
+        UserDetails.objects.bulk_create([
+            UserDetails(Fullname=f"Bench {size}-{n}", Email=f"user{size}-{n}@{BENCH_EMAIL_DOMAIN}", Password="bench")
+            for size in sizes for n in range(per_size)
+        ])
+        users = {size: [] for size in sizes}
+        for user_id, email in UserDetails.objects.filter(Email__endswith="@" + BENCH_EMAIL_DOMAIN).values_list("id", "Email"):
+            users[int(email[4:].split("-")[0])].append(user_id)
+
+        now = timezone.now()
+        for size, user_ids in users.items():
+            expenses = [
+                ExpenseDetails(
+                    User_id=user_id,
+                    ExpenseDate=now - timedelta(minutes=rng.randrange(365 * 24 * 60)),
+                    ExpenseItem=rng.choice(ITEMS),
+                    ExpenseCost=round(rng.lognormvariate(6, 1), 2),
+                )
+                for user_id in user_ids for _ in range(size)
+            ]
+            with transaction.atomic():
+                insert_expenses(expenses)
+        return users
+
+    def _run(self, stub, style, user_ids, rounds):
+        factory = RequestFactory()
+        timings, estimates = [], []
+        del stub.request_sizes[:]
+        with override_settings(AI_PROMPT_STYLE=style):
+            for _ in range(rounds):
+                for user_id in user_ids:
+                    invalidate_user_insights(user_id)
+                    request = factory.post(f"/api/ai/insights/{user_id}/")
+                    request.auth_user_id = user_id
+                    began = time.perf_counter()
+                    response = expense_ai_insights(request, user_id)
+                    timings.append((time.perf_counter() - began) * 1000)
+                    data = json.loads(response.content)
+                    if data.get("provider") != "gemini":
+                        raise RuntimeError(f"Insight was not answered by the stub: {data}")
+                    estimates.append(data["prompt_tokens_estimate"])
+
+        timings.sort()
+        return {
+            "prompt_tokens_estimate": round(statistics.mean(estimates)),
+            "request_bytes": round(statistics.mean(stub.request_sizes)),
+            "p50_ms": round(statistics.median(timings), 1),
+            "p95_ms": round(timings[max(0, int(len(timings) * 0.95) - 1)], 1),
+        }
@@ -0,0 +1,111 @@
+import json
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from expensetracker.models import ExpenseDetails, UserDetails, normalize_category
+from expensetracker.search import has_fts_index
+from expensetracker.views import expense_search
+
+BENCH_EMAIL_DOMAIN = "bench-search.invalid"
+WORDS = [
+    "coffee", "tea", "lunch", "dinner", "breakfast", "taxi", "metro", "rent", "groceries", "milk",
+    "bread", "petrol", "movie", "book", "phone bill", "electricity", "internet", "gym", "medicine",
+    "shoes", "shirt", "snacks", "pizza", "parking", "laundry", "haircut", "gift", "insurance",
+]
+QUALIFIERS = ["", "iced ", "weekly ", "office ", "late night ", "family ", "online ", "monthly "]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic expenses, time the search endpoint and print JSON stats. "
+        "Bench users are removed afterwards unless --keep is given; run it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000, help="Expenses to seed in total.")
+        parser.add_argument("--users", type=int, default=1000, help="Users the rows are spread across.")
+        parser.add_argument("--queries", type=int, default=500, help="Search requests to time.")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per bulk insert.")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--keep", action="store_true", help="Leave the bench users and rows in place.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        vocabulary = [qualifier + word for word in WORDS for qualifier in QUALIFIERS]
+
+        started = time.perf_counter()
+        user_ids = self._seed(rng, vocabulary, options)
+        seed_seconds = time.perf_counter() - started
+
+        try:
+            timings = self._run_queries(rng, user_ids, options["queries"])
+        finally:
+            if not options["keep"]:
+                UserDetails.objects.filter(Email__endswith="@" + BENCH_EMAIL_DOMAIN).delete()
+
+        timings.sort()
+        report = {
+            "backend": "fts5" if has_fts_index() else ("pg_trgm" if connection.vendor == "postgresql" else "scan"),
+            "rows": options["rows"],
+            "users": len(user_ids),
+            "queries": len(timings),
+            "seed_seconds": round(seed_seconds, 1),
+            "p50_ms": round(statistics.median(timings), 2),
+            "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+            "p99_ms": round(timings[int(len(timings) * 0.99) - 1], 2),
+            "max_ms": round(timings[-1], 2),
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _seed(self, rng, vocabulary, options):
+        users = UserDetails.objects.bulk_create([
+            UserDetails(Fullname=f"Bench {i}", Email=f"user{i}@{BENCH_EMAIL_DOMAIN}", Password="bench")
+            for i in range(options["users"])
+        ])
+        user_ids = [user.id for user in users]
+        if not all(user_ids):
+            user_ids = list(
+                UserDetails.objects.filter(Email__endswith="@" + BENCH_EMAIL_DOMAIN).values_list("id", flat=True)
+            )
+
+        start = timezone.now() - timedelta(days=730)
+        batch_size = max(1, options["batch_size"])
+        for offset in range(0, options["rows"], batch_size):
+            batch = []
+            for _ in range(min(batch_size, options["rows"] - offset)):
+                item = rng.choice(vocabulary)
+                batch.append(ExpenseDetails(
+                    User_id=rng.choice(user_ids),
+                    ExpenseDate=start + timedelta(minutes=rng.randrange(730 * 24 * 60)),
+                    ExpenseItem=item,
+                    Category=normalize_category(item),
+                    ExpenseCost=round(rng.uniform(10, 5000), 2),
+                ))
+            with transaction.atomic():
+                ExpenseDetails.objects.bulk_create(batch)
+            self.stderr.write(f"Seeded {offset + len(batch)} rows")
+        return user_ids
+
+    def _run_queries(self, rng, user_ids, count):
+        factory = RequestFactory()
+        timings = []
+        for _ in range(count):
+            word = rng.choice(WORDS)
+            start = rng.randrange(max(1, len(word) - 3))
+            term = word[start:start + rng.randint(3, 6)]
+            user_id = rng.choice(user_ids)
+            request = factory.get("/api/search/", {"q": term, "limit": 50})
+            request.auth_user_id = user_id
+            began = time.perf_counter()
+            response = expense_search(request, user_id)
+            timings.append((time.perf_counter() - began) * 1000)
+            if response.status_code != 200:
+                raise RuntimeError(f"Search for {term!r} failed: {response.content[:200]!r}")
+        return timings
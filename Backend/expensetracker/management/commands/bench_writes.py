@@ -0,0 +1,105 @@
+import json
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+
+from expensetracker.models import UserDetails
+from expensetracker.views import add_expense
+
+BENCH_EMAIL_DOMAIN = "bench-writes.invalid"
+MODES = ("direct", "coalesce")
+
+
+class Command(BaseCommand):
+    help = (
+        "Insert expenses through the add-expense view from many threads and print JSON "
+        "throughput and latency for each write mode. Run it against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16, help="Concurrent request threads.")
+        parser.add_argument("--requests", type=int, default=250, help="Inserts per thread.")
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--mode", choices=MODES + ("both",), default="both")
+        parser.add_argument("--keep", action="store_true", help="Leave the bench users and rows in place.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("The write-coalescing benchmark targets SQLite.")
+        UserDetails.objects.bulk_create([
+            UserDetails(Fullname=f"Bench {i}", Email=f"user{i}@{BENCH_EMAIL_DOMAIN}", Password="bench")
+            for i in range(options["users"])
+        ])
+        user_ids = list(UserDetails.objects.filter(Email__endswith="@" + BENCH_EMAIL_DOMAIN).values_list("id", flat=True))
+        modes = MODES if options["mode"] == "both" else (options["mode"],)
+
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            journal_mode = cursor.fetchone()[0]
+        report = {
+            "journal_mode": journal_mode,
+            "synchronous": settings.SQLITE_SYNCHRONOUS,
+            "threads": options["threads"],
+            "requests": options["threads"] * options["requests"],
+        }
+        try:
+            for mode in modes:
+                with override_settings(EXPENSE_WRITE_MODE=mode):
+                    report[mode] = self._run(user_ids, options["threads"], options["requests"])
+        finally:
+            if not options["keep"]:
+                UserDetails.objects.filter(Email__endswith="@" + BENCH_EMAIL_DOMAIN).delete()
+
+        if len(modes) == 2 and report["direct"]["inserts_per_second"]:
+            report["speedup"] = round(report["coalesce"]["inserts_per_second"] / report["direct"]["inserts_per_second"], 2)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def _run(self, user_ids, thread_count, per_thread):
+        factory = RequestFactory()
+        timings, failures = [], []
+        lock = threading.Lock()
+
+        def worker(offset):
+            local_timings, local_failures = [], []
+            try:
+                for i in range(per_thread):
+                    user_id = user_ids[(offset + i) % len(user_ids)]
+                    request = factory.post("/api/add-expense/", json.dumps({
+                        "UserId": user_id,
+                        "ExpenseItem": f"bench item {i % 20}",
+                        "ExpenseCost": 10 + i % 90,
+                    }), content_type="application/json")
+                    request.auth_user_id = user_id
+                    began = time.perf_counter()
+                    response = add_expense(request)
+                    local_timings.append((time.perf_counter() - began) * 1000)
+                    if response.status_code != 201:
+                        local_failures.append(json.loads(response.content).get("error", response.status_code))
+            finally:
+                connection.close()
+                with lock:
+                    timings.extend(local_timings)
+                    failures.extend(local_failures)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(thread_count)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        timings.sort()
+        return {
+            "seconds": round(elapsed, 2),
+            "inserts_per_second": round((len(timings) - len(failures)) / elapsed, 1),
+            "failed": len(failures),
+            "first_error": str(failures[0]) if failures else None,
+            "p50_ms": round(statistics.median(timings), 2),
+            "p99_ms": round(timings[int(len(timings) * 0.99) - 1], 2),
+        }
@@ -0,0 +1,115 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Max, Min, Sum
+from django.db.models.functions import TruncMonth
+
+from expensetracker.alerts import stats_for_expenses
+from expensetracker.fields import MINOR_UNITS
+from expensetracker.models import ExpenseDetails, SpendingStats, UserDetails, UserMonthlyRollup, UserMonthlyItemRollup
+from expensetracker.rollups import item_label
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user monthly rollup tables and spending stats from ExpenseDetails."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="users",
+            help="Only rebuild this user id (repeatable). Defaults to every user.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of users rebuilt per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options.get("users")
+        if not user_ids:
+            user_ids = list(UserDetails.objects.order_by("id").values_list("id", flat=True))
+        batch_size = max(1, options["batch_size"])
+
+        months = items = stats = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            with transaction.atomic():
+                batch_months, batch_items = self._rebuild_batch(batch)
+                stats += self._rebuild_stats(batch)
+            months += batch_months
+            items += batch_items
+            self.stdout.write(f"Rebuilt users {batch[0]}..{batch[-1]}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {months} monthly rollups, {items} item rollups and {stats} spending stats "
+            f"for {len(user_ids)} users."
+        ))
+
+    def _rebuild_batch(self, user_ids):
+        UserMonthlyRollup.objects.filter(User_id__in=user_ids).delete()
+        UserMonthlyItemRollup.objects.filter(User_id__in=user_ids).delete()
+
+        expenses = (
+            ExpenseDetails.objects.filter(User_id__in=user_ids, ExpenseDate__isnull=False)
+            .annotate(month=TruncMonth("ExpenseDate"))
+        )
+
+        monthly = [
+            UserMonthlyRollup(
+                User_id=row["User_id"],
+                Month=row["month"].date(),
+                ExpenseCount=row["count"],
+                TotalCost=row["total"],
+                MinCost=row["low"],
+                MaxCost=row["high"],
+                # The product runs on stored paise, so scale back to rupees squared.
+                SumSquares=row["squares"] / MINOR_UNITS ** 2,
+            )
+            for row in expenses.values("User_id", "month").annotate(
+                count=Count("id"),
+                total=Sum("ExpenseCost"),
+                low=Min("ExpenseCost"),
+                high=Max("ExpenseCost"),
+                squares=Sum(ExpressionWrapper(F("ExpenseCost") * F("ExpenseCost"), output_field=FloatField())),
+            )
+        ]
+        UserMonthlyRollup.objects.bulk_create(monthly, batch_size=1000)
+
+        # Each bucket is labelled with the spelling of its earliest expense.
+        labels = {}
+        for key in expenses.order_by("ExpenseDate", "id").values_list(
+            "User_id", "month", "Category", "ExpenseItem"
+        ).iterator(chunk_size=5000):
+            labels.setdefault(key[:3], key[3])
+
+        item_rollups = [
+            UserMonthlyItemRollup(
+                User_id=row["User_id"],
+                Month=row["month"].date(),
+                Category=row["Category"],
+                ExpenseItem=item_label(labels[(row["User_id"], row["month"], row["Category"])]),
+                ExpenseCount=row["count"],
+                TotalCost=row["total"],
+            )
+            for row in expenses.values("User_id", "month", "Category").annotate(
+                count=Count("id"), total=Sum("ExpenseCost")
+            )
+        ]
+        UserMonthlyItemRollup.objects.bulk_create(item_rollups, batch_size=1000)
+        return len(monthly), len(item_rollups)
+
+    def _rebuild_stats(self, user_ids):
+        SpendingStats.objects.filter(User_id__in=user_ids).delete()
+        # Log costs have no portable SQL aggregate; stream the rows instead.
+        rows = ExpenseDetails.objects.filter(User_id__in=user_ids).values_list(
+            "User_id", "Category", "ExpenseCost"
+        ).iterator(chunk_size=5000)
+        stats = [
+            SpendingStats(User_id=user_id, Category=category, ExpenseCount=s.count, Mean=s.mean, M2=s.m2)
+            for (user_id, category), s in stats_for_expenses(rows).items()
+        ]
+        SpendingStats.objects.bulk_create(stats, batch_size=1000)
+        return len(stats)
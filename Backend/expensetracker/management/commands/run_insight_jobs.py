@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from expensetracker.jobs import drain_insight_jobs, requeue_stale_jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued AI insight jobs (use with AI_INSIGHT_JOB_MODE=queue)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling for new jobs instead of exiting once the queue is empty.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep between polls in --loop mode.",
+        )
+        parser.add_argument(
+            "--stale-after",
+            type=int,
+            default=settings.AI_INSIGHT_JOB_STALE_AFTER,
+            help="Requeue jobs stuck in 'running' for longer than this many seconds.",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            requeued = requeue_stale_jobs(options["stale_after"])
+            if requeued:
+                self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale jobs"))
+            done = drain_insight_jobs()
+            if done:
+                self.stdout.write(f"Ran {done} insight jobs")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+        self.stdout.write(self.style.SUCCESS("Insight job queue drained."))
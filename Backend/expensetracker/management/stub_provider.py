@@ -0,0 +1,71 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GEMINI_REPLY = {"candidates": [{"content": {"parts": [{"text": "- bench tip"}]}}]}
+OPENAI_REPLY = {
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "bench",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "- bench tip"}, "finish_reason": "stop"}],
+}
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """Answers Gemini and OpenAI chat requests after ``server.delay`` seconds,
+    plus ``server.per_token`` seconds per input token (about four bytes) to
+    stand in for a model reading a longer prompt."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, each reply
+    # would wait ~40 ms for the client's delayed ACK.
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        size = len(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.peak = max(self.server.peak, self.server.in_flight)
+            self.server.request_sizes.append(size)
+            self.server.connections.add(self.client_address)
+        time.sleep(self.server.delay + size / 4 * self.server.per_token)
+        with self.server.lock:
+            self.server.in_flight -= 1
+        reply = OPENAI_REPLY if self.path.endswith("/chat/completions") else GEMINI_REPLY
+        data = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, delay=0.0, per_token=0.0):
+        super().__init__(("127.0.0.1", 0), StubProviderHandler)
+        self.delay = delay
+        self.per_token = per_token
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.request_sizes = []
+        self.connections = set()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+def start_stub_provider(delay=0.0, per_token=0.0):
+    """Serve a stub AI provider on a free local port from a daemon thread."""
+    stub = StubProviderServer(delay, per_token)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    return stub
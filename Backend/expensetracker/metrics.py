@@ -0,0 +1,292 @@
+import atexit
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+SNAPSHOT_GLOB = 'metrics-*.json'
+
+
+class _Family:
+    """Values of one metric keyed by label values; updates hold the registry lock."""
+
+    def __init__(self, registry, name, help_text, labelnames):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+
+
+class Counter(_Family):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        with self.registry.lock:
+            values = self.registry.values[self.name]
+            values[labels] = values.get(labels, 0) + amount
+
+    def merge(self, into, value):
+        return (into or 0) + value
+
+    def samples(self, labels, value):
+        yield self.name, labels, value
+
+
+class Histogram(_Family):
+    """Per-bucket counts (not cumulative) followed by the sum and the count."""
+
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, labelnames, buckets):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            values = self.registry.values[self.name]
+            row = values.get(labels)
+            if row is None:
+                row = values[labels] = [0] * (len(self.buckets) + 3)
+            row[index] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def merge(self, into, value):
+        return [a + b for a, b in zip(into, value)] if into else list(value)
+
+    def samples(self, labels, row):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), row):
+            cumulative += count
+            yield self.name + '_bucket', labels + (('le', _format_bound(bound)),), cumulative
+        yield self.name + '_sum', labels, row[-2]
+        yield self.name + '_count', labels, row[-1]
+
+
+class MetricsRegistry:
+    """In-process metrics, merged with the other workers' snapshots on render.
+
+    Every worker process records into its own registry with no I/O on the
+    request path beyond an occasional snapshot: when METRICS_DIR is set, it
+    rewrites ``metrics-<worker>.json`` there at most every
+    METRICS_FLUSH_INTERVAL seconds, and whichever worker serves
+    ``/api/metrics`` sums all the snapshots. Every metric is a counter or a
+    histogram, so summing is the right merge, and a snapshot left by a
+    worker that has exited keeps its counts in the totals.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.families = {}
+        self.values = {}
+        self._pid = os.getpid()
+        self._worker = f'{self._pid}-{time.time_ns()}'
+        self._flushed_at = time.monotonic()
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(self, name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, help_text, labelnames, buckets))
+
+    def _register(self, family):
+        self.families[family.name] = family
+        self.values[family.name] = {}
+        return family
+
+    def snapshot(self):
+        self._check_fork()
+        with self.lock:
+            return {
+                name: {json.dumps(labels): list(value) if isinstance(value, list) else value
+                       for labels, value in values.items()}
+                for name, values in self.values.items()
+            }
+
+    def _check_fork(self):
+        # A forked worker starts with a copy of its parent's counts, which
+        # the parent reports itself.
+        if os.getpid() != self._pid:
+            with self.lock:
+                for values in self.values.values():
+                    values.clear()
+                self._pid = os.getpid()
+                self._worker = f'{self._pid}-{time.time_ns()}'
+
+    def maybe_flush(self):
+        if settings.METRICS_DIR and time.monotonic() - self._flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        if not any(self.values.values()) and not os.path.exists(self._path(directory)):
+            # Nothing recorded (e.g. a management command); leave no file.
+            return
+        self._flushed_at = time.monotonic()
+        data = self.snapshot()
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as handle:
+            json.dump(data, handle)
+        os.replace(tmp_path, self._path(directory))
+
+    def _path(self, directory):
+        return os.path.join(directory, f'metrics-{self._worker}.json')
+
+    def collect(self):
+        """Every worker's values summed, as ``{name: {label values: value}}``."""
+        snapshots = [self.snapshot()]
+        if settings.METRICS_DIR:
+            self.flush()
+            snapshots = []
+            for path in glob.glob(os.path.join(settings.METRICS_DIR, SNAPSHOT_GLOB)):
+                try:
+                    with open(path) as handle:
+                        snapshots.append(json.load(handle))
+                except (OSError, ValueError):
+                    continue
+        merged = {name: {} for name in self.families}
+        for snapshot in snapshots:
+            for name, values in snapshot.items():
+                family = self.families.get(name)
+                if family is None:
+                    continue
+                for key, value in values.items():
+                    labels = tuple(json.loads(key))
+                    merged[name][labels] = family.merge(merged[name].get(labels), value)
+        return merged
+
+    def render(self):
+        """The merged metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, values in self.collect().items():
+            family = self.families[name]
+            lines.append(f'# HELP {name} {family.help}')
+            lines.append(f'# TYPE {name} {family.kind}')
+            for labels in sorted(values):
+                pairs = tuple(zip(family.labelnames, labels))
+                for sample, sample_labels, value in family.samples(pairs, values[labels]):
+                    lines.append(f'{sample}{_format_labels(sample_labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="' + str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = MetricsRegistry()
+atexit.register(REGISTRY.flush)
+
+http_request_duration = REGISTRY.histogram(
+    'expensetracker_http_request_duration_seconds',
+    'Time to produce a response (first byte for streams), by URL name.',
+    ('view', 'method', 'status'),
+)
+db_queries_per_request = REGISTRY.histogram(
+    'expensetracker_db_queries_per_request',
+    'SQL statements issued while handling one request, by URL name.',
+    ('view',), buckets=QUERY_COUNT_BUCKETS,
+)
+db_query_seconds = REGISTRY.counter(
+    'expensetracker_db_query_duration_seconds_total',
+    'Time spent executing SQL while handling requests, by URL name.',
+    ('view',),
+)
+provider_call_duration = REGISTRY.histogram(
+    'expensetracker_ai_provider_call_duration_seconds',
+    'AI provider call latency by outcome (ok, quota, error).',
+    ('provider', 'outcome'),
+)
+provider_calls = REGISTRY.counter(
+    'expensetracker_ai_provider_calls_total',
+    'AI provider results: ok, quota, error, skipped (breaker open), rate_limited or fallback (answered locally).',
+    ('provider', 'outcome'),
+)
+
+
+# SQL counters for the request being handled; None outside requests.
+_request_queries = ContextVar('expensetracker_request_queries', default=None)
+
+
+class RequestQueries:
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+def count_queries(execute, sql, params, many, context):
+    """``execute_wrapper`` installed on every connection (see apps.py).
+
+    Connections are per thread while async views run their ORM calls on a
+    shared worker thread, so the counts go to whichever request's context
+    the query runs in rather than to a per-connection tally.
+    """
+    queries = _request_queries.get()
+    if queries is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.seconds += time.perf_counter() - started
+        queries.count += 1
+
+
+def install_query_counter(connection):
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+def begin_request():
+    return _request_queries.set(RequestQueries())
+
+
+def end_request(token):
+    queries = _request_queries.get()
+    _request_queries.reset(token)
+    return queries
+
+
+def record_request(request, response, elapsed, queries):
+    match = getattr(request, 'resolver_match', None)
+    view = (match.url_name or match.view_name) if match else 'unresolved'
+    http_request_duration.observe(elapsed, view, request.method, str(response.status_code))
+    db_queries_per_request.observe(queries.count, view)
+    db_query_seconds.inc(view, amount=queries.seconds)
+    REGISTRY.maybe_flush()
+
+
+def record_provider_call(provider, outcome, elapsed=None):
+    provider_calls.inc(provider, outcome)
+    if elapsed is not None:
+        provider_call_duration.observe(elapsed, provider, outcome)
@@ -0,0 +1,129 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core import signing
+from django.http import JsonResponse
+
+from . import metrics
+from .auth import read_token
+from .routers import begin_request, current_state, end_request, is_pinned_to_primary, pin_to_primary
+
+
+class TokenAuthMiddleware:
+    """Resolve ``Authorization: Bearer <token>`` to ``request.auth_user_id``.
+
+    The token is verified from its signature alone, so no query is made. A
+    request without a token gets ``auth_user_id = None``; a bad or expired
+    token is rejected with 401 so the client knows to log in again.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.reject(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.reject(request) or await self.get_response(request)
+
+    def reject(self, request):
+        request.auth_user_id = None
+        scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+        if scheme.lower() == 'bearer' and token.strip():
+            try:
+                request.auth_user_id = read_token(token.strip())
+            except signing.BadSignature:
+                return JsonResponse({'message': 'Invalid or expired token'}, status=401)
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Let ``@replica_reads`` views read from a replica unless the client just wrote.
+
+    Any write during a request pins that client to the primary for
+    DATABASE_REPLICA_STICKY_SECONDS so its next reads see the change.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = begin_request(use_replica=False)
+        try:
+            response = self.get_response(request)
+        finally:
+            state = end_request(token)
+        return self.finish(request, state, response)
+
+    async def __acall__(self, request):
+        # ORM calls made through sync_to_async copy this context, so they
+        # see (and record writes on) the same routing state.
+        token = begin_request(use_replica=False)
+        try:
+            response = await self.get_response(request)
+        finally:
+            state = end_request(token)
+        return self.finish(request, state, response)
+
+    def finish(self, request, state, response):
+        if state.wrote and settings.DATABASE_REPLICAS:
+            pin_to_primary(request)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if getattr(view_func, 'replica_reads', False) and settings.DATABASE_REPLICAS:
+            current_state().use_replica = not is_pinned_to_primary(request)
+
+
+class RequestMetricsMiddleware:
+    """Record each request's latency and SQL statement count and time by URL name.
+
+    Listed first so the latency covers the rest of the middleware. For
+    streaming responses it stops at the first byte: queries the stream
+    makes later are not attributed to the request.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        token = metrics.begin_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            queries = metrics.end_request(token)
+        metrics.record_request(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        token = metrics.begin_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            queries = metrics.end_request(token)
+        metrics.record_request(request, response, time.perf_counter() - started, queries)
+        return response
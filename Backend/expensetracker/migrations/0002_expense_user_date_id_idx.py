@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expensetracker', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='expensedetails',
+            index=models.Index(fields=['User', 'ExpenseDate', 'id'], name='expense_user_date_id_idx'),
+        ),
+    ]
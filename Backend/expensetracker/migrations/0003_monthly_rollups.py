@@ -0,0 +1,105 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:05
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncMonth
+import django.db.models.deletion
+
+BATCH_SIZE = 2000
+
+
+def item_key(item):
+    # Frozen copy of rollups.item_key as of this migration.
+    return (item or 'Other').strip() or 'Other'
+
+
+def backfill_rollups(apps, schema_editor):
+    # The summary reads only these tables, and removing an expense deletes a
+    # month row at a count of 1, so they must start from the existing rows.
+    ExpenseDetails = apps.get_model('expensetracker', 'ExpenseDetails')
+    UserMonthlyRollup = apps.get_model('expensetracker', 'UserMonthlyRollup')
+    UserMonthlyItemRollup = apps.get_model('expensetracker', 'UserMonthlyItemRollup')
+
+    expenses = ExpenseDetails.objects.filter(ExpenseDate__isnull=False).annotate(month=TruncMonth('ExpenseDate'))
+    UserMonthlyRollup.objects.bulk_create(
+        (
+            UserMonthlyRollup(
+                User_id=row['User_id'],
+                Month=row['month'].date(),
+                ExpenseCount=row['count'],
+                TotalCost=row['total'],
+                MinCost=row['low'],
+                MaxCost=row['high'],
+                SumSquares=row['squares'],
+            )
+            for row in expenses.values('User_id', 'month').annotate(
+                count=Count('id'),
+                total=Sum('ExpenseCost'),
+                low=Min('ExpenseCost'),
+                high=Max('ExpenseCost'),
+                squares=Sum(F('ExpenseCost') * F('ExpenseCost')),
+            ).order_by().iterator(chunk_size=BATCH_SIZE)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+    # Group on the raw item in SQL, then fold whitespace variants together.
+    items = defaultdict(lambda: [0, 0.0])
+    for row in expenses.values('User_id', 'month', 'ExpenseItem').annotate(
+        count=Count('id'), total=Sum('ExpenseCost')
+    ).order_by().iterator(chunk_size=BATCH_SIZE):
+        bucket = items[(row['User_id'], row['month'].date(), item_key(row['ExpenseItem']))]
+        bucket[0] += row['count']
+        bucket[1] += row['total']
+    UserMonthlyItemRollup.objects.bulk_create(
+        (
+            UserMonthlyItemRollup(User_id=user_id, Month=month, ExpenseItem=item, ExpenseCount=count, TotalCost=total)
+            for (user_id, month, item), (count, total) in items.items()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expensetracker', '0002_expense_user_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserMonthlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('Month', models.DateField()),
+                ('ExpenseCount', models.PositiveIntegerField(default=0)),
+                ('TotalCost', models.FloatField(default=0)),
+                ('MinCost', models.FloatField(blank=True, null=True)),
+                ('MaxCost', models.FloatField(blank=True, null=True)),
+                ('SumSquares', models.FloatField(default=0)),
+                ('User', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expensetracker.userdetails')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserMonthlyItemRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('Month', models.DateField()),
+                ('ExpenseItem', models.CharField(max_length=100)),
+                ('ExpenseCount', models.PositiveIntegerField(default=0)),
+                ('TotalCost', models.FloatField(default=0)),
+                ('User', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expensetracker.userdetails')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='usermonthlyrollup',
+            constraint=models.UniqueConstraint(fields=('User', 'Month'), name='rollup_user_month_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='usermonthlyitemrollup',
+            constraint=models.UniqueConstraint(fields=('User', 'Month', 'ExpenseItem'), name='item_rollup_user_month_item_uniq'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:07
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expensetracker', '0003_monthly_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expensedetails',
+            name='ExpenseDate',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expensetracker', '0004_expense_date_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InsightJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('Provider', models.CharField(max_length=20)),
+                ('CacheKey', models.CharField(max_length=200)),
+                ('Deadline', models.FloatField(blank=True, null=True)),
+                ('Status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('Result', models.JSONField(blank=True, null=True)),
+                ('StatusCode', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('CreatedAt', models.DateTimeField(auto_now_add=True)),
+                ('UpdatedAt', models.DateTimeField(auto_now=True)),
+                ('User', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expensetracker.userdetails')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['Status', 'CreatedAt'], name='insight_job_status_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='insightjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('Status__in', ['queued', 'running'])), fields=('User', 'CacheKey'), name='insight_job_inflight_uniq'),
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:16
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+BATCH_SIZE = 2000
+
+
+def normalize(item):
+    # Frozen copy of models.normalize_category as of this migration.
+    return ' '.join((item or '').split()).casefold()[:100] or 'other'
+
+
+def backfill_categories(apps, schema_editor):
+    ExpenseDetails = apps.get_model('expensetracker', 'ExpenseDetails')
+    UserMonthlyItemRollup = apps.get_model('expensetracker', 'UserMonthlyItemRollup')
+
+    # Walk the table by primary key in batches so memory stays flat.
+    last_id = 0
+    while True:
+        batch = list(
+            ExpenseDetails.objects.filter(id__gt=last_id).order_by('id').only('id', 'ExpenseItem')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for expense in batch:
+            expense.Category = normalize(expense.ExpenseItem)
+        ExpenseDetails.objects.bulk_update(batch, ['Category'], batch_size=BATCH_SIZE)
+        last_id = batch[-1].id
+
+    # Item rollups were keyed on the stripped item; re-key them by category.
+    UserMonthlyItemRollup.objects.all().delete()
+    expenses = ExpenseDetails.objects.filter(ExpenseDate__isnull=False).annotate(month=TruncMonth('ExpenseDate'))
+    # Each bucket is labelled with the spelling of its earliest expense.
+    labels = {}
+    for key in expenses.order_by('ExpenseDate', 'id').values_list(
+        'User_id', 'month', 'Category', 'ExpenseItem'
+    ).iterator(chunk_size=BATCH_SIZE):
+        labels.setdefault(key[:3], key[3])
+    rows = (
+        expenses.values('User_id', 'month', 'Category')
+        .annotate(count=Count('id'), total=Sum('ExpenseCost'))
+        .order_by()
+    )
+    UserMonthlyItemRollup.objects.bulk_create(
+        (
+            UserMonthlyItemRollup(
+                User_id=row['User_id'],
+                Month=row['month'].date(),
+                Category=row['Category'],
+                ExpenseItem=' '.join((labels[(row['User_id'], row['month'], row['Category'])] or '').split()) or 'Other',
+                ExpenseCount=row['count'],
+                TotalCost=row['total'],
+            )
+            for row in rows.iterator(chunk_size=BATCH_SIZE)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+    # The backfill inserts item rollups and the unique constraint is added to
+    # that table afterwards. On PostgreSQL the inserts' deferred FK checks
+    # would still be pending in a single transaction, and ALTER TABLE refuses
+    # to run on a table with pending trigger events; so the backfill commits
+    # in a transaction of its own before the constraint is added.
+    atomic = False
+
+    dependencies = [
+        ('expensetracker', '0005_insight_jobs'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='usermonthlyitemrollup',
+            name='item_rollup_user_month_item_uniq',
+        ),
+        migrations.AddField(
+            model_name='expensedetails',
+            name='Category',
+            field=models.CharField(default='other', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='usermonthlyitemrollup',
+            name='Category',
+            field=models.CharField(default='other', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='expensedetails',
+            index=models.Index(fields=['User', 'Category'], name='expense_user_category_idx'),
+        ),
+        migrations.RunPython(backfill_categories, migrations.RunPython.noop, atomic=True),
+        migrations.AddConstraint(
+            model_name='usermonthlyitemrollup',
+            constraint=models.UniqueConstraint(fields=('User', 'Month', 'Category'), name='item_rollup_user_month_category_uniq'),
+        ),
+    ]
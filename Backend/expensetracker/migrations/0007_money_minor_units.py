@@ -0,0 +1,176 @@
+from django.db import migrations, models
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Max, Min, Sum
+from django.db.models.functions import TruncMonth
+
+import expensetracker.fields
+
+BATCH_SIZE = 2000
+
+
+def convert_expense_costs(apps, schema_editor):
+    ExpenseDetails = apps.get_model('expensetracker', 'ExpenseDetails')
+    # MoneyField.get_prep_value rounds each float rupee amount to whole paise.
+    last_id = 0
+    while True:
+        batch = list(
+            ExpenseDetails.objects.filter(id__gt=last_id).order_by('id').only('id', 'ExpenseCost')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for expense in batch:
+            expense.ExpenseCostMinor = expense.ExpenseCost or 0
+        ExpenseDetails.objects.bulk_update(batch, ['ExpenseCostMinor'], batch_size=BATCH_SIZE)
+        last_id = batch[-1].id
+
+
+def restore_expense_costs(apps, schema_editor):
+    ExpenseDetails = apps.get_model('expensetracker', 'ExpenseDetails')
+    # MoneyField.from_db_value divides the stored paise back into float rupees.
+    last_id = 0
+    while True:
+        batch = list(
+            ExpenseDetails.objects.filter(id__gt=last_id).order_by('id').only('id', 'ExpenseCostMinor')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for expense in batch:
+            expense.ExpenseCost = expense.ExpenseCostMinor or 0
+        ExpenseDetails.objects.bulk_update(batch, ['ExpenseCost'], batch_size=BATCH_SIZE)
+        last_id = batch[-1].id
+    # By now the rollup money columns are float columns again, recreated
+    # empty; refill them from the restored rupee amounts.
+    _rebuild_rollups(apps, squares_scale=1)
+
+
+def rebuild_rollups(apps, schema_editor):
+    # Rollups are derived data; recompute them from the converted expenses so
+    # their totals are exact sums of paise rather than converted float sums.
+    _rebuild_rollups(apps, squares_scale=10000)
+
+
+def _rebuild_rollups(apps, squares_scale):
+    # squares_scale turns the squared column values into rupees squared.
+    ExpenseDetails = apps.get_model('expensetracker', 'ExpenseDetails')
+    UserMonthlyRollup = apps.get_model('expensetracker', 'UserMonthlyRollup')
+    UserMonthlyItemRollup = apps.get_model('expensetracker', 'UserMonthlyItemRollup')
+    UserMonthlyRollup.objects.all().delete()
+    UserMonthlyItemRollup.objects.all().delete()
+
+    expenses = ExpenseDetails.objects.filter(ExpenseDate__isnull=False).annotate(month=TruncMonth('ExpenseDate'))
+    # Each bucket is labelled with the spelling of its earliest expense.
+    labels = {}
+    for key in expenses.order_by('ExpenseDate', 'id').values_list(
+        'User_id', 'month', 'Category', 'ExpenseItem'
+    ).iterator(chunk_size=BATCH_SIZE):
+        labels.setdefault(key[:3], key[3])
+    UserMonthlyRollup.objects.bulk_create(
+        [
+            UserMonthlyRollup(
+                User_id=row['User_id'],
+                Month=row['month'].date(),
+                ExpenseCount=row['count'],
+                TotalCost=row['total'],
+                MinCost=row['low'],
+                MaxCost=row['high'],
+                SumSquares=row['squares'] / squares_scale,
+            )
+            for row in expenses.values('User_id', 'month').annotate(
+                count=Count('id'),
+                total=Sum('ExpenseCost'),
+                low=Min('ExpenseCost'),
+                high=Max('ExpenseCost'),
+                squares=Sum(ExpressionWrapper(F('ExpenseCost') * F('ExpenseCost'), output_field=FloatField())),
+            ).order_by()
+        ],
+        batch_size=BATCH_SIZE,
+    )
+    UserMonthlyItemRollup.objects.bulk_create(
+        [
+            UserMonthlyItemRollup(
+                User_id=row['User_id'],
+                Month=row['month'].date(),
+                Category=row['Category'],
+                ExpenseItem=' '.join((labels[(row['User_id'], row['month'], row['Category'])] or '').split()) or 'Other',
+                ExpenseCount=row['count'],
+                TotalCost=row['total'],
+            )
+            for row in expenses.values('User_id', 'month', 'Category').annotate(
+                count=Count('id'), total=Sum('ExpenseCost')
+            ).order_by()
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expensetracker', '0006_expense_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expensedetails',
+            name='ExpenseCostMinor',
+            field=expensetracker.fields.MoneyField(null=True),
+        ),
+        # Nullable while both columns exist, so unapplying can re-add the
+        # float column to a table that has rows before refilling it.
+        migrations.AlterField(
+            model_name='expensedetails',
+            name='ExpenseCost',
+            field=models.FloatField(null=True),
+        ),
+        migrations.RunPython(convert_expense_costs, restore_expense_costs),
+        migrations.RemoveField(
+            model_name='expensedetails',
+            name='ExpenseCost',
+        ),
+        migrations.RenameField(
+            model_name='expensedetails',
+            old_name='ExpenseCostMinor',
+            new_name='ExpenseCost',
+        ),
+        migrations.AlterField(
+            model_name='expensedetails',
+            name='ExpenseCost',
+            field=expensetracker.fields.MoneyField(),
+        ),
+        migrations.RemoveField(
+            model_name='usermonthlyrollup',
+            name='TotalCost',
+        ),
+        migrations.RemoveField(
+            model_name='usermonthlyrollup',
+            name='MinCost',
+        ),
+        migrations.RemoveField(
+            model_name='usermonthlyrollup',
+            name='MaxCost',
+        ),
+        migrations.AddField(
+            model_name='usermonthlyrollup',
+            name='TotalCost',
+            field=expensetracker.fields.MoneyField(default=0),
+        ),
+        migrations.AddField(
+            model_name='usermonthlyrollup',
+            name='MinCost',
+            field=expensetracker.fields.MoneyField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='usermonthlyrollup',
+            name='MaxCost',
+            field=expensetracker.fields.MoneyField(blank=True, null=True),
+        ),
+        migrations.RemoveField(
+            model_name='usermonthlyitemrollup',
+            name='TotalCost',
+        ),
+        migrations.AddField(
+            model_name='usermonthlyitemrollup',
+            name='TotalCost',
+            field=expensetracker.fields.MoneyField(default=0),
+        ),
+        migrations.RunPython(rebuild_rollups, migrations.RunPython.noop),
+    ]
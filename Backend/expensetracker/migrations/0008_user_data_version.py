@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expensetracker', '0007_money_minor_units'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdetails',
+            name='DataVersion',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
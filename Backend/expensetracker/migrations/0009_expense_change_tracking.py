@@ -0,0 +1,46 @@
+# Generated by Django 4.2.7 on 2026-10-17 23:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expensetracker', '0008_user_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ExpenseId', models.BigIntegerField()),
+                ('ChangeSeq', models.PositiveBigIntegerField()),
+                ('DeletedAt', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='expensedetails',
+            name='ChangeSeq',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='expensedetails',
+            name='UpdatedAt',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='expensedetails',
+            index=models.Index(fields=['User', 'ChangeSeq', 'id'], name='expense_user_change_idx'),
+        ),
+        migrations.AddField(
+            model_name='expensetombstone',
+            name='User',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expensetracker.userdetails'),
+        ),
+        migrations.AddIndex(
+            model_name='expensetombstone',
+            index=models.Index(fields=['User', 'ChangeSeq'], name='tombstone_user_change_idx'),
+        ),
+    ]
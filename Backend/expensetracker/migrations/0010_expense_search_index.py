@@ -0,0 +1,75 @@
+from django.db import migrations, transaction
+from django.db.utils import DatabaseError
+
+SEARCH_TABLE = 'expensetracker_expense_search'
+EXPENSE_TABLE = 'expensetracker_expensedetails'
+
+
+def owner_sql(column):
+    # Frozen copy of search.owner_sql as of this migration.
+    mixed = f'((({column} % {2 ** 31 - 1}) * 2654435761) % {26 ** 6})'
+    return 'char(' + ', '.join(f'97 + ({mixed} / {26 ** i}) % 26' for i in range(6)) + ')'
+
+
+def install_sqlite_triggers(schema_editor):
+    # Frozen copy of search.SQLITE_TRIGGERS as of this migration; after every
+    # migrate apps.py reinstalls the current ones.
+    owner = owner_sql('new."User_id"')
+    schema_editor.execute(f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON {EXPENSE_TABLE} BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, item, owner) VALUES (new.id, new."Category", {owner});
+    END""")
+    schema_editor.execute(f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON {EXPENSE_TABLE} BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+    END""")
+    schema_editor.execute(f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au AFTER UPDATE OF "Category", "User_id" ON {EXPENSE_TABLE} BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+        INSERT INTO {SEARCH_TABLE}(rowid, item, owner) VALUES (new.id, new."Category", {owner});
+    END""")
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        try:
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5(item, owner, tokenize='trigram')"
+            )
+        except DatabaseError:
+            # SQLite older than 3.34 or built without FTS5: search falls back to a scan.
+            return
+        install_sqlite_triggers(schema_editor)
+        schema_editor.execute(f"""
+            INSERT INTO {SEARCH_TABLE}(rowid, item, owner)
+            SELECT id, "Category", {owner_sql('"User_id"')} FROM {EXPENSE_TABLE}
+        """)
+    elif connection.vendor == 'postgresql':
+        try:
+            # A savepoint keeps a refused CREATE EXTENSION from aborting the migration.
+            with transaction.atomic(using=connection.alias):
+                schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        except DatabaseError:
+            return
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS expense_category_trgm_idx ON {EXPENSE_TABLE} USING gin ("Category" gin_trgm_ops)'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {SEARCH_TABLE}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+    elif connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS expense_category_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expensetracker', '0009_expense_change_tracking'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:12
+
+import math
+from collections import defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+import expensetracker.fields
+
+USER_BATCH_SIZE = 500
+
+
+def stats_for_expenses(rows):
+    # Frozen copy of alerts.stats_for_expenses as of this migration:
+    # Welford's (count, mean, M2) of log(1 + rupees) per user and category,
+    # and per user across all categories under ''.
+    stats = defaultdict(lambda: [0, 0.0, 0.0])
+    for user_id, category, cost in rows:
+        value = math.log1p(max(float(cost), 0.0))
+        for key in ((user_id, category), (user_id, '')):
+            running = stats[key]
+            running[0] += 1
+            delta = value - running[1]
+            running[1] += delta / running[0]
+            running[2] += delta * (value - running[1])
+    return stats
+
+
+def build_spending_stats(apps, schema_editor):
+    # Later writes fold into these rows and edits and deletes take values back
+    # out, so they must start from the existing expenses rather than empty.
+    UserDetails = apps.get_model('expensetracker', 'UserDetails')
+    ExpenseDetails = apps.get_model('expensetracker', 'ExpenseDetails')
+    SpendingStats = apps.get_model('expensetracker', 'SpendingStats')
+    user_ids = list(UserDetails.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(user_ids), USER_BATCH_SIZE):
+        rows = ExpenseDetails.objects.filter(User_id__in=user_ids[start:start + USER_BATCH_SIZE]).values_list(
+            'User_id', 'Category', 'ExpenseCost'
+        ).iterator(chunk_size=5000)
+        SpendingStats.objects.bulk_create(
+            [
+                SpendingStats(User_id=user_id, Category=category, ExpenseCount=count, Mean=mean, M2=m2)
+                for (user_id, category), (count, mean, m2) in stats_for_expenses(rows).items()
+            ],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expensetracker', '0010_expense_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserBudget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('Category', models.CharField(blank=True, default='', max_length=100)),
+                ('MonthlyLimit', expensetracker.fields.MoneyField()),
+                ('User', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expensetracker.userdetails')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SpendingStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('Category', models.CharField(blank=True, default='', max_length=100)),
+                ('ExpenseCount', models.PositiveIntegerField(default=0)),
+                ('Mean', models.FloatField(default=0)),
+                ('M2', models.FloatField(default=0)),
+                ('User', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expensetracker.userdetails')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SpendingAlert',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('Kind', models.CharField(choices=[('anomaly', 'Unusual expense'), ('budget', 'Budget threshold')], max_length=10)),
+                ('Category', models.CharField(blank=True, default='', max_length=100)),
+                ('ExpenseId', models.BigIntegerField(blank=True, null=True)),
+                ('Month', models.DateField(blank=True, null=True)),
+                ('Amount', expensetracker.fields.MoneyField()),
+                ('Baseline', expensetracker.fields.MoneyField()),
+                ('Message', models.CharField(max_length=255)),
+                ('CreatedAt', models.DateTimeField(auto_now_add=True)),
+                ('User', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='expensetracker.userdetails')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='userbudget',
+            constraint=models.UniqueConstraint(fields=('User', 'Category'), name='budget_user_category_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='spendingstats',
+            constraint=models.UniqueConstraint(fields=('User', 'Category'), name='spending_stats_user_category_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='spendingalert',
+            index=models.Index(fields=['User', 'id'], name='alert_user_id_idx'),
+        ),
+        migrations.RunPython(build_spending_stats, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,24 @@
 from django.db import models
+from django.utils import timezone
+
+from .fields import MoneyField
 
 # Create your models here.
 
 
+def normalize_category(item):
+    """Grouping key for an item: case-folded with runs of whitespace collapsed."""
+    return ' '.join((item or '').split()).casefold()[:100] or 'other'
+
+
 
 class UserDetails(models.Model):
     Fullname = models.CharField(max_length=100)
     Email = models.EmailField(unique=True , max_length=100)
     Password = models.CharField(max_length=50)
     Registration_date = models.DateTimeField(auto_now_add=True)
+    # Bumped by every expense write; list and summary ETags are derived from it.
+    DataVersion = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         return self.Fullname
@@ -17,14 +27,185 @@ class ExpenseDetails(models.Model):
     User = models.ForeignKey(UserDetails, on_delete=models.CASCADE)
     # Expense_amount = models.FloatField()
     # Expense_category = models.CharField(max_length=50)
-    ExpenseDate = models.DateTimeField(auto_now_add=True , null=True , blank=True)
+    # Defaults to now but honours a client-supplied date (e.g. offline-captured entries).
+    ExpenseDate = models.DateTimeField(default=timezone.now , null=True , blank=True)
     ExpenseItem = models.CharField(max_length=100)
-    ExpenseCost = models.FloatField()
+    # Normalised ExpenseItem so "Coffee", "coffee " and "COFFEE" group together in SQL.
+    Category = models.CharField(max_length=100, default='other')
+    # Stored as integer paise; reads back as float rupees.
+    ExpenseCost = MoneyField()
     NoteDate = models.DateTimeField(auto_now_add=True)
+    UpdatedAt = models.DateTimeField(auto_now=True)
+    # The owner's DataVersion as of this row's last write; delta sync reads rows past a cursor.
+    ChangeSeq = models.PositiveBigIntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination walks a user's rows newest-first on (ExpenseDate, id).
+            models.Index(fields=['User', 'ExpenseDate', 'id'], name='expense_user_date_id_idx'),
+            models.Index(fields=['User', 'Category'], name='expense_user_category_idx'),
+            models.Index(fields=['User', 'ChangeSeq', 'id'], name='expense_user_change_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # bulk_create skips save(); callers building rows in bulk set Category themselves.
+        self.Category = normalize_category(self.ExpenseItem)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'ExpenseItem' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'Category'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.User.Fullname} - {self.ExpenseItem} - {self.ExpenseCost}"
 
 
-#python manage.py createsuperuser for creating admin user
\ No newline at end of file
+class UserMonthlyRollup(models.Model):
+    User = models.ForeignKey(UserDetails, on_delete=models.CASCADE)
+    Month = models.DateField()
+    ExpenseCount = models.PositiveIntegerField(default=0)
+    TotalCost = MoneyField(default=0)
+    MinCost = MoneyField(null=True, blank=True)
+    MaxCost = MoneyField(null=True, blank=True)
+    SumSquares = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['User', 'Month'], name='rollup_user_month_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.User_id} - {self.Month:%Y-%m} - {self.TotalCost}"
+
+
+class UserMonthlyItemRollup(models.Model):
+    User = models.ForeignKey(UserDetails, on_delete=models.CASCADE)
+    Month = models.DateField()
+    Category = models.CharField(max_length=100, default='other')
+    # Display label: the spelling of the month's first expense in this
+    # category. Writes keep the label of the expense that created the row;
+    # rebuilds take the earliest expense by (ExpenseDate, id).
+    ExpenseItem = models.CharField(max_length=100)
+    ExpenseCount = models.PositiveIntegerField(default=0)
+    TotalCost = MoneyField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['User', 'Month', 'Category'], name='item_rollup_user_month_category_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.User_id} - {self.Month:%Y-%m} - {self.ExpenseItem} - {self.TotalCost}"
+
+
+class ExpenseTombstone(models.Model):
+    # Left behind by a delete so delta sync can tell clients to drop the row.
+    User = models.ForeignKey(UserDetails, on_delete=models.CASCADE)
+    ExpenseId = models.BigIntegerField()
+    ChangeSeq = models.PositiveBigIntegerField()
+    DeletedAt = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['User', 'ChangeSeq'], name='tombstone_user_change_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.User_id} - {self.ExpenseId} - {self.ChangeSeq}"
+
+
+#python manage.py createsuperuser for creating admin user
+
+class InsightJob(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+    IN_FLIGHT = (QUEUED, RUNNING)
+
+    User = models.ForeignKey(UserDetails, on_delete=models.CASCADE)
+    Provider = models.CharField(max_length=20)
+    CacheKey = models.CharField(max_length=200)
+    Deadline = models.FloatField(null=True, blank=True)
+    Status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    Result = models.JSONField(null=True, blank=True)
+    StatusCode = models.PositiveSmallIntegerField(null=True, blank=True)
+    CreatedAt = models.DateTimeField(auto_now_add=True)
+    UpdatedAt = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # At most one in-flight job per user and data fingerprint; duplicate
+            # requests join the existing job instead of calling the provider again.
+            models.UniqueConstraint(
+                fields=['User', 'CacheKey'],
+                condition=models.Q(Status__in=['queued', 'running']),
+                name='insight_job_inflight_uniq',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['Status', 'CreatedAt'], name='insight_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.User_id} - {self.Provider} - {self.Status}"
+
+
+class UserBudget(models.Model):
+    User = models.ForeignKey(UserDetails, on_delete=models.CASCADE)
+    # A normalised category, or '' for the budget on all spending in a month.
+    Category = models.CharField(max_length=100, blank=True, default='')
+    MonthlyLimit = MoneyField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['User', 'Category'], name='budget_user_category_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.User_id} - {self.Category or 'all'} - {self.MonthlyLimit}"
+
+
+class SpendingStats(models.Model):
+    # Running count, mean and sum of squared deviations (Welford) of
+    # log(1 + cost) per user and category, '' covering every category.
+    User = models.ForeignKey(UserDetails, on_delete=models.CASCADE)
+    Category = models.CharField(max_length=100, blank=True, default='')
+    ExpenseCount = models.PositiveIntegerField(default=0)
+    Mean = models.FloatField(default=0)
+    M2 = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['User', 'Category'], name='spending_stats_user_category_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.User_id} - {self.Category or 'all'} - {self.ExpenseCount}"
+
+
+class SpendingAlert(models.Model):
+    ANOMALY = 'anomaly'
+    BUDGET = 'budget'
+    KIND_CHOICES = [(ANOMALY, 'Unusual expense'), (BUDGET, 'Budget threshold')]
+
+    User = models.ForeignKey(UserDetails, on_delete=models.CASCADE)
+    Kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    Category = models.CharField(max_length=100, blank=True, default='')
+    ExpenseId = models.BigIntegerField(null=True, blank=True)
+    Month = models.DateField(null=True, blank=True)
+    # The expense's cost, or the month's spend for a budget alert.
+    Amount = MoneyField()
+    # The usual cost in the category, or the budget's monthly limit.
+    Baseline = MoneyField()
+    Message = models.CharField(max_length=255)
+    CreatedAt = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Clients poll with the last id they saw: a range scan on (User, id).
+            models.Index(fields=['User', 'id'], name='alert_user_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.User_id} - {self.Kind} - {self.Message}"
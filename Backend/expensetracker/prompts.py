@@ -0,0 +1,144 @@
+import os
+import re
+
+from django.conf import settings
+from django.utils import timezone
+
+INSTRUCTIONS = (
+    "You are a concise financial coach. From these spending features give 3-5 bullet insights "
+    "and 2 actionable suggestions. Focus on patterns and next steps, not the raw numbers. "
+    "Under 120 words."
+)
+
+# Words, digit groups of up to three and single symbols, roughly how BPE
+# tokenizers split prices and item names; long words cost extra pieces.
+_TOKEN_PIECES = re.compile(r"[^\W\d_]+|\d{1,3}|[^\w\s]|_")
+
+
+def estimate_tokens(text):
+    """Cheap local estimate of a prompt's token count, no tokenizer needed."""
+    return sum(1 + len(piece) // 7 if piece.isalpha() else 1 for piece in _TOKEN_PIECES.findall(text))
+
+
+def money(value):
+    """₹ amounts at two significant figures or so: ₹950, ₹4.2k, ₹38k, ₹1.2M."""
+    magnitude = abs(value)
+    if magnitude >= 1e6:
+        return f"₹{value / 1e6:.1f}M"
+    if magnitude >= 1e4:
+        return f"₹{value / 1e3:.0f}k"
+    if magnitude >= 1e3:
+        return f"₹{value / 1e3:.1f}k"
+    return f"₹{value:.0f}"
+
+
+def _signed(value):
+    return ('+' if value >= 0 else '-') + money(abs(value))
+
+
+def _sections(analytics):
+    """Feature lines as ``(label, entries)`` in the order they are worth keeping."""
+    months = analytics.monthly_totals()
+    span = f"{months[0][0]}..{months[-1][0]}" if months else ''
+    yield "Overall", [
+        f"{analytics.count} expenses", f"{money(analytics.total)} total", f"avg {money(analytics.mean)}", span,
+    ]
+
+    recent = months[-4:]
+    entries = [f"{label} {money(total)}" for label, total, _ in recent]
+    if recent and recent[-1][0] == timezone.now().strftime('%Y-%m'):
+        entries[-1] += " so far"
+    if len(recent) >= 2 and recent[-2][1]:
+        entries[-1] += f" ({(recent[-1][1] - recent[-2][1]) / recent[-2][1] * 100:+.0f}%)"
+    # Most recent months matter most; keep them if the budget runs short.
+    yield "Monthly", entries[::-1]
+
+    yield "Shares", [
+        f"{name} {total / analytics.total * 100:.0f}%"
+        for name, total, _ in analytics.item_stats(limit=8) if analytics.total
+    ]
+
+    changes = analytics.category_changes(limit=5)
+    if changes and len(months) >= 2:
+        yield f"Movers {months[-1][0]} vs {months[-2][0]}", [
+            f"{name} {_signed(latest - previous)}" for name, previous, latest in changes
+        ]
+
+    yield "Outliers", [f"{o['item']} {money(o['cost'])} {o['date']}" for o in analytics.outliers(limit=3)]
+    yield "Recurring", [
+        f"{name} {seen}/6mo ~{money(average)}" for name, seen, average in analytics.recurring_items(window=6)
+    ]
+
+    weekdays = analytics.day_of_week_totals()
+    if analytics.total and weekdays:
+        busiest = max(weekdays, key=lambda row: row[1])
+        yield "Heaviest day", [f"{busiest[0]} {busiest[1] / analytics.total * 100:.0f}%"]
+
+    percentiles = analytics.percentiles((50, 90))
+    if percentiles:
+        yield "Typical spend", [f"median {money(percentiles['p50'])}", f"p90 {money(percentiles['p90'])}"]
+
+
+def build_compact_prompt(analytics, budget=None):
+    """Aggregated features instead of raw rows, cut to ``budget`` estimated tokens.
+
+    Sections are added in priority order and each keeps as many entries as
+    still fit, so a long history costs about the same as a short one.
+    """
+    budget = budget or settings.AI_PROMPT_TOKEN_BUDGET
+    lines = [INSTRUCTIONS]
+    used = estimate_tokens(INSTRUCTIONS)
+    for label, entries in _sections(analytics):
+        line = f"{label}:"
+        cost = estimate_tokens(line) + 1
+        kept = []
+        for entry in filter(None, entries):
+            entry_cost = estimate_tokens(entry) + (1 if kept else 0)
+            if used + cost + entry_cost > budget:
+                break
+            kept.append(entry)
+            cost += entry_cost
+        if kept:
+            lines.append(f"{line} {', '.join(kept)}")
+            used += cost
+    return "\n".join(lines)
+
+
+def build_detailed_prompt(analytics):
+    """The original prompt: summary lines plus the 30 most recent raw expenses."""
+    summary_lines = [
+        f"Total expenses: ₹{analytics.total:,.2f}",
+        f"Average per expense: ₹{analytics.mean:,.2f}",
+        f"Expense count: {analytics.count}",
+    ]
+    top_counts = analytics.item_stats(limit=5, by='count')
+    if top_counts:
+        summary_lines.append(
+            "Top items: " + ", ".join([f"{name} x{cnt}" for name, _, cnt in top_counts])
+        )
+    months = analytics.monthly_totals(limit=3)
+    if months:
+        summary_lines.append("Recent months: " + ", ".join(f"{label} ₹{total:,.0f}" for label, total, _ in months))
+    percentiles = analytics.percentiles((50, 90))
+    if percentiles:
+        summary_lines.append(f"Median spend ₹{percentiles['p50']:,.0f}, 90th percentile ₹{percentiles['p90']:,.0f}")
+    outliers = analytics.outliers(limit=3)
+    if outliers:
+        summary_lines.append("Outliers: " + ", ".join(f"{o['item']} ₹{o['cost']:,.0f}" for o in outliers))
+    details = "\n".join(
+        [f"- {item} | ₹{cost:.2f}" for item, cost in analytics.recent(30)]
+    )
+    prompt = (
+        "You are a concise financial coach."
+        " Give 3-5 bullet insights and 2 actionable suggestions tailored to the data."
+        " Avoid repeating the raw numbers; focus on patterns and next steps."
+        " Keep it under 120 words."
+        f"\nSummary:\n{os.linesep.join(summary_lines)}\nDetails:\n{details}"
+    )
+    return prompt
+
+
+def build_prompt(analytics):
+    if settings.AI_PROMPT_STYLE == 'detailed':
+        return build_detailed_prompt(analytics)
+    return build_compact_prompt(analytics)
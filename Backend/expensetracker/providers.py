@@ -0,0 +1,445 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .circuit import breaker_for
+from .metrics import record_provider_call
+
+# Clients are built lazily on first use and then shared by every request the
+# worker serves, so TLS sessions and keep-alive connections get reused. The pid
+# check rebuilds them in a forked child instead of sharing the parent's sockets.
+_lock = threading.Lock()
+_gemini_session = None
+_openai_client = None
+_openai_key = None
+_hedge_pool = None
+_owner_pid = None
+
+
+def _reset_if_forked():
+    global _gemini_session, _openai_client, _openai_key, _hedge_pool, _owner_pid
+    if _owner_pid != os.getpid():
+        _gemini_session = None
+        _openai_client = None
+        _openai_key = None
+        _hedge_pool = None
+        _owner_pid = os.getpid()
+
+
+def reset_clients():
+    global _owner_pid
+    with _lock:
+        _owner_pid = None
+        _reset_if_forked()
+
+
+def http_timeout():
+    return (settings.AI_HTTP_CONNECT_TIMEOUT, settings.AI_HTTP_READ_TIMEOUT)
+
+
+def get_gemini_session():
+    global _gemini_session
+    with _lock:
+        _reset_if_forked()
+        if _gemini_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=settings.AI_HTTP_POOL_SIZE,
+                pool_block=False,
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _gemini_session = session
+        return _gemini_session
+
+
+def get_hedge_pool():
+    global _hedge_pool
+    with _lock:
+        _reset_if_forked()
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(
+                max_workers=settings.AI_HEDGE_POOL_SIZE,
+                thread_name_prefix='ai-hedge',
+            )
+        return _hedge_pool
+
+
+def get_openai_client(api_key):
+    global _openai_client, _openai_key
+    with _lock:
+        _reset_if_forked()
+        if _openai_client is None or _openai_key != api_key:
+            import httpx
+            from openai import OpenAI
+
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=settings.AI_HTTP_POOL_SIZE,
+                    max_keepalive_connections=settings.AI_HTTP_POOL_SIZE,
+                    keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(settings.AI_HTTP_READ_TIMEOUT, connect=settings.AI_HTTP_CONNECT_TIMEOUT),
+            )
+            # Retries are left to the circuit breaker rather than stacking
+            # SDK backoff on top of a 30 s read timeout.
+            _openai_client = OpenAI(
+                api_key=api_key,
+                base_url=settings.OPENAI_BASE_URL,
+                http_client=http_client,
+                max_retries=0,
+            )
+            _openai_key = api_key
+        return _openai_client
+
+
+# Async clients belong to the event loop that created them, so there is one
+# per loop. Under an ASGI server that is one per worker process.
+_async_http_clients = weakref.WeakKeyDictionary()
+_async_openai_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client():
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None:
+        # Waiting on a provider costs a socket, not a thread, so the pool is
+        # sized for many slow calls in flight at once.
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.AI_HTTP_ASYNC_POOL_SIZE,
+                max_keepalive_connections=settings.AI_HTTP_POOL_SIZE,
+                keepalive_expiry=settings.AI_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(settings.AI_HTTP_READ_TIMEOUT, connect=settings.AI_HTTP_CONNECT_TIMEOUT),
+        )
+        _async_http_clients[loop] = client
+    return client
+
+
+def get_async_openai_client(api_key):
+    from openai import AsyncOpenAI
+
+    loop = asyncio.get_running_loop()
+    key, client = _async_openai_clients.get(loop, (None, None))
+    if client is None or key != api_key:
+        client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=settings.OPENAI_BASE_URL,
+            http_client=get_async_http_client(),
+            max_retries=0,
+        )
+        _async_openai_clients[loop] = (api_key, client)
+    return client
+
+
+PROVIDERS = ('gemini', 'openai')
+PROVIDER_LABELS = {'gemini': 'Gemini', 'openai': 'OpenAI'}
+PROVIDER_KEYS = {'gemini': 'GEMINI_API_KEY', 'openai': 'OPENAI_API_KEY'}
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def is_configured(name):
+    return bool(os.environ.get(PROVIDER_KEYS[name]))
+
+
+def is_tripped(name):
+    return breaker_for(name).is_open()
+
+
+def is_available(name):
+    return is_configured(name) and not is_tripped(name)
+
+
+def available_providers():
+    return [name for name in PROVIDERS if is_available(name)]
+
+
+def _record_outcome(name, breaker, insight, retry_after, elapsed):
+    if insight == 'quota':
+        breaker.record_failure(retry_after=retry_after, quota=True)
+        outcome = 'quota'
+    elif insight:
+        breaker.record_success()
+        outcome = 'ok'
+    else:
+        breaker.record_failure(retry_after=retry_after)
+        outcome = 'error'
+    record_provider_call(name, outcome, elapsed)
+
+
+def _guarded(name, request, api_key, prompt_text, timeout=None):
+    breaker = breaker_for(name)
+    if not breaker.allow():
+        record_provider_call(name, 'skipped')
+        return None, f"{PROVIDER_LABELS[name]} temporarily disabled after repeated failures"
+
+    started = time.perf_counter()
+    insight, err, retry_after = request(api_key, prompt_text, timeout or http_timeout())
+    _record_outcome(name, breaker, insight, retry_after, time.perf_counter() - started)
+    return insight, err
+
+
+async def _aguarded(name, request, api_key, prompt_text, timeout=None):
+    # Breaker state lives in the cache, which may be a network round trip
+    # (Redis); those calls go to a thread instead of blocking the loop.
+    breaker = breaker_for(name)
+    if not await sync_to_async(breaker.allow)():
+        record_provider_call(name, 'skipped')
+        return None, f"{PROVIDER_LABELS[name]} temporarily disabled after repeated failures"
+
+    started = time.perf_counter()
+    insight, err, retry_after = await request(api_key, prompt_text, timeout or http_timeout())
+    await sync_to_async(_record_outcome)(name, breaker, insight, retry_after, time.perf_counter() - started)
+    return insight, err
+
+
+def _gemini_call(api_key, prompt_text):
+    # Allow overriding the Gemini model via env; default to requested 2.5 Flash
+    model = os.environ.get('GEMINI_MODEL', 'gemini-2.5-flash')
+    url = f"{settings.GEMINI_API_BASE.rstrip('/')}/models/{model}:generateContent"
+    params = {'key': api_key}
+    payload = {
+        "contents": [
+            {"parts": [{"text": prompt_text}]}
+        ]
+    }
+    return url, params, payload
+
+
+def _gemini_answer(response):
+    """Read a Gemini reply; ``response`` may come from requests or httpx."""
+    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+    if response.status_code == 429:
+        return 'quota', 'Gemini quota exceeded', retry_after
+    if response.status_code >= 400:
+        return None, f"Gemini API error: {response.status_code} {response.text}", retry_after
+    try:
+        data = response.json()
+        text = data['candidates'][0]['content']['parts'][0]['text']
+        return text.strip(), None, None
+    except Exception as exc:  # keep narrow surface
+        return None, f"Gemini response parse error: {exc}", None
+
+
+def _gemini_request(api_key, prompt_text, timeout):
+    url, params, payload = _gemini_call(api_key, prompt_text)
+    try:
+        response = get_gemini_session().post(url, params=params, json=payload, timeout=timeout)
+    except requests.RequestException as exc:
+        return None, f"Gemini request failed: {exc}", None
+    return _gemini_answer(response)
+
+
+async def _gemini_request_async(api_key, prompt_text, timeout):
+    import httpx
+
+    url, params, payload = _gemini_call(api_key, prompt_text)
+    connect_timeout, read_timeout = timeout
+    try:
+        response = await get_async_http_client().post(
+            url, params=params, json=payload, timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+        )
+    except httpx.HTTPError as exc:
+        return None, f"Gemini request failed: {exc}", None
+    return _gemini_answer(response)
+
+
+def _openai_call(prompt_text, timeout):
+    import httpx
+
+    connect_timeout, read_timeout = timeout
+    return {
+        'model': "gpt-3.5-turbo",
+        'messages': [
+            {"role": "system", "content": "You are a concise financial coach for personal expenses."},
+            {"role": "user", "content": prompt_text},
+        ],
+        'max_tokens': settings.AI_MAX_OUTPUT_TOKENS,
+        'temperature': 0.6,
+        'timeout': httpx.Timeout(read_timeout, connect=connect_timeout),
+    }
+
+
+def _openai_answer(response):
+    if response.choices and response.choices[0].message.content:
+        return response.choices[0].message.content.strip(), None, None
+    return None, 'OpenAI returned empty response', None
+
+
+def _openai_error(exc):
+    error_response = getattr(exc, 'response', None)
+    status_code = (
+        getattr(error_response, 'status_code', None)
+        or getattr(exc, 'status_code', None)
+        or getattr(exc, 'http_status', None)
+    )
+    headers = getattr(error_response, 'headers', None) or {}
+    retry_after = parse_retry_after(headers.get('retry-after'))
+    if status_code == 429 or 'insufficient_quota' in str(exc).lower():
+        return 'quota', 'OpenAI quota exceeded', retry_after
+    return None, f"OpenAI API error: {exc}", retry_after
+
+
+def _openai_request(api_key, prompt_text, timeout):
+    try:
+        client = get_openai_client(api_key)
+    except ImportError:
+        return None, 'OpenAI package not installed', None
+
+    try:
+        return _openai_answer(client.chat.completions.create(**_openai_call(prompt_text, timeout)))
+    except Exception as exc:
+        return _openai_error(exc)
+
+
+async def _openai_request_async(api_key, prompt_text, timeout):
+    try:
+        client = get_async_openai_client(api_key)
+    except ImportError:
+        return None, 'OpenAI package not installed', None
+
+    try:
+        return _openai_answer(await client.chat.completions.create(**_openai_call(prompt_text, timeout)))
+    except Exception as exc:
+        return _openai_error(exc)
+
+
+def call_gemini(prompt_text, timeout=None):
+    api_key = os.environ.get('GEMINI_API_KEY')
+    if not api_key:
+        return None, 'GEMINI_API_KEY not configured'
+    return _guarded('gemini', _gemini_request, api_key, prompt_text, timeout)
+
+
+def call_openai(prompt_text, timeout=None):
+    api_key = os.environ.get('OPENAI_API_KEY')
+    if not api_key:
+        return None, 'OPENAI_API_KEY not configured'
+    return _guarded('openai', _openai_request, api_key, prompt_text, timeout)
+
+
+def call_provider(name, prompt_text, timeout=None):
+    if name == 'gemini':
+        return call_gemini(prompt_text, timeout)
+    return call_openai(prompt_text, timeout)
+
+
+async def acall_provider(name, prompt_text, timeout=None):
+    api_key = os.environ.get(PROVIDER_KEYS[name])
+    if not api_key:
+        return None, f'{PROVIDER_KEYS[name]} not configured'
+    request = _gemini_request_async if name == 'gemini' else _openai_request_async
+    return await _aguarded(name, request, api_key, prompt_text, timeout)
+
+
+def _timed_call(name, prompt_text, timeout):
+    started = time.monotonic()
+    insight, err = call_provider(name, prompt_text, timeout)
+    return name, insight, err, time.monotonic() - started
+
+
+def call_hedged(prompt_text, deadline):
+    """Race every healthy provider and return the first usable answer.
+
+    Returns ``(winner, insight, err, latencies)``; ``winner`` is None when no
+    provider produced an answer before ``deadline`` seconds elapsed.
+    Latencies are in seconds, None for providers still running at the deadline.
+    """
+    candidates = available_providers()
+    latencies = {name: None for name in candidates}
+    if not candidates:
+        return None, None, 'No AI provider available', latencies
+
+    # Each call's read timeout is capped at the deadline so a losing request
+    # stops holding its pool thread shortly after the race is decided.
+    connect_timeout = min(settings.AI_HTTP_CONNECT_TIMEOUT, deadline)
+    timeout = (connect_timeout, deadline)
+    pool = get_hedge_pool()
+    pending = {pool.submit(_timed_call, name, prompt_text, timeout) for name in candidates}
+    ends_at = time.monotonic() + deadline
+    errors = []
+
+    while pending:
+        remaining = ends_at - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            name, insight, err, elapsed = future.result()
+            latencies[name] = elapsed
+            if insight and insight != 'quota':
+                for loser in pending:
+                    loser.cancel()
+                return name, insight, None, latencies
+            errors.append(err or f"{PROVIDER_LABELS[name]} returned no answer")
+
+    for loser in pending:
+        loser.cancel()
+    if pending:
+        errors.append(f"No provider answered within {deadline:g}s")
+    return None, None, '; '.join(errors), latencies
+
+
+async def _atimed_call(name, prompt_text, timeout):
+    started = time.monotonic()
+    insight, err = await acall_provider(name, prompt_text, timeout)
+    return name, insight, err, time.monotonic() - started
+
+
+async def acall_hedged(prompt_text, deadline):
+    """Async call_hedged: the race runs as tasks and losers are cancelled outright."""
+    candidates = await sync_to_async(available_providers)()
+    latencies = {name: None for name in candidates}
+    if not candidates:
+        return None, None, 'No AI provider available', latencies
+
+    timeout = (min(settings.AI_HTTP_CONNECT_TIMEOUT, deadline), deadline)
+    pending = {asyncio.ensure_future(_atimed_call(name, prompt_text, timeout)) for name in candidates}
+    ends_at = time.monotonic() + deadline
+    errors = []
+
+    try:
+        while pending:
+            remaining = ends_at - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name, insight, err, elapsed = task.result()
+                latencies[name] = elapsed
+                if insight and insight != 'quota':
+                    return name, insight, None, latencies
+                errors.append(err or f"{PROVIDER_LABELS[name]} returned no answer")
+    finally:
+        for loser in pending:
+            loser.cancel()
+
+    if pending:
+        errors.append(f"No provider answered within {deadline:g}s")
+    return None, None, '; '.join(errors), latencies
@@ -0,0 +1,123 @@
+import math
+import threading
+import time
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+RATE_LIMIT_CACHE_PREFIX = 'ai-rate'
+
+# A bucket refills ``rate`` tokens per minute up to ``burst``; a request takes one.
+Bucket = namedtuple('Bucket', 'scope key rate burst')
+Decision = namedtuple('Decision', 'allowed retry_after scope')
+
+ALLOWED = Decision(True, 0.0, None)
+
+# Each bucket is stored as its "theoretical arrival time" (GCRA): the moment
+# it would be full again. One number per bucket means a check is a single
+# read-modify-write, which Redis runs atomically for every bucket at once;
+# a request refused by one bucket takes nothing from the others.
+_REDIS_SCRIPT = """
+local now = tonumber(ARGV[1])
+local wait, refused = 0, 0
+local tats = {}
+for i, key in ipairs(KEYS) do
+    local interval = tonumber(ARGV[i * 2])
+    local burst = tonumber(ARGV[i * 2 + 1])
+    local tat = math.max(tonumber(redis.call('GET', key) or now), now) + interval
+    local ready_in = tat - burst * interval - now
+    if ready_in > wait then
+        wait, refused = ready_in, i
+    end
+    tats[i] = tat
+end
+if refused > 0 then
+    return {tostring(wait), refused}
+end
+for i, key in ipairs(KEYS) do
+    redis.call('SET', key, tostring(tats[i]), 'PX', math.ceil((tats[i] - now) * 1000))
+end
+return {'0', 0}
+"""
+
+_lock = threading.Lock()
+
+
+def insight_buckets(user_id):
+    buckets = [
+        Bucket('user', f'{RATE_LIMIT_CACHE_PREFIX}:user:{user_id}',
+               settings.AI_RATE_LIMIT_USER_PER_MINUTE, settings.AI_RATE_LIMIT_USER_BURST),
+        Bucket('global', f'{RATE_LIMIT_CACHE_PREFIX}:global',
+               settings.AI_RATE_LIMIT_GLOBAL_PER_MINUTE, settings.AI_RATE_LIMIT_GLOBAL_BURST),
+    ]
+    # A rate of 0 turns that limit off.
+    return [bucket for bucket in buckets if bucket.rate > 0]
+
+
+def take_insight_token(user_id):
+    """Take a token from the user's and the global insight buckets, or neither.
+
+    Returns a Decision; when refused, ``retry_after`` is how many seconds
+    until the refusing bucket (``scope``) has a token again.
+    """
+    buckets = insight_buckets(user_id)
+    if not buckets:
+        return ALLOWED
+    backend = caches['default']
+    if isinstance(backend, RedisCache):
+        return _take_redis(backend, buckets)
+    return _take_local(backend, buckets)
+
+
+async def atake_insight_token(user_id):
+    """take_insight_token for async views; the cache calls run on a thread."""
+    return await sync_to_async(take_insight_token)(user_id)
+
+
+def _interval(bucket):
+    return 60.0 / bucket.rate
+
+
+def _take_redis(backend, buckets):
+    keys = [backend.make_and_validate_key(bucket.key) for bucket in buckets]
+    # Django sends every write to the first server, so all keys live together.
+    # Registering only hashes the script; it runs with EVALSHA.
+    script = backend._cache.get_client(keys[0], write=True).register_script(_REDIS_SCRIPT)
+    args = [time.time()]
+    for bucket in buckets:
+        args += [_interval(bucket), max(1, bucket.burst)]
+    wait, refused = script(keys=keys, args=args)
+    if not refused:
+        return ALLOWED
+    return Decision(False, float(wait), buckets[int(refused) - 1].scope)
+
+
+def _take_local(backend, buckets):
+    # Without an atomic script the buckets are updated under a process lock:
+    # exact for the per-process LocMem cache, best effort for a cache shared
+    # by several processes.
+    with _lock:
+        now = time.time()
+        tats = []
+        wait, refused = 0.0, None
+        for bucket in buckets:
+            interval = _interval(bucket)
+            tat = max(backend.get(bucket.key) or now, now) + interval
+            ready_in = tat - max(1, bucket.burst) * interval - now
+            if ready_in > wait:
+                wait, refused = ready_in, bucket
+            tats.append(tat)
+        if refused is not None:
+            return Decision(False, wait, refused.scope)
+        backend.set_many(
+            {bucket.key: tat for bucket, tat in zip(buckets, tats)},
+            timeout=math.ceil(max(tat - now for tat in tats)),
+        )
+        return ALLOWED
+
+
+def retry_after_header(decision):
+    return str(max(1, math.ceil(decision.retry_after)))
@@ -0,0 +1,211 @@
+from collections import defaultdict
+from datetime import date, datetime
+
+from django.db import connection
+from django.db.models import F, Max, Min
+from django.db.models.functions import Coalesce, Greatest, Least
+from django.utils import timezone
+
+from .fields import MINOR_UNITS, to_minor
+from .models import ExpenseDetails, UserMonthlyRollup, UserMonthlyItemRollup, normalize_category
+
+
+def month_of(expense_date):
+    if expense_date is None:
+        return None
+    if timezone.is_aware(expense_date):
+        expense_date = timezone.localtime(expense_date)
+    return expense_date.date().replace(day=1)
+
+
+def next_month(month):
+    if month.month == 12:
+        return date(month.year + 1, 1, 1)
+    return date(month.year, month.month + 1, 1)
+
+
+def month_bounds(month):
+    end_month = next_month(month)
+    start = timezone.make_aware(datetime(month.year, month.month, 1))
+    end = timezone.make_aware(datetime(end_month.year, end_month.month, 1))
+    return start, end
+
+
+def item_label(item):
+    return ' '.join((item or '').split()) or 'Other'
+
+
+UPSERT_CHUNK_SIZE = 100
+
+
+# Amounts passed into F() expressions bypass MoneyField.get_prep_value, so
+# the helpers below take and apply costs as integer paise.
+
+def _bump_month(user_id, month, count, total, squares, low, high):
+    UserMonthlyRollup.objects.get_or_create(User_id=user_id, Month=month)
+    UserMonthlyRollup.objects.filter(User_id=user_id, Month=month).update(
+        ExpenseCount=F('ExpenseCount') + count,
+        TotalCost=F('TotalCost') + total,
+        SumSquares=F('SumSquares') + squares / MINOR_UNITS ** 2,
+        MinCost=Least(Coalesce('MinCost', low), low),
+        MaxCost=Greatest(Coalesce('MaxCost', high), high),
+    )
+
+
+def _bump_item(user_id, month, category, label, count, total):
+    UserMonthlyItemRollup.objects.get_or_create(
+        User_id=user_id, Month=month, Category=category, defaults={'ExpenseItem': label}
+    )
+    UserMonthlyItemRollup.objects.filter(User_id=user_id, Month=month, Category=category).update(
+        ExpenseCount=F('ExpenseCount') + count,
+        TotalCost=F('TotalCost') + total,
+    )
+
+
+def add_to_rollups(user_id, expense_date, item, cost):
+    """Fold one expense into its month. Must run inside the write's transaction."""
+    month = month_of(expense_date)
+    if month is None:
+        return
+    cost = to_minor(cost)
+    _bump_month(user_id, month, 1, cost, cost * cost, cost, cost)
+    _bump_item(user_id, month, normalize_category(item), item_label(item), 1, cost)
+
+
+def upsert(model, key_columns, columns, rows, assignments, returning=()):
+    """``INSERT ... ON CONFLICT (key) DO UPDATE`` for many rows, one statement per chunk.
+
+    ``assignments`` maps a column to its SQL on conflict; ``{table}`` names
+    the existing row and ``excluded`` the incoming one. With ``returning``
+    columns, gives back those columns of every row as it stands afterwards.
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    insert = (
+        f'INSERT INTO {table} ({", ".join(quote(column) for column in columns)}) VALUES {{values}} '
+        f'ON CONFLICT ({", ".join(quote(column) for column in key_columns)}) DO UPDATE SET '
+        + ', '.join(f'{quote(column)} = {sql.format(table=table)}' for column, sql in assignments.items())
+    )
+    if returning:
+        insert += ' RETURNING ' + ', '.join(quote(column) for column in returning)
+    placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    results = []
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            chunk = rows[start:start + UPSERT_CHUNK_SIZE]
+            cursor.execute(
+                insert.format(values=', '.join([placeholder] * len(chunk))),
+                [value for row in chunk for value in row],
+            )
+            if returning:
+                results += cursor.fetchall()
+    return results
+
+
+def add_batch_to_rollups(expenses):
+    """Fold many new expenses in with one upsert per rollup table.
+
+    Backends without ``ON CONFLICT ... DO UPDATE`` fall back to one update
+    per touched month and item.
+    """
+    months = defaultdict(lambda: [0, 0, 0, None, None])
+    items = {}
+    for expense in expenses:
+        month = month_of(expense.ExpenseDate)
+        if month is None:
+            continue
+        cost = to_minor(expense.ExpenseCost)
+        bucket = months[(expense.User_id, month)]
+        bucket[0] += 1
+        bucket[1] += cost
+        bucket[2] += cost * cost
+        bucket[3] = cost if bucket[3] is None else min(bucket[3], cost)
+        bucket[4] = cost if bucket[4] is None else max(bucket[4], cost)
+        key = (expense.User_id, month, normalize_category(expense.ExpenseItem))
+        if key not in items:
+            items[key] = [item_label(expense.ExpenseItem), 0, 0]
+        items[key][1] += 1
+        items[key][2] += cost
+
+    if not connection.features.supports_update_conflicts_with_target:
+        for (user_id, month), values in months.items():
+            _bump_month(user_id, month, *values)
+        for (user_id, month, category), values in items.items():
+            _bump_item(user_id, month, category, *values)
+        return
+
+    least, greatest = ('MIN', 'MAX') if connection.vendor == 'sqlite' else ('LEAST', 'GREATEST')
+    adapt = connection.ops.adapt_datefield_value
+    upsert(
+        UserMonthlyRollup,
+        ['User_id', 'Month'],
+        ['User_id', 'Month', 'ExpenseCount', 'TotalCost', 'SumSquares', 'MinCost', 'MaxCost'],
+        [
+            (user_id, adapt(month), count, total, squares / MINOR_UNITS ** 2, low, high)
+            for (user_id, month), (count, total, squares, low, high) in months.items()
+        ],
+        {
+            'ExpenseCount': '{table}."ExpenseCount" + excluded."ExpenseCount"',
+            'TotalCost': '{table}."TotalCost" + excluded."TotalCost"',
+            'SumSquares': '{table}."SumSquares" + excluded."SumSquares"',
+            'MinCost': least + '(COALESCE({table}."MinCost", excluded."MinCost"), excluded."MinCost")',
+            'MaxCost': greatest + '(COALESCE({table}."MaxCost", excluded."MaxCost"), excluded."MaxCost")',
+        },
+    )
+    # The display label is only set when the row is first created.
+    upsert(
+        UserMonthlyItemRollup,
+        ['User_id', 'Month', 'Category'],
+        ['User_id', 'Month', 'Category', 'ExpenseItem', 'ExpenseCount', 'TotalCost'],
+        [
+            (user_id, adapt(month), category, label, count, total)
+            for (user_id, month, category), (label, count, total) in items.items()
+        ],
+        {
+            'ExpenseCount': '{table}."ExpenseCount" + excluded."ExpenseCount"',
+            'TotalCost': '{table}."TotalCost" + excluded."TotalCost"',
+        },
+    )
+
+
+def remove_from_rollups(user_id, expense_date, item, cost):
+    """Take one expense back out of its month.
+
+    Call this after the expense row itself has been changed or deleted so
+    that a min/max recompute sees the month as it now stands.
+    """
+    month = month_of(expense_date)
+    if month is None:
+        return
+    cost = to_minor(cost)
+
+    rollup = UserMonthlyRollup.objects.select_for_update().filter(User_id=user_id, Month=month).first()
+    if rollup is None:
+        return
+    if rollup.ExpenseCount <= 1:
+        rollup.delete()
+    else:
+        UserMonthlyRollup.objects.filter(pk=rollup.pk).update(
+            ExpenseCount=F('ExpenseCount') - 1,
+            TotalCost=F('TotalCost') - cost,
+            SumSquares=F('SumSquares') - cost * cost / MINOR_UNITS ** 2,
+        )
+        # Min and max cannot be un-applied; rescan only this month when the
+        # removed cost was one of the extremes.
+        if cost <= to_minor(rollup.MinCost) or cost >= to_minor(rollup.MaxCost):
+            start, end = month_bounds(month)
+            extremes = ExpenseDetails.objects.filter(
+                User_id=user_id, ExpenseDate__gte=start, ExpenseDate__lt=end
+            ).aggregate(low=Min('ExpenseCost'), high=Max('ExpenseCost'))
+            UserMonthlyRollup.objects.filter(pk=rollup.pk).update(
+                MinCost=extremes['low'], MaxCost=extremes['high']
+            )
+
+    item_rollups = UserMonthlyItemRollup.objects.filter(
+        User_id=user_id, Month=month, Category=normalize_category(item)
+    )
+    item_rollups.filter(ExpenseCount__lte=1).delete()
+    item_rollups.update(
+        ExpenseCount=F('ExpenseCount') - 1,
+        TotalCost=F('TotalCost') - cost,
+    )
@@ -0,0 +1,123 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+STICKY_CACHE_PREFIX = 'db-primary'
+
+# Coordination tables are read right after another worker writes them, so
+# replica lag would show stale state; they are always read from the primary.
+PRIMARY_ONLY_MODELS = {'insightjob'}
+
+# Backends whose entries other worker processes cannot see.
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+# Routing state for the request being handled; None outside requests (shell,
+# management commands, background threads), where everything uses the primary.
+_request_state = ContextVar('expensetracker_db_routing', default=None)
+
+
+class RoutingState:
+    __slots__ = ('use_replica', 'wrote')
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+def replica_reads(view):
+    """Mark a read-only view whose queries may be served by a replica."""
+    view.replica_reads = True
+    return view
+
+
+def current_state():
+    return _request_state.get()
+
+
+def begin_request(use_replica):
+    return _request_state.set(RoutingState(use_replica))
+
+
+def end_request(token):
+    state = _request_state.get()
+    _request_state.reset(token)
+    return state
+
+
+def sticky_key(request):
+    """Clients are pinned by their token's user; anonymous clients have no key.
+
+    An address is no substitute: every client behind the same proxy or NAT
+    would share one pin.
+    """
+    user_id = getattr(request, 'auth_user_id', None)
+    if user_id is None:
+        return None
+    return f'{STICKY_CACHE_PREFIX}:user:{user_id}'
+
+
+def is_pinned_to_primary(request):
+    # Anonymous clients can't be pinned after a write, so they never use a replica.
+    key = sticky_key(request)
+    return key is None or cache.get(key) is not None
+
+
+def pin_to_primary(request):
+    # Replicas may lag; reading our own write back from one would look like it was lost.
+    key = sticky_key(request)
+    if key is not None:
+        cache.set(key, 1, timeout=settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+
+def check_replica_sticky_cache(app_configs, **kwargs):
+    """The primary pin must be visible to every worker, or reads after a write may hit a lagging replica."""
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if settings.DATABASE_REPLICAS and backend in PROCESS_LOCAL_CACHES:
+        return [checks.Error(
+            'DATABASE_REPLICA_URLS is set but the default cache is not shared between workers.',
+            hint='Set REDIS_URL (and install redis) so read-your-writes pins reach every worker.',
+            obj='DATABASE_REPLICAS',
+            id='expensetracker.E001',
+        )]
+    return []
+
+
+class PrimaryReplicaRouter:
+    """Send reads from ``@replica_reads`` views to a replica, everything else to the primary.
+
+    Reads inside a transaction stay on the primary so they see the
+    transaction's own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if (
+            state is None
+            or not state.use_replica
+            or not settings.DATABASE_REPLICAS
+            or model._meta.model_name in PRIMARY_ONLY_MODELS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication.
+        return db == DEFAULT_DB_ALIAS
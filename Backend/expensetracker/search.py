@@ -0,0 +1,92 @@
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+# Created by migration 0010 when SQLite has FTS5 with the trigram tokenizer.
+SEARCH_TABLE = 'expensetracker_expense_search'
+EXPENSE_TABLE = 'expensetracker_expensedetails'
+TRIGRAM_MIN_LENGTH = 3
+
+# The owner column holds a per-user token so one FTS query matches a user's
+# rows only. Tokens are a multiplicative hash of the id spelt in letters:
+# zero-padded ids would share trigrams like "000" across every user and turn
+# the owner filter into a scan of the whole index. 26**6 is below the
+# multiplier, so even small ids wrap and use every letter position.
+OWNER_LETTERS = 6
+_OWNER_MULTIPLIER = 2654435761
+_OWNER_MODULUS = 26 ** OWNER_LETTERS
+_OWNER_ID_MODULUS = 2 ** 31 - 1
+
+
+def owner_sql(column):
+    """SQL expression computing owner_token() from a user id column."""
+    # Reducing the id first keeps the product inside SQLite's 64-bit integers.
+    mixed = f'((({column} % {_OWNER_ID_MODULUS}) * {_OWNER_MULTIPLIER}) % {_OWNER_MODULUS})'
+    return 'char(' + ', '.join(f'97 + ({mixed} / {26 ** i}) % 26' for i in range(OWNER_LETTERS)) + ')'
+
+
+_OWNER = owner_sql('new."User_id"')
+SQLITE_TRIGGERS = (
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ai AFTER INSERT ON {EXPENSE_TABLE} BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, item, owner) VALUES (new.id, new."Category", {_OWNER});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_ad AFTER DELETE ON {EXPENSE_TABLE} BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_au AFTER UPDATE OF "Category", "User_id" ON {EXPENSE_TABLE} BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+        INSERT INTO {SEARCH_TABLE}(rowid, item, owner) VALUES (new.id, new."Category", {_OWNER});
+    END""",
+)
+
+_fts_tables = {}
+
+
+def install_sqlite_triggers(connection):
+    """(Re)create the triggers that keep the FTS table in step with every write.
+
+    SQLite migrations that rebuild the expense table drop its triggers, so
+    this also runs after every migrate (see apps.py).
+    """
+    if connection.vendor != 'sqlite' or SEARCH_TABLE not in connection.introspection.table_names():
+        return
+    with connection.cursor() as cursor:
+        for statement in SQLITE_TRIGGERS:
+            cursor.execute(statement)
+
+
+def owner_token(user_id):
+    mixed = (int(user_id) % _OWNER_ID_MODULUS * _OWNER_MULTIPLIER) % _OWNER_MODULUS
+    return ''.join(chr(97 + (mixed // 26 ** i) % 26) for i in range(OWNER_LETTERS))
+
+
+def match_expression(user_id, term):
+    phrase = '"' + term.replace('"', '""') + '"'
+    return f'owner:"{owner_token(user_id)}" AND item:{phrase}'
+
+
+def has_fts_index(using='default'):
+    if using not in _fts_tables:
+        connection = connections[using]
+        _fts_tables[using] = (
+            connection.vendor == 'sqlite' and SEARCH_TABLE in connection.introspection.table_names()
+        )
+    return _fts_tables[using]
+
+
+def search_expenses(queryset, user_id, text):
+    """Narrow ``queryset`` to expenses whose item contains ``text``, case-insensitively.
+
+    Matching runs on the normalised Category. Terms of three or more
+    characters use the trigram index (FTS5 on SQLite, pg_trgm on Postgres);
+    shorter ones can only be answered as a prefix match.
+    """
+    term = ' '.join(text.split()).casefold()
+    if len(term) < TRIGRAM_MIN_LENGTH:
+        return queryset.filter(Category__startswith=term)
+    if has_fts_index(queryset.db):
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+            [match_expression(user_id, term)],
+        ))
+    # Postgres serves this LIKE '%term%' from the gin_trgm_ops index.
+    return queryset.filter(Category__contains=term)
@@ -1,3 +1,1240 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent import futures
+from datetime import date, datetime, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, router
+from django.db.models.expressions import RawSQL
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import metrics, providers, views
+from .alerts import stats_for_expenses
+from .analytics import ExpenseColumns, SpendingAnalytics
+from .auth import get_user_record, issue_token
+from .circuit import breaker_for
+from .insights import invalidate_user_insights
+from .management.stub_provider import start_stub_provider
+from .middleware import ReplicaRoutingMiddleware
+from .models import UserDetails, ExpenseDetails, UserMonthlyRollup, UserMonthlyItemRollup, InsightJob, SpendingStats, UserBudget
+from .prompts import build_compact_prompt, build_detailed_prompt, estimate_tokens
+from .rollups import add_to_rollups
+from .routers import check_replica_sticky_cache, replica_reads
+from .writer import commit_batch
+
+
+def make_user(email='user@example.com'):
+    return UserDetails.objects.create(Fullname='Test User', Email=email, Password='secret')
+
+
+def sign_in(client, user):
+    """Send ``user``'s API token with every request ``client`` makes."""
+    client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {issue_token(user.id)}'
+
+
+def make_expense(user, item, cost, when):
+    expense = ExpenseDetails.objects.create(User=user, ExpenseDate=when, ExpenseItem=item, ExpenseCost=cost)
+    add_to_rollups(user.id, when, item, cost)
+    return expense
+
+
+class ManageExpensePaginationTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        base = timezone.make_aware(datetime(2024, 1, 1, 12, 0))
+        self.expenses = [
+            make_expense(self.user, f'Item {i}', float(i), base + timedelta(days=i // 2))
+            for i in range(7)
+        ]
+
+    def page_through(self, limit):
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': limit}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get(f'/api/manage-expense/{self.user.id}/', params).json()
+            seen.extend(row['id'] for row in data['expenses'])
+            cursor = data['next_cursor']
+            if not data['has_more']:
+                break
+        return seen
+
+    def test_pages_follow_cursor_without_gaps(self):
+        expected = [e.id for e in sorted(self.expenses, key=lambda e: (e.ExpenseDate, e.id), reverse=True)]
+        self.assertEqual(self.page_through(3), expected)
+
+    def test_undated_expenses_are_paged_last(self):
+        undated = [
+            ExpenseDetails.objects.create(User=self.user, ExpenseDate=None, ExpenseItem=f'Undated {i}', ExpenseCost=1)
+            for i in range(3)
+        ]
+        dated = [e.id for e in sorted(self.expenses, key=lambda e: (e.ExpenseDate, e.id), reverse=True)]
+        expected = dated + [e.id for e in reversed(undated)]
+        # Page boundaries land both on the switch to undated rows and inside them.
+        self.assertEqual(self.page_through(3), expected)
+        self.assertEqual(self.page_through(2), expected)
+
+    def test_filters_apply_on_server(self):
+        response = self.client.get(f'/api/manage-expense/{self.user.id}/', {
+            'limit': 10,
+            'start_date': '2024-01-02',
+            'end_date': '2024-01-03',
+            'min_cost': '3',
+        })
+        costs = sorted(row['ExpenseCost'] for row in response.json()['expenses'])
+        self.assertEqual(costs, [3.0, 4.0, 5.0])
+
+    def test_cursor_page_is_an_index_range_seek(self):
+        cursor = self.client.get(f'/api/manage-expense/{self.user.id}/', {'limit': 2}).json()['next_cursor']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'/api/manage-expense/{self.user.id}/', {'limit': 2, 'cursor': cursor})
+
+        pages = [q['sql'] for q in queries if 'FROM "expensetracker_expensedetails"' in q['sql']]
+        self.assertEqual(len(pages), 1)
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + pages[0])
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        # Seeks on both the user and the date bound, and needs no sort step.
+        self.assertRegex(plan, r'expense_user_date_id_idx \(User_id=\? AND .*ExpenseDate<\?\)')
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(f'/api/manage-expense/{self.user.id}/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unpaged_request_returns_full_list(self):
+        response = self.client.get(f'/api/manage-expense/{self.user.id}/')
+        self.assertEqual(len(response.json()['expenses']), 7)
+        self.assertNotIn('next_cursor', response.json())
+
+
+class ExpenseSummaryTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        jan = timezone.make_aware(datetime(2024, 1, 10))
+        feb = timezone.make_aware(datetime(2024, 2, 10))
+        make_expense(self.user, 'Coffee', 50.0, jan)
+        make_expense(self.user, 'Coffee', 70.0, feb)
+        make_expense(self.user, 'Rent', 900.0, feb)
+
+    def test_summary_is_computed_in_the_database(self):
+        # The ETag version lookup plus the four summary queries.
+        with self.assertNumQueries(5):
+            response = self.client.get(f'/api/summary/{self.user.id}/')
+
+        data = response.json()
+        self.assertEqual(data['total_expenses'], 1020.0)
+        self.assertEqual(data['expense_count'], 3)
+        self.assertEqual(data['average_expense'], 340.0)
+        self.assertEqual(data['highest_expense']['ExpenseItem'], 'Rent')
+        self.assertEqual(
+            [(m['month'], m['total']) for m in data['monthly_totals']],
+            [('2024-01', 50.0), ('2024-02', 970.0)],
+        )
+        self.assertEqual(data['top_items'][0], {'item': 'Rent', 'category': 'rent', 'total': 900.0, 'count': 1})
+        self.assertEqual(data['top_items'][1], {'item': 'Coffee', 'category': 'coffee', 'total': 120.0, 'count': 2})
+
+    def test_query_count_does_not_grow_with_history(self):
+        feb = timezone.make_aware(datetime(2024, 2, 11))
+        for i in range(20):
+            make_expense(self.user, f'Extra {i}', 1.0, feb)
+        # The ETag version lookup plus the four summary queries.
+        with self.assertNumQueries(5):
+            self.client.get(f'/api/summary/{self.user.id}/')
+
+    def test_empty_history(self):
+        other = make_user('empty@example.com')
+        sign_in(self.client, other)
+        data = self.client.get(f'/api/summary/{other.id}/').json()
+        self.assertEqual(data['expense_count'], 0)
+        self.assertIsNone(data['highest_expense'])
+        self.assertEqual(data['monthly_totals'], [])
+
+
+class MonthlyRollupTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        self.jan = timezone.make_aware(datetime(2024, 1, 10))
+        self.feb = timezone.make_aware(datetime(2024, 2, 10))
+        self.small = make_expense(self.user, 'Coffee', 50.0, self.jan)
+        self.large = make_expense(self.user, 'Rent', 900.0, self.jan)
+
+    def rollup(self, month):
+        return UserMonthlyRollup.objects.get(User=self.user, Month=month)
+
+    def test_add_expense_updates_current_month(self):
+        self.client.post('/api/add-expense/', {
+            'UserId': self.user.id, 'ExpenseItem': ' Lunch ', 'ExpenseCost': 120,
+        }, content_type='application/json')
+
+        month = timezone.localdate().replace(day=1)
+        rollup = self.rollup(month)
+        self.assertEqual((rollup.ExpenseCount, rollup.TotalCost, rollup.SumSquares), (1, 120.0, 14400.0))
+        self.assertTrue(UserMonthlyItemRollup.objects.filter(User=self.user, Month=month, ExpenseItem='Lunch').exists())
+
+    def test_edit_moving_month_and_cost_refiles_expense(self):
+        response = self.client.patch(f'/api/expenses/{self.large.id}/', {
+            'ExpenseDate': '2024-02-03', 'ExpenseCost': 800,
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+        jan = self.rollup(self.jan.date().replace(day=1))
+        self.assertEqual((jan.ExpenseCount, jan.TotalCost, jan.MinCost, jan.MaxCost), (1, 50.0, 50.0, 50.0))
+        feb = self.rollup(self.feb.date().replace(day=1))
+        self.assertEqual((feb.ExpenseCount, feb.TotalCost, feb.MaxCost), (1, 800.0, 800.0))
+
+    def test_delete_drops_empty_buckets(self):
+        self.client.delete(f'/api/expenses/{self.small.id}/')
+        self.client.delete(f'/api/expenses/{self.large.id}/')
+        self.assertFalse(UserMonthlyRollup.objects.filter(User=self.user).exists())
+        self.assertFalse(UserMonthlyItemRollup.objects.filter(User=self.user).exists())
+
+    def test_non_string_items_are_rejected(self):
+        for item in (123, ['Tea'], '  '):
+            response = self.client.put(f'/api/expenses/{self.small.id}/', {'ExpenseItem': item}, content_type='application/json')
+            self.assertEqual(response.status_code, 400, item)
+            self.assertIn('ExpenseItem', response.json()['errors'])
+            response = self.client.post('/api/add-expense/', {'ExpenseItem': item, 'ExpenseCost': 5}, content_type='application/json')
+            self.assertEqual(response.status_code, 400, item)
+        self.small.refresh_from_db()
+        self.assertEqual(self.small.ExpenseItem, 'Coffee')
+
+    def test_unstorable_amounts_are_rejected(self):
+        for cost in ('Infinity', 'NaN', '1e30', '"1e20"', 'true'):
+            body = '{"ExpenseCost": %s}' % cost
+            response = self.client.put(f'/api/expenses/{self.large.id}/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, cost)
+            self.assertIn('ExpenseCost', response.json()['errors'])
+            response = self.client.post('/api/add-expense/', '{"ExpenseItem": "Tea", "ExpenseCost": %s}' % cost,
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400, cost)
+        self.large.refresh_from_db()
+        self.assertEqual(self.large.ExpenseCost, 900.0)
+
+    def test_costs_are_stored_as_exact_paise(self):
+        for cost in ('0.1', '0.2', 19.99):
+            self.client.post('/api/add-expense/', {
+                'UserId': self.user.id, 'ExpenseItem': 'Snack', 'ExpenseCost': cost, 'ExpenseDate': '2024-03-02',
+            }, content_type='application/json')
+
+        stored = ExpenseDetails.objects.filter(User=self.user, Category='snack').values_list(
+            RawSQL('"ExpenseCost"', ()), flat=True
+        )
+        self.assertEqual(sorted(stored), [10, 20, 1999])
+        rollup = self.rollup(date(2024, 3, 1))
+        self.assertEqual(rollup.TotalCost, 20.29)
+        self.assertEqual(ExpenseDetails.objects.filter(ExpenseCost=19.99).count(), 1)
+
+        data = self.client.get(f'/api/manage-expense/{self.user.id}/?category=snack').json()
+        self.assertEqual(sorted(row['ExpenseCost'] for row in data['expenses']), [0.1, 0.2, 19.99])
+
+    def test_rebuild_keeps_the_earliest_spelling_as_label(self):
+        make_expense(self.user, 'COFFEE', 20.0, timezone.make_aware(datetime(2024, 1, 20)))
+        call_command('rebuild_rollups', user=[self.user.id], stdout=StringIO())
+
+        item = UserMonthlyItemRollup.objects.get(User=self.user, Month=date(2024, 1, 1), Category='coffee')
+        self.assertEqual((item.ExpenseItem, item.ExpenseCount, item.TotalCost), ('Coffee', 2, 70.0))
+
+    def test_item_spellings_share_one_category(self):
+        self.client.post('/api/add-expense/bulk/', [
+            {'UserId': self.user.id, 'ExpenseItem': 'COFFEE', 'ExpenseCost': 20, 'ExpenseDate': '2024-01-12'},
+            {'UserId': self.user.id, 'ExpenseItem': ' coffee  ', 'ExpenseCost': 30, 'ExpenseDate': '2024-01-13'},
+        ], content_type='application/json')
+
+        item = UserMonthlyItemRollup.objects.get(User=self.user, Month=self.jan.date().replace(day=1), Category='coffee')
+        self.assertEqual((item.ExpenseItem, item.ExpenseCount, item.TotalCost), ('Coffee', 3, 100.0))
+
+        rows = self.client.get(f'/api/manage-expense/{self.user.id}/?category=Coffee').json()['expenses']
+        self.assertEqual(len(rows), 3)
+
+        self.client.patch(f'/api/expenses/{self.small.id}/', {'ExpenseItem': 'Tea'}, content_type='application/json')
+        self.small.refresh_from_db()
+        self.assertEqual(self.small.Category, 'tea')
+        self.assertEqual(UserMonthlyItemRollup.objects.get(Category='coffee').ExpenseCount, 2)
+
+    def test_rebuild_matches_incremental_state(self):
+        make_expense(self.user, 'coffee ', 30.0, self.feb)
+        expected = list(UserMonthlyRollup.objects.order_by('Month').values(
+            'Month', 'ExpenseCount', 'TotalCost', 'MinCost', 'MaxCost', 'SumSquares'
+        ))
+        UserMonthlyRollup.objects.all().delete()
+
+        call_command('rebuild_rollups', batch_size=1, stdout=StringIO())
+
+        rebuilt = list(UserMonthlyRollup.objects.order_by('Month').values(
+            'Month', 'ExpenseCount', 'TotalCost', 'MinCost', 'MaxCost', 'SumSquares'
+        ))
+        self.assertEqual(rebuilt, expected)
+        self.assertEqual(
+            list(UserMonthlyItemRollup.objects.filter(Category='coffee').order_by('Month').values_list('ExpenseCount', flat=True)),
+            [1, 1],
+        )
+
+
+class BulkAddExpenseTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        sign_in(self.client, self.user)
+
+    @override_settings(AUTH_TOKEN_REQUIRED=False)
+    def test_reports_per_row_results(self):
+        # Tokenless legacy clients may name any user, existing or not.
+        del self.client.defaults['HTTP_AUTHORIZATION']
+        rows = [
+            {'UserId': self.user.id, 'ExpenseItem': 'Tea', 'ExpenseCost': 20, 'ExpenseDate': '2024-03-01'},
+            {'UserId': self.user.id, 'ExpenseItem': '', 'ExpenseCost': 20},
+            {'UserId': self.user.id, 'ExpenseItem': 'Tea', 'ExpenseCost': 'lots'},
+            {'UserId': 999999, 'ExpenseItem': 'Tea', 'ExpenseCost': 5},
+        ]
+        with self.assertLogs('expensetracker.auth', 'WARNING'):
+            response = self.client.post('/api/add-expense/bulk/', rows, content_type='application/json')
+        data = response.json()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((data['accepted'], data['rejected']), (1, 3))
+        self.assertEqual([r['status'] for r in data['results']], ['accepted', 'rejected', 'rejected', 'rejected'])
+        self.assertIn('ExpenseCost', data['results'][2]['errors'])
+        self.assertEqual(data['results'][3]['errors'], {'UserId': 'User does not exist'})
+
+        expense = ExpenseDetails.objects.get(id=data['results'][0]['id'])
+        self.assertEqual(expense.ExpenseDate.date().isoformat(), '2024-03-01')
+
+    def test_ndjson_batch_uses_few_queries_and_updates_rollups(self):
+        lines = [
+            json.dumps({'UserId': self.user.id, 'ExpenseItem': f'Item {i % 3}', 'ExpenseCost': 10, 'ExpenseDate': '2024-03-05'})
+            for i in range(300)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/add-expense/bulk/', '\n'.join(lines), content_type='application/x-ndjson')
+
+        self.assertEqual(response.json()['accepted'], 300)
+        self.assertLess(len(queries), 30)
+        rollup = UserMonthlyRollup.objects.get(User=self.user)
+        self.assertEqual((rollup.ExpenseCount, rollup.TotalCost), (300, 3000.0))
+        self.assertEqual(UserMonthlyItemRollup.objects.filter(User=self.user).count(), 3)
+
+    def test_out_of_range_amount_rejects_only_its_row(self):
+        rows = [{'ExpenseItem': 'Tea', 'ExpenseCost': cost} for cost in (20, 1e30, 1e20, 'nan', 30)]
+        data = self.client.post('/api/add-expense/bulk/', rows, content_type='application/json').json()
+
+        self.assertEqual([r['status'] for r in data['results']], ['accepted', 'rejected', 'rejected', 'rejected', 'accepted'])
+        self.assertEqual(data['results'][1]['errors'], {'ExpenseCost': 'Invalid ExpenseCost value'})
+
+    def test_failed_chunk_is_retried_row_by_row(self):
+        real_insert = views.insert_expenses
+
+        def insert(expenses):
+            if any(expense.ExpenseItem == 'Boom' for expense in expenses):
+                raise ValueError('boom')
+            real_insert(expenses)
+
+        rows = [{'ExpenseItem': item, 'ExpenseCost': 10} for item in ('Tea', 'Boom', 'Coffee')]
+        with mock.patch('expensetracker.views.insert_expenses', side_effect=insert):
+            data = self.client.post('/api/add-expense/bulk/', rows, content_type='application/json').json()
+
+        self.assertEqual([r['status'] for r in data['results']], ['accepted', 'rejected', 'accepted'])
+        self.assertEqual(data['results'][1]['errors'], {'row': 'boom'})
+        self.assertEqual(ExpenseDetails.objects.filter(User=self.user).count(), 2)
+
+
+class ExportExpensesTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        when = timezone.make_aware(datetime(2024, 4, 1))
+        make_expense(self.user, 'Book, used', 12.5, when)
+        make_expense(self.user, 'Pen', 2.0, when + timedelta(days=1))
+
+    def test_csv_export_streams_rows(self):
+        response = self.client.get(f'/api/export/{self.user.id}/')
+        self.assertTrue(response.streaming)
+        body = b''.join(response.streaming_content).decode()
+        lines = body.splitlines()
+        self.assertEqual(lines[0], 'id,ExpenseDate,ExpenseItem,ExpenseCost')
+        self.assertIn('"Book, used",12.5', lines[1])
+        self.assertEqual(len(lines), 3)
+
+    def test_ndjson_export_with_gzip(self):
+        response = self.client.get(
+            f'/api/export/{self.user.id}/', {'format': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['ExpenseItem'] for row in rows], ['Book, used', 'Pen'])
+
+
+class InsightCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        make_expense(self.user, 'Coffee', 50.0, timezone.make_aware(datetime(2024, 1, 10)))
+
+    def post_insight(self):
+        return self.client.post(f'/api/ai/insights/{self.user.id}/').json()
+
+    def test_repeat_request_is_served_from_cache(self):
+        with mock.patch('expensetracker.providers.call_gemini', return_value=('- Save more', None)) as post:
+            first = self.post_insight()
+            second = self.post_insight()
+
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual((first['provider'], first['cached']), ('gemini', False))
+        self.assertEqual((second['insight'], second['cached']), ('- Save more', True))
+
+    def test_writes_invalidate_cached_insight(self):
+        with mock.patch('expensetracker.providers.call_gemini', return_value=('- Save more', None)) as post:
+            self.post_insight()
+            expense = ExpenseDetails.objects.get(User=self.user)
+            self.client.patch(f'/api/expenses/{expense.id}/', {'ExpenseItem': 'Tea'}, content_type='application/json')
+            refreshed = self.post_insight()
+
+        self.assertEqual(post.call_count, 2)
+        self.assertFalse(refreshed['cached'])
+
+
+class PooledProviderClientTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = start_stub_provider()
+        cls.base = cls.server.url
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        providers.reset_clients()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.connections.clear()
+        providers.reset_clients()
+
+    def test_gemini_session_reuses_connection(self):
+        with override_settings(GEMINI_API_BASE=self.base), \
+                mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'test-key'}):
+            results = [providers.call_gemini('prompt') for _ in range(3)]
+
+        self.assertEqual(results, [('- bench tip', None)] * 3)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_openai_client_is_built_once_and_reuses_connection(self):
+        with override_settings(OPENAI_BASE_URL=f'{self.base}/v1'), \
+                mock.patch.dict(os.environ, {'OPENAI_API_KEY': 'sk-test'}):
+            results = [providers.call_openai('prompt') for _ in range(3)]
+            client = providers.get_openai_client('sk-test')
+            self.assertIs(client, providers.get_openai_client('sk-test'))
+
+        self.assertEqual(results, [('- bench tip', None)] * 3)
+        self.assertEqual(len(self.server.connections), 1)
+
+    async def test_async_providers_share_a_pooled_client(self):
+        with override_settings(GEMINI_API_BASE=self.base, OPENAI_BASE_URL=f'{self.base}/v1'), \
+                mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'test-key', 'OPENAI_API_KEY': 'sk-test'}):
+            results = [await providers.acall_provider('gemini', 'prompt') for _ in range(3)]
+            results.append(await providers.acall_provider('openai', 'prompt'))
+            self.assertIs(providers.get_async_http_client(), providers.get_async_http_client())
+            await providers.get_async_http_client().aclose()
+
+        self.assertEqual(results, [('- bench tip', None)] * 3 + [('- bench tip', None)])
+        self.assertEqual(len(self.server.connections), 1)
+
+
+@override_settings(AI_BREAKER_FAILURE_THRESHOLD=2, AI_BREAKER_BASE_BACKOFF=30)
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        make_expense(self.user, 'Coffee', 50.0, timezone.make_aware(datetime(2024, 1, 10)))
+
+    def test_quota_error_opens_breaker_and_honours_retry_after(self):
+        breaker = breaker_for('gemini')
+        with mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'test-key'}), \
+                mock.patch('expensetracker.providers._gemini_request', return_value=('quota', 'Gemini quota exceeded', 120)) as request:
+            self.assertEqual(providers.call_gemini('prompt')[0], 'quota')
+            self.assertEqual(providers.call_gemini('prompt')[0], None)
+
+        self.assertEqual(request.call_count, 1)
+        self.assertEqual(breaker.state(), 'open')
+        self.assertGreater(breaker.retry_in(), 100)
+
+    def test_errors_open_after_threshold_then_half_open_probe_closes(self):
+        breaker = breaker_for('gemini')
+        breaker.record_failure()
+        self.assertEqual(breaker.state(), 'closed')
+        breaker.record_failure()
+        self.assertEqual(breaker.state(), 'open')
+
+        with mock.patch('expensetracker.circuit.time.time', return_value=time.time() + 31):
+            self.assertEqual(breaker.state(), 'half_open')
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+            breaker.record_success()
+        self.assertEqual(breaker.state(), 'closed')
+
+    def test_view_routes_around_open_breaker(self):
+        breaker_for('gemini').record_failure(quota=True)
+        with mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'g', 'OPENAI_API_KEY': 'sk-test'}), \
+                mock.patch('expensetracker.providers.call_gemini') as gemini, \
+                mock.patch('expensetracker.providers.call_openai', return_value=('- bench tip', None)):
+            data = self.client.post(f'/api/ai/insights/{self.user.id}/').json()
+
+        gemini.assert_not_called()
+        self.assertEqual(data['provider'], 'openai')
+
+    def test_view_uses_fallback_when_every_provider_is_unhealthy(self):
+        breaker_for('gemini').record_failure(quota=True)
+        with mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'g'}, clear=True), \
+                mock.patch('expensetracker.providers.call_gemini') as gemini:
+            data = self.client.post(f'/api/ai/insights/{self.user.id}/').json()
+
+        gemini.assert_not_called()
+        self.assertEqual(data['provider'], 'fallback')
+        self.assertIn('temporarily unavailable', data['note'])
+
+
+@mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'g', 'OPENAI_API_KEY': 'sk-test'})
+class HedgedInsightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        make_expense(self.user, 'Coffee', 50.0, timezone.make_aware(datetime(2024, 1, 10)))
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def slow(self, *args, **kwargs):
+        self.release.wait(5)
+        return '- slow tip', None
+
+    def test_fastest_provider_wins(self):
+        with mock.patch('expensetracker.providers.call_gemini', side_effect=self.slow), \
+                mock.patch('expensetracker.providers.call_openai', return_value=('- fast tip', None)):
+            data = self.client.post(f'/api/ai/insights/{self.user.id}/?provider=hedged&deadline=2').json()
+
+        self.assertEqual((data['provider'], data['insight']), ('openai', '- fast tip'))
+        self.assertIsNone(data['latencies_ms']['gemini'])
+        self.assertIsNotNone(data['latencies_ms']['openai'])
+
+    def test_deadline_returns_fallback(self):
+        started = time.monotonic()
+        with mock.patch('expensetracker.providers.call_gemini', side_effect=self.slow), \
+                mock.patch('expensetracker.providers.call_openai', side_effect=self.slow):
+            data = self.client.post(f'/api/ai/insights/{self.user.id}/?provider=hedged&deadline=0.5').json()
+
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(data['provider'], 'fallback')
+        self.assertIn('within 0.5s', data['note'])
+
+    def test_quota_answer_does_not_win(self):
+        with mock.patch('expensetracker.providers.call_gemini', return_value=('quota', 'Gemini quota exceeded')), \
+                mock.patch('expensetracker.providers.call_openai', return_value=('- bench tip', None)):
+            data = self.client.post(f'/api/ai/insights/{self.user.id}/?provider=hedged').json()
+
+        self.assertEqual(data['provider'], 'openai')
+
+
+@override_settings(AI_INSIGHT_JOB_MODE='queue')
+@mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'g'})
+class InsightJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        make_expense(self.user, 'Coffee', 50.0, timezone.make_aware(datetime(2024, 1, 10)))
+
+    def enqueue(self):
+        return self.client.post(f'/api/ai/insights/{self.user.id}/?async=1')
+
+    def test_duplicate_requests_join_one_job(self):
+        first = self.enqueue()
+        second = self.enqueue()
+
+        self.assertEqual(first.status_code, 202)
+        self.assertEqual(first.json()['job_id'], second.json()['job_id'])
+        self.assertTrue(second.json()['coalesced'])
+        self.assertEqual(InsightJob.objects.count(), 1)
+
+    def test_drained_job_reports_result_by_polling_and_sse(self):
+        job = self.enqueue().json()
+        self.assertEqual(self.client.get(job['status_url']).json()['status'], 'queued')
+
+        with mock.patch('expensetracker.providers.call_gemini', return_value=('- job tip', None)):
+            call_command('run_insight_jobs', stdout=StringIO())
+
+        status = self.client.get(job['status_url']).json()
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['result']['insight'], '- job tip')
+
+        stream = self.client.get(job['stream_url'])
+        self.assertEqual(stream['Content-Type'], 'text/event-stream')
+        events = b''.join(stream.streaming_content).decode()
+        self.assertIn('event: status', events)
+        self.assertIn('- job tip', events)
+
+        # The finished job populated the cache, so the next request is immediate.
+        self.assertTrue(self.enqueue().json()['cached'])
+
+    @override_settings(AI_INSIGHT_JOB_MODE='thread')
+    def test_abandoned_thread_job_is_replaced(self):
+        with self.captureOnCommitCallbacks(), mock.patch('expensetracker.jobs.get_job_pool'):
+            first = self.enqueue().json()
+            InsightJob.objects.filter(id=first['job_id']).update(
+                Status=InsightJob.RUNNING, UpdatedAt=timezone.now() - timedelta(hours=1),
+            )
+            second = self.enqueue().json()
+
+        self.assertNotEqual(first['job_id'], second['job_id'])
+        self.assertFalse(second['coalesced'])
+        self.assertEqual(InsightJob.objects.get(id=first['job_id']).Status, InsightJob.FAILED)
+
+    @override_settings(AI_INSIGHT_JOB_SYNC_STREAM_TIMEOUT=0)
+    def test_sync_stream_closes_early_with_retry_hint(self):
+        job = self.enqueue().json()
+
+        events = b''.join(self.client.get(job['stream_url']).streaming_content).decode()
+        self.assertIn('event: timeout', events)
+        self.assertIn('retry: ', events)
+
+
+class SpendingAnalyticsTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        monday = timezone.make_aware(datetime(2024, 1, 1, 9, 0))
+        for day in range(10):
+            make_expense(self.user, 'Coffee ' if day % 2 else 'coffee', 10.0, monday + timedelta(days=day))
+        make_expense(self.user, 'Rent', 500.0, monday + timedelta(days=31))
+
+    def test_columnar_statistics(self):
+        analytics = SpendingAnalytics(ExpenseColumns.for_user(self.user.id))
+
+        self.assertEqual(analytics.count, 11)
+        self.assertAlmostEqual(analytics.total, 600.0)
+        self.assertEqual(analytics.item_stats(limit=1), [('Rent', 500.0, 1)])
+        # Both spellings fold into one category.
+        self.assertEqual(analytics.item_stats(by='count')[0][1:], (100.0, 10))
+        self.assertEqual(analytics.monthly_totals(), [('2024-01', 100.0, 10), ('2024-02', 500.0, 1)])
+        self.assertEqual(analytics.weekly_totals()[0], ('2024-01-01', 70.0, 7))
+        self.assertEqual(analytics.day_of_week_totals()[0], ('Monday', 20.0, 2))
+        self.assertEqual(analytics.percentiles((50,)), {'p50': 10.0})
+        self.assertEqual([o['item'] for o in analytics.outliers()], ['Rent'])
+        self.assertEqual([(item.lower(), cost) for item, cost in analytics.recent(2)], [('rent', 500.0), ('coffee', 10.0)])
+
+    def test_month_over_month_and_recurring_features(self):
+        make_expense(self.user, 'coffee', 30.0, timezone.make_aware(datetime(2024, 2, 5, 9, 0)))
+        analytics = SpendingAnalytics(ExpenseColumns.for_user(self.user.id))
+
+        changes = [(name.lower(), previous, latest) for name, previous, latest in analytics.category_changes()]
+        self.assertEqual(changes, [('rent', 0.0, 500.0), ('coffee', 100.0, 30.0)])
+        recurring = [(name.lower(), seen, average) for name, seen, average in analytics.recurring_items(min_months=2)]
+        self.assertEqual(recurring, [('coffee', 2, 130.0 / 11)])
+
+    def test_fallback_uses_full_history(self):
+        with mock.patch.dict(os.environ, {}, clear=True):
+            data = self.client.post(f'/api/ai/insights/{self.user.id}/').json()
+
+        self.assertEqual(data['provider'], 'fallback')
+        self.assertEqual(data['expense_count'], 11)
+        self.assertIn('Rent', data['insight'])
+        self.assertGreater(data['prompt_tokens_estimate'], 0)
+
+
+class CompactPromptTests(SimpleTestCase):
+    def setUp(self):
+        start = timezone.make_aware(datetime(2023, 1, 1, 9, 0))
+        items = ['coffee', 'rent', 'groceries', 'taxi', 'electricity bill', 'gym membership']
+        rows = [
+            (start + timedelta(hours=7 * n), items[n % len(items)].title(), items[n % len(items)], 20.0 + n % 97)
+            for n in range(3000)
+        ]
+        rows.append((start + timedelta(days=300), 'laptop', 'Laptop', 90000.0))
+        self.analytics = SpendingAnalytics(ExpenseColumns.from_rows(rows))
+
+    def test_compact_prompt_stays_within_budget_and_below_detailed(self):
+        prompt = build_compact_prompt(self.analytics, budget=250)
+
+        self.assertLessEqual(estimate_tokens(prompt), 250)
+        self.assertLess(estimate_tokens(prompt), estimate_tokens(build_detailed_prompt(self.analytics)))
+        for section in ('Overall:', 'Monthly:', 'Shares:', 'Outliers: Laptop'):
+            self.assertIn(section, prompt)
+        self.assertNotIn(' | ', prompt)
+
+    def test_tight_budget_keeps_highest_priority_sections(self):
+        prompt = build_compact_prompt(self.analytics, budget=60)
+
+        self.assertLessEqual(estimate_tokens(prompt), 60)
+        self.assertIn('Overall: 3001 expenses', prompt)
+        self.assertNotIn('Recurring:', prompt)
+
+    def test_token_estimate_counts_words_digit_groups_and_symbols(self):
+        self.assertEqual(estimate_tokens('rent ₹15,000'), 5)
+        self.assertEqual(estimate_tokens(''), 0)
+
+
+class TokenAuthTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        self.other = make_user('other@example.com')
+        response = self.client.post('/api/login/', {'Email': self.user.Email, 'Password': 'secret'}, content_type='application/json')
+        self.auth = {'HTTP_AUTHORIZATION': f"Bearer {response.json()['token']}"}
+
+    def test_token_scopes_requests_to_its_user(self):
+        self.assertEqual(self.client.get(f'/api/manage-expense/{self.user.id}/', **self.auth).status_code, 200)
+        self.assertEqual(self.client.get(f'/api/summary/{self.other.id}/', **self.auth).status_code, 403)
+
+        response = self.client.get(f'/api/manage-expense/{self.user.id}/', headers={'Authorization': 'Bearer forged'})
+        self.assertEqual(response.status_code, 401)
+
+        with override_settings(AUTH_TOKEN_MAX_AGE=-1):
+            self.assertEqual(self.client.get(f'/api/manage-expense/{self.user.id}/', **self.auth).status_code, 401)
+
+    def test_add_expense_skips_user_lookup(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/add-expense/', {
+                'ExpenseItem': 'Tea', 'ExpenseCost': 15,
+            }, content_type='application/json', **self.auth)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(ExpenseDetails.objects.filter(User=self.user, ExpenseItem='Tea').exists())
+        self.assertFalse([q for q in queries if q['sql'].startswith('SELECT') and 'expensetracker_userdetails' in q['sql']])
+
+        response = self.client.post('/api/add-expense/', {
+            'UserId': self.other.id, 'ExpenseItem': 'Tea', 'ExpenseCost': 15,
+        }, content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 403)
+
+    def test_required_token_rejects_anonymous_calls(self):
+        self.assertEqual(self.client.get(f'/api/manage-expense/{self.user.id}/').status_code, 401)
+        self.assertEqual(self.client.post('/api/add-expense/bulk/', [], content_type='application/json').status_code, 401)
+
+    @override_settings(AUTH_TOKEN_REQUIRED=False)
+    def test_legacy_tokenless_calls_are_served_with_a_warning(self):
+        with self.assertLogs('expensetracker.auth', 'WARNING') as logs:
+            self.assertEqual(self.client.get(f'/api/manage-expense/{self.user.id}/').status_code, 200)
+        self.assertIn('without an auth token', logs.output[0])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        self.expense = make_expense(self.user, 'Coffee', 50.0, timezone.make_aware(datetime(2024, 1, 10)))
+
+    def test_unchanged_data_answers_304_after_one_query(self):
+        for url in (f'/api/manage-expense/{self.user.id}/', f'/api/summary/{self.user.id}/'):
+            response = self.client.get(url)
+            etag = response['ETag']
+            self.assertIn('no-cache', response['Cache-Control'])
+
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+    def test_writes_and_parameters_change_the_etag(self):
+        url = f'/api/manage-expense/{self.user.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertNotEqual(self.client.get(url + '?limit=1')['ETag'], etag)
+
+        self.client.patch(f'/api/expenses/{self.expense.id}/', {'ExpenseCost': 60}, content_type='application/json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        when = timezone.make_aware(datetime(2024, 1, 10))
+        self.kept = make_expense(self.user, 'Coffee', 50.0, when)
+        self.edited = make_expense(self.user, 'Lunch', 120.0, when)
+        self.removed = make_expense(self.user, 'Taxi', 300.0, when)
+
+    def changes(self, **params):
+        return self.client.get('/api/expenses/changes/', {'user_id': self.user.id, **params}).json()
+
+    def test_changes_since_cursor_include_updates_and_tombstones(self):
+        snapshot = self.changes()
+        self.assertEqual(len(snapshot['changes']), 3)
+        self.assertEqual(snapshot['deleted'], [])
+
+        self.client.patch(f'/api/expenses/{self.edited.id}/', {'ExpenseCost': 130}, content_type='application/json')
+        self.client.delete(f'/api/expenses/{self.removed.id}/')
+        self.client.post('/api/add-expense/', {
+            'UserId': self.user.id, 'ExpenseItem': 'Tea', 'ExpenseCost': 15,
+        }, content_type='application/json')
+
+        delta = self.changes(since=snapshot['cursor'])
+        self.assertEqual([row['ExpenseItem'] for row in delta['changes']], ['Lunch', 'Tea'])
+        self.assertEqual(delta['changes'][0]['ExpenseCost'], 130.0)
+        self.assertEqual(delta['deleted'], [self.removed.id])
+        self.assertFalse(delta['has_more'])
+
+        self.assertEqual(self.changes(since=delta['cursor']), {
+            'changes': [], 'deleted': [], 'cursor': delta['cursor'], 'has_more': False,
+        })
+
+    def test_pages_split_a_bulk_insert_without_gaps(self):
+        cursor = self.changes()['cursor']
+        self.client.post('/api/add-expense/bulk/', [
+            {'UserId': self.user.id, 'ExpenseItem': f'Item {i}', 'ExpenseCost': i} for i in range(5)
+        ], content_type='application/json')
+
+        seen, pages = [], 0
+        while True:
+            page = self.changes(since=cursor, limit=2)
+            seen += [row['ExpenseItem'] for row in page['changes']]
+            cursor, pages = page['cursor'], pages + 1
+            if not page['has_more']:
+                break
+        self.assertEqual(seen, [f'Item {i}' for i in range(5)])
+        self.assertEqual(pages, 3)
+
+    def test_first_list_page_carries_sync_cursor(self):
+        self.client.delete(f'/api/expenses/{self.removed.id}/')
+        data = self.client.get(f'/api/manage-expense/{self.user.id}/?limit=10').json()
+        self.assertEqual(data['sync_cursor'], '1')
+        self.assertEqual(self.changes(since=data['sync_cursor'])['changes'], [])
+
+
+class ExpenseSearchTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        self.other = make_user('other@example.com')
+        when = timezone.make_aware(datetime(2024, 5, 1))
+        make_expense(self.user, 'Iced Coffee', 180.0, when)
+        make_expense(self.user, 'coffee beans', 650.0, when + timedelta(days=1))
+        make_expense(self.user, 'Cab to office', 240.0, when + timedelta(days=2))
+        make_expense(self.other, 'Coffee', 90.0, when)
+
+    def search(self, **params):
+        return self.client.get(f'/api/search/{self.user.id}/', params).json()
+
+    def items(self, **params):
+        return [row['ExpenseItem'] for row in self.search(**params)['expenses']]
+
+    def test_substring_and_prefix_match_only_own_rows(self):
+        self.assertEqual(self.items(q='COFF'), ['coffee beans', 'Iced Coffee'])
+        self.assertEqual(self.items(q='ffice'), ['Cab to office'])
+        self.assertEqual(self.items(q='ca'), ['Cab to office'])
+        self.assertEqual(self.items(q='tea'), [])
+
+    def test_filters_paging_and_index_maintenance(self):
+        self.assertEqual(self.items(q='coffee', min_cost=200), ['coffee beans'])
+
+        page = self.search(q='coffee', limit=1)
+        self.assertTrue(page['has_more'])
+        self.assertEqual(self.items(q='coffee', limit=1, cursor=page['next_cursor']), ['Iced Coffee'])
+
+        expense = ExpenseDetails.objects.get(ExpenseItem='Cab to office')
+        self.client.patch(f'/api/expenses/{expense.id}/', {'ExpenseItem': 'Coffee with team'}, content_type='application/json')
+        self.assertEqual(self.items(q='team'), ['Coffee with team'])
+        self.assertEqual(self.items(q='office'), [])
+
+        self.client.delete(f'/api/expenses/{expense.id}/')
+        self.assertEqual(self.items(q='team'), [])
+
+
+class ExpenseWriterTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        sign_in(self.client, self.user)
+
+    def queued(self, item, cost):
+        expense = ExpenseDetails(User_id=self.user.id, ExpenseDate=timezone.now(), ExpenseItem=item, ExpenseCost=cost)
+        return expense, futures.Future()
+
+    def test_batch_commits_together_and_bad_rows_fail_alone(self):
+        make_expense(self.user, 'TEA', 40, timezone.now())
+        batch = [self.queued('Tea', 20), self.queued(None, 5), self.queued('Iced Tea', 30.5), self.queued('tea', 60)]
+        commit_batch(batch)
+
+        self.assertEqual([f.result().ExpenseItem for _, f in batch if not f.exception()], ['Tea', 'Iced Tea', 'tea'])
+        self.assertIsNotNone(batch[1][1].exception())
+        self.assertEqual(ExpenseDetails.objects.filter(User=self.user).count(), 4)
+        rollup = UserMonthlyRollup.objects.get(User=self.user)
+        self.assertEqual((rollup.ExpenseCount, rollup.TotalCost, rollup.MinCost, rollup.MaxCost), (4, 150.5, 20.0, 60.0))
+        self.assertAlmostEqual(rollup.SumSquares, 40 ** 2 + 20 ** 2 + 30.5 ** 2 + 60 ** 2)
+        items = UserMonthlyItemRollup.objects.filter(User=self.user).order_by('Category')
+        self.assertEqual(
+            [(i.Category, i.ExpenseItem, i.ExpenseCount, i.TotalCost) for i in items],
+            [('iced tea', 'Iced Tea', 1, 30.5), ('tea', 'TEA', 3, 120.0)],
+        )
+
+
+@override_settings(EXPENSE_WRITE_MODE='coalesce')
+class CoalescedAddExpenseTests(TransactionTestCase):
+    def test_concurrent_requests_each_get_their_own_result(self):
+        user = make_user()
+        # The in-memory test database fails concurrent readers of a table
+        # being written instead of waiting; keep request threads off the DB.
+        get_user_record(user.id)
+        statuses = []
+
+        def post(item):
+            response = Client().post('/api/add-expense/', {
+                'UserId': user.id, 'ExpenseItem': item, 'ExpenseCost': 10,
+            }, content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {issue_token(user.id)}')
+            statuses.append(response.status_code)
+            connection.close()
+
+        threads = [threading.Thread(target=post, args=(f'Item {i}' if i != 3 else None,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [201] * 7 + [400])
+        self.assertEqual(ExpenseDetails.objects.filter(User=user).count(), 7)
+        self.assertEqual(UserMonthlyRollup.objects.get(User=user).ExpenseCount, 7)
+
+
+class BenchCommandSmokeTests(TransactionTestCase):
+    """Each bench command runs end to end at a tiny size with auth at its defaults."""
+
+    def bench(self, name, *args):
+        out = StringIO()
+        call_command(name, *args, stdout=out, stderr=StringIO())
+        return json.loads(out.getvalue())
+
+    def test_bench_writes(self):
+        report = self.bench('bench_writes', '--threads', '1', '--requests', '3', '--users', '2', '--mode', 'direct')
+        self.assertEqual((report['direct']['failed'], report['requests']), (0, 3))
+
+    def test_bench_search(self):
+        report = self.bench('bench_search', '--rows', '50', '--users', '2', '--queries', '5')
+        self.assertEqual(report['queries'], 5)
+
+    def test_bench_alerts(self):
+        report = self.bench('bench_alerts', '--sizes', '5', '--users-per-size', '1', '--requests', '3')
+        self.assertIn('alerts_on', report['sizes']['5'])
+
+    def test_bench_prompts(self):
+        report = self.bench(
+            'bench_prompts', '--sizes', '5', '--users-per-size', '1', '--rounds', '1',
+            '--provider-delay', '0', '--ms-per-token', '0',
+        )
+        self.assertIn('compact', report['sizes']['5'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.routes = []
+
+    def view(self, request):
+        if request.method == 'POST':
+            router.db_for_write(ExpenseDetails)
+        self.routes.append((router.db_for_read(ExpenseDetails), router.db_for_read(InsightJob)))
+        return HttpResponse()
+
+    def call(self, view, method='get', user_id=1):
+        request = getattr(self.factory, method)('/', REMOTE_ADDR='10.0.0.1')
+        request.auth_user_id = user_id
+        middleware = ReplicaRoutingMiddleware(lambda r: middleware.process_view(r, view, (), {}) or view(r))
+        middleware(request)
+        return self.routes[-1]
+
+    def test_marked_views_read_from_replica_until_the_client_writes(self):
+        read_only = replica_reads(lambda request: self.view(request))
+        self.assertEqual(self.call(read_only), ('replica1', 'default'))
+        self.assertEqual(self.call(self.view)[0], 'default')
+        self.assertEqual(router.db_for_read(ExpenseDetails), 'default')
+
+        self.call(self.view, method='post')
+        self.assertEqual(self.call(read_only)[0], 'default')
+        # Same address, different user: not pinned.
+        self.assertEqual(self.call(read_only, user_id=2)[0], 'replica1')
+
+    def test_anonymous_clients_read_from_primary(self):
+        read_only = replica_reads(lambda request: self.view(request))
+        self.assertEqual(self.call(read_only, user_id=None)[0], 'default')
+
+    def test_replicas_require_a_shared_cache(self):
+        errors = check_replica_sticky_cache(None)
+        self.assertEqual([error.id for error in errors], ['expensetracker.E001'])
+
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_replica_sticky_cache(None), [])
+
+
+class AsyncInsightViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        make_expense(self.user, 'Coffee', 50.0, timezone.make_aware(datetime(2024, 1, 10)))
+
+    async def post_insight(self, query=''):
+        request = AsyncRequestFactory().post(f'/api/ai/insights/{self.user.id}/{query}')
+        request.auth_user_id = self.user.id
+        response = await views.expense_ai_insights_async(request, self.user.id)
+        return response.status_code, json.loads(response.content)
+
+    async def test_async_view_awaits_provider_and_caches(self):
+        with mock.patch('expensetracker.providers.acall_provider', return_value=('- Save more', None)) as call:
+            status, first = await self.post_insight()
+            _, second = await self.post_insight()
+
+        self.assertEqual(call.await_count, 1)
+        self.assertEqual((status, first['provider'], first['cached']), (200, 'gemini', False))
+        self.assertEqual((second['insight'], second['cached']), ('- Save more', True))
+
+    @mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'g', 'OPENAI_API_KEY': 'sk-test'})
+    async def test_async_hedge_cancels_the_slower_provider(self):
+        cancelled = []
+
+        async def call(name, prompt, timeout=None):
+            if name == 'openai':
+                return '- fast tip', None
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(name)
+                raise
+
+        with mock.patch('expensetracker.providers.acall_provider', side_effect=call):
+            status, data = await self.post_insight('?provider=hedged&deadline=2')
+            await asyncio.sleep(0)
+
+        self.assertEqual((status, data['provider'], data['insight']), (200, 'openai', '- fast tip'))
+        self.assertEqual(cancelled, ['gemini'])
+
+    async def test_async_middleware_rejects_bad_token(self):
+        response = await self.async_client.get(f'/api/manage-expense/{self.user.id}/', headers={'Authorization': 'Bearer forged'})
+        self.assertEqual(response.status_code, 401)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        make_expense(self.user, 'Coffee', 50.0, timezone.make_aware(datetime(2024, 1, 10)))
+
+    def value(self, name, *labels):
+        return metrics.REGISTRY.collect()[name].get(labels)
+
+    def observed(self, name, *labels):
+        """(count, sum) of a histogram series."""
+        row = self.value(name, *labels)
+        return (row[-1], row[-2]) if row else (0, 0)
+
+    def test_request_latency_and_queries_recorded_by_url_name(self):
+        requests_before, _ = self.observed('expensetracker_http_request_duration_seconds', 'manage-expense', 'GET', '200')
+        _, queries_before = self.observed('expensetracker_db_queries_per_request', 'manage-expense')
+
+        self.client.get(f'/api/manage-expense/{self.user.id}/')
+
+        requests_after, _ = self.observed('expensetracker_http_request_duration_seconds', 'manage-expense', 'GET', '200')
+        _, queries_after = self.observed('expensetracker_db_queries_per_request', 'manage-expense')
+        self.assertEqual(requests_after - requests_before, 1)
+        self.assertGreater(queries_after - queries_before, 0)
+
+    @mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'g'})
+    def test_provider_quota_and_fallback_counted(self):
+        quota = self.value('expensetracker_ai_provider_calls_total', 'gemini', 'quota') or 0
+        fallback = self.value('expensetracker_ai_provider_calls_total', 'gemini', 'fallback') or 0
+        with mock.patch('expensetracker.providers._gemini_request', return_value=('quota', 'Gemini quota exceeded', 60)):
+            data = self.client.post(f'/api/ai/insights/{self.user.id}/').json()
+
+        self.assertEqual(data['provider'], 'fallback')
+        self.assertEqual(self.value('expensetracker_ai_provider_calls_total', 'gemini', 'quota'), quota + 1)
+        self.assertEqual(self.value('expensetracker_ai_provider_calls_total', 'gemini', 'fallback'), fallback + 1)
+
+    def test_endpoint_sums_worker_snapshots(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            local = self.value('expensetracker_ai_provider_calls_total', 'openai', 'error') or 0
+            with open(os.path.join(directory, 'metrics-other-worker.json'), 'w') as handle:
+                json.dump({'expensetracker_ai_provider_calls_total': {'["openai", "error"]': 3}}, handle)
+
+            response = self.client.get('/api/metrics')
+
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertIn(
+            f'expensetracker_ai_provider_calls_total{{provider="openai",outcome="error"}} {local + 3}',
+            response.content.decode(),
+        )
+
+
+@mock.patch.dict(os.environ, {'GEMINI_API_KEY': 'g'})
+@override_settings(AI_RATE_LIMIT_USER_PER_MINUTE=6, AI_RATE_LIMIT_USER_BURST=2, AI_RATE_LIMIT_GLOBAL_PER_MINUTE=0)
+class InsightRateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        sign_in(self.client, self.user)
+        self.other = make_user('other@example.com')
+        for user in (self.user, self.other):
+            make_expense(user, 'Coffee', 50.0, timezone.make_aware(datetime(2024, 1, 10)))
+
+    def post_fresh(self, user):
+        # Each request misses the insight cache, as after a new expense.
+        invalidate_user_insights(user.id)
+        return self.client.post(f'/api/ai/insights/{user.id}/', HTTP_AUTHORIZATION=f'Bearer {issue_token(user.id)}')
+
+    def test_user_over_burst_gets_429_until_a_token_refills(self):
+        with mock.patch('expensetracker.providers.call_gemini', return_value=('- tip', None)) as call:
+            statuses = [self.post_fresh(self.user).status_code for _ in range(3)]
+            refused = self.post_fresh(self.user)
+            other = self.post_fresh(self.other)
+            with mock.patch('expensetracker.ratelimit.time.time', return_value=time.time() + 11):
+                refilled = self.post_fresh(self.user)
+
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual(refused.json()['scope'], 'user')
+        self.assertTrue(1 <= int(refused['Retry-After']) <= 10)
+        self.assertEqual(other.status_code, 200)
+        self.assertEqual(refilled.status_code, 200)
+        self.assertEqual(call.call_count, 4)
+
+    def test_cached_answers_are_not_charged(self):
+        with mock.patch('expensetracker.providers.call_gemini', return_value=('- tip', None)):
+            responses = [self.client.post(f'/api/ai/insights/{self.user.id}/') for _ in range(5)]
+        self.assertEqual([response.status_code for response in responses], [200] * 5)
+
+    @override_settings(AI_RATE_LIMIT_USER_BURST=5, AI_RATE_LIMIT_GLOBAL_PER_MINUTE=60, AI_RATE_LIMIT_GLOBAL_BURST=1)
+    def test_global_refusal_leaves_the_user_bucket_alone(self):
+        with mock.patch('expensetracker.providers.call_gemini', return_value=('- tip', None)):
+            self.assertEqual(self.post_fresh(self.user).status_code, 200)
+            refused = self.post_fresh(self.other)
+        self.assertEqual((refused.status_code, refused.json()['scope']), (429, 'global'))
+        self.assertIsNone(cache.get('ai-rate:user:%d' % self.other.id))
+
+    @override_settings(AI_RATE_LIMIT_FALLBACK=True, AI_RATE_LIMIT_USER_BURST=1)
+    def test_fallback_mode_answers_locally(self):
+        with mock.patch('expensetracker.providers.call_gemini', return_value=('- tip', None)) as call:
+            self.post_fresh(self.user)
+            data = self.post_fresh(self.user).json()
+        self.assertEqual(call.call_count, 1)
+        self.assertEqual((data['provider'], data['rate_limited']), ('fallback', 'user'))
+
+
+@override_settings(SPENDING_ALERT_MIN_SAMPLES=5)
+class SpendingAlertTests(TestCase):
+    def setUp(self):
+        self.user = make_user()
+        sign_in(self.client, self.user)
+
+    def add(self, item, cost, when='2024-03-10'):
+        return self.client.post('/api/add-expense/', {
+            'UserId': self.user.id, 'ExpenseItem': item, 'ExpenseCost': cost, 'ExpenseDate': when,
+        }, content_type='application/json')
+
+    def alerts(self, **params):
+        return self.client.get(f'/api/alerts/{self.user.id}/', params).json()
+
+    def assertStatsMatchExpenses(self):
+        rows = ExpenseDetails.objects.filter(User=self.user).values_list('User_id', 'Category', 'ExpenseCost')
+        expected = stats_for_expenses(rows)
+        stored = {(row.User_id, row.Category): row for row in SpendingStats.objects.filter(User=self.user)}
+        self.assertEqual(set(stored), set(expected))
+        for key, stats in expected.items():
+            self.assertEqual(stored[key].ExpenseCount, stats.count)
+            self.assertAlmostEqual(stored[key].Mean, stats.mean)
+            self.assertAlmostEqual(stored[key].M2, stats.m2)
+
+    def test_unusual_expense_is_flagged_and_polled_by_cursor(self):
+        for cost in (90, 110, 100, 120, 95, 105):
+            self.add('Coffee', cost)
+        self.add('coffee ', 130)
+        self.assertEqual(self.alerts()['alerts'], [])
+
+        cursor = self.alerts()['cursor']
+        self.add('Coffee', 2500)
+        # A category with no history of its own is judged against all spending.
+        self.add('Laptop', 90000)
+        data = self.alerts(since=cursor)
+        self.assertEqual([(a['kind'], a['category']) for a in data['alerts']], [('anomaly', 'coffee'), ('anomaly', 'laptop')])
+        self.assertEqual(data['alerts'][0]['amount'], 2500.0)
+        self.assertLess(data['alerts'][0]['baseline'], 130)
+        self.assertEqual(self.alerts(since=data['cursor'])['alerts'], [])
+        self.assertStatsMatchExpenses()
+
+    def test_edits_deletes_and_rebuild_keep_running_stats_exact(self):
+        self.client.post('/api/add-expense/bulk/', [
+            {'UserId': self.user.id, 'ExpenseItem': item, 'ExpenseCost': cost}
+            for item, cost in [('Tea', 20), ('Tea', 25), ('Taxi', 300), ('Tea', 15), ('Taxi', 250)]
+        ], content_type='application/json')
+        self.assertStatsMatchExpenses()
+
+        tea = ExpenseDetails.objects.filter(User=self.user, ExpenseItem='Tea').order_by('id')
+        self.client.patch(f'/api/expenses/{tea[0].id}/', {'ExpenseCost': 40}, content_type='application/json')
+        self.client.patch(f'/api/expenses/{tea[1].id}/', {'ExpenseItem': 'Taxi'}, content_type='application/json')
+        self.assertStatsMatchExpenses()
+        for expense in ExpenseDetails.objects.filter(User=self.user, ExpenseItem='Taxi'):
+            self.client.delete(f'/api/expenses/{expense.id}/')
+        self.assertStatsMatchExpenses()
+        self.assertFalse(SpendingStats.objects.filter(User=self.user, Category='taxi').exists())
+
+        SpendingStats.objects.filter(User=self.user).update(ExpenseCount=99)
+        call_command('rebuild_rollups', user=[self.user.id], stdout=StringIO())
+        self.assertStatsMatchExpenses()
+
+    def test_budgets_alert_once_per_threshold_crossed(self):
+        self.client.put(f'/api/budgets/{self.user.id}/', {'MonthlyLimit': 1000}, content_type='application/json')
+        self.client.put(f'/api/budgets/{self.user.id}/', {'Category': 'Groceries ', 'MonthlyLimit': 500},
+                        content_type='application/json')
+
+        self.add('Groceries', 300)
+        self.add('Groceries', 150)  # groceries 450 of 500
+        self.add('Rent', 200)
+        self.add('Rent', 150)       # month 800 of 1000
+        self.add('Groceries', 100)  # groceries 550
+        self.add('Rent', 150)       # month 1050
+        self.add('Groceries', 100, when='2024-04-02')
+        alerts = [(a['category'], a['month'], a['message'].split(', ')[1].split(' your')[0]) for a in self.alerts()['alerts']]
+        self.assertEqual(alerts, [
+            ('groceries', '2024-03', 'at 80% of'),
+            ('', '2024-03', 'at 80% of'),
+            ('groceries', '2024-03', 'over'),
+            ('', '2024-03', 'over'),
+        ])
+
+        # Moving an expense out of the month takes the spend back under; moving it in again re-alerts.
+        rent = ExpenseDetails.objects.filter(User=self.user, ExpenseItem='Rent').first()
+        self.client.patch(f'/api/expenses/{rent.id}/', {'ExpenseDate': '2024-05-01'}, content_type='application/json')
+        self.client.patch(f'/api/expenses/{rent.id}/', {'ExpenseDate': '2024-03-11'}, content_type='application/json')
+        self.assertEqual(len(self.alerts()['alerts']), 5)
+
+        self.client.put(f'/api/budgets/{self.user.id}/', {'Category': 'groceries', 'MonthlyLimit': None},
+                        content_type='application/json')
+        budgets = self.client.get(f'/api/budgets/{self.user.id}/').json()['budgets']
+        self.assertEqual([(b['category'], b['monthly_limit']) for b in budgets], [('', 1000.0)])
+        bad = self.client.put(f'/api/budgets/{self.user.id}/', {'MonthlyLimit': 'lots'}, content_type='application/json')
+        self.assertEqual(bad.status_code, 400)
+
+    def test_malformed_budget_bodies_get_field_errors(self):
+        url = f'/api/budgets/{self.user.id}/'
+        self.assertEqual(self.client.put(url, [1000], content_type='application/json').status_code, 400)
+        bad = self.client.put(url, {'Category': 5, 'MonthlyLimit': 'Infinity'}, content_type='application/json')
+        self.assertEqual((bad.status_code, set(bad.json()['errors'])), (400, {'Category', 'MonthlyLimit'}))
+        self.assertFalse(UserBudget.objects.filter(User=self.user).exists())
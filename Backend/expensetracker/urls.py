@@ -1,12 +1,28 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_VIEWS:
+    ai_insights, ai_job, ai_job_stream = views.expense_ai_insights_async, views.insight_job_async, views.insight_job_stream_async
+else:
+    ai_insights, ai_job, ai_job_stream = views.expense_ai_insights, views.insight_job, views.insight_job_stream
+
 urlpatterns = [
     path("signup/", views.signup , name="signup"),
     path("login/", views.login , name="login"),
     path("add-expense/", views.add_expense , name="add-expense"),
+    path("add-expense/bulk/", views.bulk_add_expense , name="bulk-add-expense"),
     path("manage-expense/<int:user_id>/", views.manage_expense , name="manage-expense"),
+    path("export/<int:user_id>/", views.export_expenses , name="export-expenses"),
+    path("search/<int:user_id>/", views.expense_search , name="expense-search"),
+    path("summary/<int:user_id>/", views.expense_summary , name="expense-summary"),
+    path("expenses/changes/", views.expense_changes , name="expense-changes"),
     path("expenses/<int:expense_id>/", views.expense_detail , name="expense-detail"),
-    path("ai/insights/<int:user_id>/", views.expense_ai_insights , name="expense-ai-insights"),
+    path("budgets/<int:user_id>/", views.user_budgets , name="user-budgets"),
+    path("alerts/<int:user_id>/", views.spending_alerts , name="spending-alerts"),
+    path("ai/insights/<int:user_id>/", ai_insights , name="expense-ai-insights"),
+    path("ai/jobs/<int:job_id>/", ai_job , name="insight-job"),
+    path("ai/jobs/<int:job_id>/stream/", ai_job_stream , name="insight-job-stream"),
+    path("metrics", views.metrics , name="metrics"),
 
 ]
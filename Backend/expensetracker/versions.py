@@ -0,0 +1,47 @@
+import hashlib
+
+from django.db import connection
+from django.db.models import F
+
+from .auth import authorize
+from .models import UserDetails
+
+
+def bump_data_version(*user_ids):
+    """Mark users' expense data as changed and return ``{user_id: new version}``.
+
+    Run inside the write's transaction. The UPDATE locks each user row until
+    commit, so a user's versions commit in order and double as the change
+    sequence stamped on rows and tombstones for delta sync.
+    """
+    if connection.features.can_return_columns_from_insert:
+        # UPDATE ... RETURNING bumps and reads back in one statement.
+        table = connection.ops.quote_name(UserDetails._meta.db_table)
+        column = connection.ops.quote_name('DataVersion')
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET {column} = {column} + 1 WHERE id IN ({placeholders}) RETURNING id, {column}',
+                list(user_ids),
+            )
+            return dict(cursor.fetchall())
+
+    users = UserDetails.objects.filter(id__in=user_ids)
+    users.update(DataVersion=F('DataVersion') + 1)
+    return dict(users.values_list('id', 'DataVersion'))
+
+
+def user_data_etag(request, user_id, **kwargs):
+    """ETag for a per-user read endpoint: one primary-key lookup, no list query.
+
+    The query string is folded in because filters and page size change the
+    body. Returns None (no ETag, view runs normally) for unknown users or
+    callers the view is going to refuse anyway.
+    """
+    if request.method not in ('GET', 'HEAD') or authorize(request, user_id) is not None:
+        return None
+    version = UserDetails.objects.filter(id=user_id).values_list('DataVersion', flat=True).first()
+    if version is None:
+        return None
+    params = hashlib.sha1(request.GET.urlencode().encode()).hexdigest()[:12] if request.GET else '0'
+    return f'"{request.resolver_match.url_name}-{user_id}-{version}-{params}"'
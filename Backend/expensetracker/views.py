@@ -1,12 +1,34 @@
+import base64
+import binascii
+import csv
 import json
-import os
-from collections import Counter
+from datetime import datetime, time
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render
-from django.http import HttpResponse , JsonResponse
+from django.urls import reverse
+from django.http import HttpResponse , JsonResponse , StreamingHttpResponse
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from django.db import transaction
+from django.db.models import Min, Q, Sum
 from django.utils import timezone
-import requests
-from . models import UserDetails , ExpenseDetails
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.text import compress_sequence
+from . import metrics as request_metrics
+from .alerts import check_edited_expense, check_new_expenses, forget_expense, invalidate_user_budgets
+from .auth import UserRecord, authorize, get_user_record, issue_token, require_token, user_records
+from .fields import from_minor, to_minor
+from . models import UserDetails , ExpenseDetails , ExpenseTombstone , UserMonthlyRollup , UserMonthlyItemRollup , InsightJob , SpendingAlert , UserBudget , normalize_category
+from .insights import agenerate_insight, aget_cached_insight, expense_fingerprint, generate_insight, get_cached_insight, insight_cache_key, invalidate_user_insights, local_insight
+from .jobs import ajob_event_stream, enqueue_insight_job, job_event_stream, job_payload
+from .rollups import add_to_rollups, month_bounds, month_of, remove_from_rollups
+from .ratelimit import atake_insight_token, retry_after_header, take_insight_token
+from .routers import replica_reads
+from .search import search_expenses
+from .versions import bump_data_version, user_data_etag
+from .writer import WriteTimeout, get_expense_writer, insert_expenses
 
 
 
@@ -37,7 +59,11 @@ def login(request):
 
       try:
          user = UserDetails.objects.get(Email=email, Password=password)
-         return JsonResponse({'message': 'Login successful' , 'userId': user.id , 'userName': user.Fullname , 'userEmail': user.Email }, status=201)
+         user_records.put(UserRecord(user.id, user.Fullname, user.Email))
+         return JsonResponse({
+             'message': 'Login successful', 'userId': user.id, 'userName': user.Fullname, 'userEmail': user.Email,
+             'token': issue_token(user.id), 'expiresIn': settings.AUTH_TOKEN_MAX_AGE,
+         }, status=201)
       except UserDetails.DoesNotExist:
          return JsonResponse({'message': 'Invalid email or password'}, status=400)
        
@@ -49,47 +75,537 @@ def add_expense(request):
         except json.JSONDecodeError:
             return JsonResponse({'message': 'Invalid JSON format'}, status=400)
 
-        user_id = data.get('UserId')
+        # A signed-in client may omit UserId; the token already names the user.
+        user_id = data.get('UserId') or getattr(request, 'auth_user_id', None)
         if not user_id or not str(user_id).isdigit():
             return JsonResponse({'message': 'Invalid user ID format'}, status=400)
+        denied = authorize(request, user_id)
+        if denied:
+            return denied
 
         try:
-            user = UserDetails.objects.get(id=user_id)
-            ExpenseDetails.objects.create(
-                User=user,   # <-- IMPORTANT FIX
-                ExpenseDate=data.get('ExpenseDate'),
-                ExpenseItem=data.get('ExpenseItem'),
-                ExpenseCost=data.get('ExpenseCost')
+            expense_date = _parse_expense_date(data.get('ExpenseDate'))
+        except ValueError:
+            return JsonResponse({'message': 'Invalid ExpenseDate value'}, status=400)
+        item_error = _item_error(data.get('ExpenseItem'))
+        if item_error:
+            return JsonResponse({'message': item_error, 'errors': {'ExpenseItem': item_error}}, status=400)
+        try:
+            expense_cost = _clean_cost(data.get('ExpenseCost'))
+        except ValueError:
+            return JsonResponse(
+                {'message': 'Invalid ExpenseCost value', 'errors': {'ExpenseCost': 'Invalid ExpenseCost value'}},
+                status=400,
             )
-            return JsonResponse({'message': 'Expense added successfully'}, status=201)
 
-        except UserDetails.DoesNotExist:
+        # The per-process user cache answers this without a query once warm,
+        # and the insert sets the FK by id instead of loading the user row.
+        if get_user_record(user_id) is None:
             return JsonResponse({'message': 'User does not exist'}, status=400)
+
+        try:
+            if settings.EXPENSE_WRITE_MODE == 'coalesce':
+                get_expense_writer().save(ExpenseDetails(
+                    User_id=int(user_id),
+                    ExpenseDate=expense_date,
+                    ExpenseItem=data.get('ExpenseItem'),
+                    ExpenseCost=expense_cost,
+                ), timeout=settings.EXPENSE_WRITE_TIMEOUT)
+                return JsonResponse({'message': 'Expense added successfully'}, status=201)
+
+            with transaction.atomic():
+                versions = bump_data_version(int(user_id))
+                expense = ExpenseDetails.objects.create(
+                    User_id=int(user_id),
+                    ExpenseDate=expense_date,
+                    ExpenseItem=data.get('ExpenseItem'),
+                    ExpenseCost=expense_cost,
+                    ChangeSeq=versions[int(user_id)],
+                )
+                add_to_rollups(expense.User_id, expense.ExpenseDate, expense.ExpenseItem, expense.ExpenseCost)
+                check_new_expenses([expense])
+            invalidate_user_insights(expense.User_id)
+            return JsonResponse({'message': 'Expense added successfully'}, status=201)
+
+        except WriteTimeout as e:
+            return JsonResponse({'message': str(e)}, status=503)
         except Exception as e:
             return JsonResponse({'message': 'An error occurred', 'error': str(e)}, status=400)
 
     return JsonResponse({'message': 'Invalid request method'}, status=405)
 
    
+BULK_EXPENSE_MAX_ROWS = 5000
+BULK_EXPENSE_CHUNK_SIZE = 500
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+
+def _item_error(value):
+    """Return why ``value`` can't be an ExpenseItem, or None if it can."""
+    if not isinstance(value, str) or not value.strip():
+        return 'ExpenseItem is required'
+    if len(value) > ExpenseDetails._meta.get_field('ExpenseItem').max_length:
+        return 'ExpenseItem is too long'
+    return None
+
+
+def _clean_cost(value):
+    """Return ``value`` as float rupees; raises ValueError unless it is an amount MoneyField can store."""
+    if isinstance(value, bool):
+        raise ValueError(f'Invalid amount: {value!r}')
+    return from_minor(to_minor(value))
+
+
+def _parse_expense_date(value):
+    if value in (None, ''):
+        return timezone.now()
+    return _parse_date_bound(str(value))
+
+
+def _read_bulk_rows(request):
+    """Return (rows, parse_errors) from a JSON array or NDJSON body."""
+    if request.content_type in NDJSON_CONTENT_TYPES:
+        rows, errors = [], {}
+        for line in request.body.decode('utf-8').splitlines():
+            if not line.strip():
+                continue
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                errors[len(rows)] = 'Invalid JSON line'
+                rows.append(None)
+        return rows, errors
+
+    data = json.loads(request.body)
+    if isinstance(data, dict):
+        data = data.get('expenses')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of expenses')
+    return data, {}
+
+
+def _clean_bulk_row(row, token_user_id=None):
+    if not isinstance(row, dict):
+        return None, {'row': 'Expected an object'}
+
+    errors = {}
+    user_id = row.get('UserId') or token_user_id
+    if not user_id or not str(user_id).isdigit():
+        errors['UserId'] = 'Invalid user ID format'
+    elif token_user_id is not None and int(user_id) != token_user_id:
+        errors['UserId'] = 'Not allowed for this user'
+
+    item = row.get('ExpenseItem')
+    if _item_error(item):
+        errors['ExpenseItem'] = _item_error(item)
+
+    try:
+        cost = _clean_cost(row.get('ExpenseCost'))
+    except ValueError:
+        errors['ExpenseCost'] = 'Invalid ExpenseCost value'
+
+    try:
+        expense_date = _parse_expense_date(row.get('ExpenseDate'))
+    except ValueError:
+        errors['ExpenseDate'] = 'Invalid ExpenseDate value'
+
+    if errors:
+        return None, errors
+    return ExpenseDetails(User_id=int(user_id), ExpenseDate=expense_date, ExpenseItem=item, ExpenseCost=cost), None
+
+
 @csrf_exempt
+def bulk_add_expense(request):
+    if request.method != 'POST':
+        return JsonResponse({'message': 'Invalid request method'}, status=405)
+    token_user_id = getattr(request, 'auth_user_id', None)
+    denied = require_token(request)
+    if denied:
+        return denied
+
+    try:
+        rows, parse_errors = _read_bulk_rows(request)
+    except (json.JSONDecodeError, UnicodeDecodeError, ValueError) as e:
+        return JsonResponse({'message': 'Invalid JSON format', 'error': str(e)}, status=400)
+
+    if not rows:
+        return JsonResponse({'message': 'No expenses provided'}, status=400)
+    if len(rows) > BULK_EXPENSE_MAX_ROWS:
+        return JsonResponse({'message': f'At most {BULK_EXPENSE_MAX_ROWS} expenses per request'}, status=413)
+
+    results = [None] * len(rows)
+    pending = []
+    for index, row in enumerate(rows):
+        if index in parse_errors:
+            results[index] = {'index': index, 'status': 'rejected', 'errors': {'row': parse_errors[index]}}
+            continue
+        expense, errors = _clean_bulk_row(row, token_user_id)
+        if errors:
+            results[index] = {'index': index, 'status': 'rejected', 'errors': errors}
+        else:
+            pending.append((index, expense))
+
+    # The user cache answers known ids; the rest are checked in one query.
+    known_users = user_records.get_many({expense.User_id for _, expense in pending})
+    valid = []
+    for index, expense in pending:
+        if expense.User_id in known_users:
+            valid.append((index, expense))
+        else:
+            results[index] = {'index': index, 'status': 'rejected', 'errors': {'UserId': 'User does not exist'}}
+
+    for start in range(0, len(valid), BULK_EXPENSE_CHUNK_SIZE):
+        chunk = valid[start:start + BULK_EXPENSE_CHUNK_SIZE]
+        expenses = [expense for _, expense in chunk]
+        try:
+            with transaction.atomic():
+                insert_expenses(expenses)
+        except Exception:
+            # One bad row must not reject the rows chunked with it; retry
+            # each on its own so only the failing ones carry an error.
+            inserted = []
+            for index, expense in chunk:
+                expense.pk = None
+                try:
+                    with transaction.atomic():
+                        insert_expenses([expense])
+                except Exception as e:
+                    results[index] = {'index': index, 'status': 'rejected', 'errors': {'row': str(e)}}
+                else:
+                    inserted.append((index, expense))
+            chunk, expenses = inserted, [expense for _, expense in inserted]
+        for index, expense in chunk:
+            results[index] = {'index': index, 'status': 'accepted', 'id': expense.id}
+        for user_id in {expense.User_id for expense in expenses}:
+            invalidate_user_insights(user_id)
+
+    accepted = sum(1 for result in results if result['status'] == 'accepted')
+    return JsonResponse({
+        'message': f'{accepted} of {len(rows)} expenses added',
+        'accepted': accepted,
+        'rejected': len(rows) - accepted,
+        'results': results,
+    }, status=201 if accepted else 400)
+
+
+EXPENSE_PAGE_SIZE = 50
+EXPENSE_PAGE_SIZE_MAX = 500
+
+
+def _encode_cursor(expense_date, expense_id):
+    # Undated expenses sort last; their cursor has an empty date part.
+    raw = f"{expense_date.isoformat() if expense_date else ''}|{expense_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    raw = base64.urlsafe_b64decode(padded.encode()).decode()
+    date_part, id_part = raw.rsplit('|', 1)
+    expense_date = parse_datetime(date_part) if date_part else None
+    if (date_part and expense_date is None) or not id_part.isdigit():
+        raise ValueError('Malformed cursor')
+    return expense_date, int(id_part)
+
+
+def _parse_date_bound(value, end_of_day=False):
+    # A bare date covers the whole day; parse_datetime would read it as midnight.
+    day = parse_date(value) if len(value) == 10 else None
+    if day is not None:
+        parsed = datetime.combine(day, time.max if end_of_day else time.min)
+    else:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f'Invalid date: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _filter_expenses(queryset, params):
+    # Date and cost bounds are all range predicates on the (User, ExpenseDate, id)
+    # index or cheap residual filters on the rows it yields; a category filter
+    # is an equality lookup on the (User, Category) index.
+    if params.get('category'):
+        queryset = queryset.filter(Category=normalize_category(params['category']))
+    if params.get('start_date'):
+        queryset = queryset.filter(ExpenseDate__gte=_parse_date_bound(params['start_date']))
+    if params.get('end_date'):
+        queryset = queryset.filter(ExpenseDate__lte=_parse_date_bound(params['end_date'], end_of_day=True))
+    if params.get('min_cost'):
+        queryset = queryset.filter(ExpenseCost__gte=float(params['min_cost']))
+    if params.get('max_cost'):
+        queryset = queryset.filter(ExpenseCost__lte=float(params['max_cost']))
+    return queryset
+
+
+def _paginate_expenses(queryset, params):
+    limit = int(params.get('limit') or EXPENSE_PAGE_SIZE)
+    limit = max(1, min(limit, EXPENSE_PAGE_SIZE_MAX))
+
+    # Dated rows come first, newest-first on the (User, ExpenseDate, id) index;
+    # undated rows follow by id once they run out. The phases are separate
+    # queries so each one stays a bounded index seek.
+    dated = queryset.filter(ExpenseDate__isnull=False).order_by('-ExpenseDate', '-id')
+    undated = queryset.filter(ExpenseDate__isnull=True).order_by('-id')
+    if params.get('cursor'):
+        last_date, last_id = _decode_cursor(params['cursor'])
+        if last_date is None:
+            dated = None
+            undated = undated.filter(id__lt=last_id)
+        else:
+            # ExpenseDate <= last_date bounds the index range scan; the OR only
+            # breaks ties between rows sharing the boundary timestamp.
+            dated = dated.filter(ExpenseDate__lte=last_date).filter(
+                Q(ExpenseDate__lt=last_date) | Q(id__lt=last_id)
+            )
+
+    rows = list(dated[:limit + 1]) if dated is not None else []
+    if len(rows) <= limit:
+        rows += list(undated[:limit + 1 - len(rows)])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = _encode_cursor(rows[-1]['ExpenseDate'], rows[-1]['id']) if has_more else None
+    return rows, next_cursor
+
+
+# Browsers keep these responses but revalidate each time; an unchanged
+# DataVersion answers If-None-Match with 304 before the view body runs.
+@csrf_exempt
+@replica_reads
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=user_data_etag)
 def manage_expense(request, user_id):
+    denied = authorize(request, user_id)
+    if denied:
+        return denied
     if request.method == 'GET':
+        params = request.GET
         try:
-            expenses = ExpenseDetails.objects.filter(User_id=user_id).values(
+            expenses = _filter_expenses(ExpenseDetails.objects.filter(User_id=user_id), params).values(
                 'id', 'ExpenseDate', 'ExpenseItem', 'ExpenseCost'
             )
-            return JsonResponse({'expenses': list(expenses)}, status=200)
-        except Exception as e:
-            return JsonResponse({'message': 'Error fetching expenses', 'error': str(e)}, status=400)
+        except (TypeError, ValueError) as e:
+            return JsonResponse({'message': 'Invalid filter value', 'error': str(e)}, status=400)
+
+        # Without paging parameters keep returning the whole list for older clients.
+        if 'limit' not in params and 'cursor' not in params:
+            try:
+                return JsonResponse({'expenses': list(expenses)}, status=200)
+            except Exception as e:
+                return JsonResponse({'message': 'Error fetching expenses', 'error': str(e)}, status=400)
+
+        # The first page also hands out a delta-sync cursor, read before the
+        # rows so nothing written in between can be missed.
+        sync_cursor = None
+        if 'cursor' not in params:
+            sync_cursor = UserDetails.objects.filter(id=user_id).values_list('DataVersion', flat=True).first()
+
+        try:
+            rows, next_cursor = _paginate_expenses(expenses, params)
+        except (TypeError, ValueError, UnicodeDecodeError, binascii.Error) as e:
+            return JsonResponse({'message': 'Invalid pagination parameters', 'error': str(e)}, status=400)
+
+        payload = {
+            'expenses': rows,
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+        }
+        if sync_cursor is not None:
+            payload['sync_cursor'] = str(sync_cursor)
+        return JsonResponse(payload, status=200)
 
     return JsonResponse({'message': 'Invalid request method'}, status=405)
 
+@csrf_exempt
+@replica_reads
+def expense_search(request, user_id):
+    if request.method != 'GET':
+        return JsonResponse({'message': 'Invalid request method'}, status=405)
+    denied = authorize(request, user_id)
+    if denied:
+        return denied
+
+    text = (request.GET.get('q') or '').strip()
+    if not text:
+        return JsonResponse({'message': 'Search text is required'}, status=400)
+
+    try:
+        expenses = search_expenses(ExpenseDetails.objects.filter(User_id=user_id), user_id, text)
+        expenses = _filter_expenses(expenses, request.GET).values('id', 'ExpenseDate', 'ExpenseItem', 'ExpenseCost')
+        rows, next_cursor = _paginate_expenses(expenses, request.GET)
+    except (TypeError, ValueError, UnicodeDecodeError, binascii.Error) as e:
+        return JsonResponse({'message': 'Invalid search parameters', 'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'expenses': rows,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+    }, status=200)
+
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FIELDS = ('id', 'ExpenseDate', 'ExpenseItem', 'ExpenseCost')
+
+
+class _Echo:
+    # csv.writer wants a file; hand each formatted line straight back instead.
+    def write(self, value):
+        return value
+
+
+def _export_csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for expense_id, expense_date, item, cost in rows:
+        yield writer.writerow([expense_id, expense_date.isoformat() if expense_date else '', item, cost])
+
+
+def _export_ndjson_lines(rows):
+    for expense_id, expense_date, item, cost in rows:
+        yield json.dumps({
+            'id': expense_id,
+            'ExpenseDate': expense_date.isoformat() if expense_date else None,
+            'ExpenseItem': item,
+            'ExpenseCost': cost,
+        }) + '\n'
+
+
+def _batched(lines, size):
+    # Join lines into larger writes so each chunk is not one tiny socket send.
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield ''.join(batch).encode('utf-8')
+            batch = []
+    if batch:
+        yield ''.join(batch).encode('utf-8')
+
+
+@csrf_exempt
+def export_expenses(request, user_id):
+    if request.method != 'GET':
+        return JsonResponse({'message': 'Invalid request method'}, status=405)
+    denied = authorize(request, user_id)
+    if denied:
+        return denied
+
+    export_format = (request.GET.get('format') or 'csv').lower()
+    if export_format not in ('csv', 'ndjson'):
+        return JsonResponse({'message': 'Unsupported export format'}, status=400)
+
+    try:
+        expenses = _filter_expenses(ExpenseDetails.objects.filter(User_id=user_id), request.GET)
+    except (TypeError, ValueError) as e:
+        return JsonResponse({'message': 'Invalid filter value', 'error': str(e)}, status=400)
+
+    # iterator() streams rows from the cursor in chunks instead of caching the
+    # whole queryset, so memory stays flat however long the history is.
+    rows = expenses.order_by('ExpenseDate', 'id').values_list(*EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    lines = _export_csv_lines(rows) if export_format == 'csv' else _export_ndjson_lines(rows)
+    content = _batched(lines, 500)
+
+    use_gzip = 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '') and request.GET.get('gzip') != '0'
+    if use_gzip:
+        content = compress_sequence(content)
+
+    content_type = 'text/csv; charset=utf-8' if export_format == 'csv' else 'application/x-ndjson'
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="expenses-{user_id}.{export_format}"'
+    response['Vary'] = 'Accept-Encoding'
+    if use_gzip:
+        response['Content-Encoding'] = 'gzip'
+    return response
+
+
+SUMMARY_MONTHS = 6
+SUMMARY_MONTHS_MAX = 24
+SUMMARY_TOP_ITEMS = 6
+SUMMARY_TOP_ITEMS_MAX = 20
+SUMMARY_RECENT = 5
+
+
+@csrf_exempt
+@replica_reads
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=user_data_etag)
+def expense_summary(request, user_id):
+    if request.method != 'GET':
+        return JsonResponse({'message': 'Invalid request method'}, status=405)
+    denied = authorize(request, user_id)
+    if denied:
+        return denied
+
+    try:
+        months = max(1, min(int(request.GET.get('months') or SUMMARY_MONTHS), SUMMARY_MONTHS_MAX))
+        top = max(1, min(int(request.GET.get('top') or SUMMARY_TOP_ITEMS), SUMMARY_TOP_ITEMS_MAX))
+    except ValueError:
+        return JsonResponse({'message': 'Invalid summary parameters'}, status=400)
+
+    # Totals, the monthly series and the month holding the top expense all come
+    # from the rollup table, which has one row per month rather than per expense.
+    rollups = list(
+        UserMonthlyRollup.objects.filter(User_id=user_id)
+        .order_by('Month')
+        .values('Month', 'ExpenseCount', 'TotalCost', 'MaxCost')
+    )
+    # Month totals are exact paise, so add them as integers before converting.
+    total = from_minor(sum(to_minor(row['TotalCost']) for row in rollups))
+    count = sum(row['ExpenseCount'] for row in rollups)
+
+    highest = None
+    if rollups:
+        peak = max(rollups, key=lambda row: row['MaxCost'])
+        start, end = month_bounds(peak['Month'])
+        highest = (
+            ExpenseDetails.objects.filter(
+                User_id=user_id, ExpenseDate__gte=start, ExpenseDate__lt=end, ExpenseCost=peak['MaxCost']
+            )
+            .order_by('-id')
+            .values('id', 'ExpenseDate', 'ExpenseItem', 'ExpenseCost')
+            .first()
+        )
+
+    top_items = list(
+        UserMonthlyItemRollup.objects.filter(User_id=user_id)
+        .values('Category')
+        .annotate(label=Min('ExpenseItem'), total=Sum('TotalCost'), count=Sum('ExpenseCount'))
+        .order_by('-total', 'Category')[:top]
+    )
+
+    recent = list(
+        ExpenseDetails.objects.filter(User_id=user_id)
+        .order_by('-ExpenseDate', '-id')
+        .values('id', 'ExpenseDate', 'ExpenseItem', 'ExpenseCost')[:SUMMARY_RECENT]
+    )
+
+    return JsonResponse({
+        'total_expenses': round(total, 2),
+        'expense_count': count,
+        'average_expense': round(total / count, 2) if count else 0,
+        'highest_expense': highest,
+        'monthly_totals': [
+            {'month': row['Month'].strftime('%Y-%m'), 'total': round(row['TotalCost'], 2), 'count': row['ExpenseCount']}
+            for row in rollups[-months:]
+        ],
+        'top_items': [
+            {'item': row['label'], 'category': row['Category'], 'total': round(row['total'], 2), 'count': row['count']}
+            for row in top_items
+        ],
+        'recent_expenses': recent,
+    }, status=200)
+
+
 @csrf_exempt
 def expense_detail(request, expense_id):
     try:
         expense = ExpenseDetails.objects.get(id=expense_id)
     except ExpenseDetails.DoesNotExist:
         return JsonResponse({'message': 'Expense not found'}, status=404)
+    denied = authorize(request, expense.User_id)
+    if denied:
+        return denied
 
     if request.method in ['PUT', 'PATCH']:
         try:
@@ -99,212 +615,423 @@ def expense_detail(request, expense_id):
 
         expense_item = data.get('ExpenseItem')
         expense_cost = data.get('ExpenseCost')
+        expense_date = data.get('ExpenseDate')
 
-        if expense_item is None and expense_cost is None:
+        if expense_item is None and expense_cost is None and expense_date is None:
             return JsonResponse({'message': 'No fields provided for update'}, status=400)
 
+        previous = (expense.ExpenseDate, expense.ExpenseItem, expense.ExpenseCost)
+
+        if expense_date is not None:
+            try:
+                expense.ExpenseDate = _parse_date_bound(str(expense_date))
+            except ValueError:
+                return JsonResponse({'message': 'Invalid ExpenseDate value'}, status=400)
+
         if expense_item is not None:
+            item_error = _item_error(expense_item)
+            if item_error:
+                return JsonResponse({'message': item_error, 'errors': {'ExpenseItem': item_error}}, status=400)
             expense.ExpenseItem = expense_item
 
         if expense_cost is not None:
             try:
-                expense.ExpenseCost = float(expense_cost)
-            except (TypeError, ValueError):
-                return JsonResponse({'message': 'Invalid ExpenseCost value'}, status=400)
+                expense.ExpenseCost = _clean_cost(expense_cost)
+            except ValueError:
+                return JsonResponse(
+                    {'message': 'Invalid ExpenseCost value', 'errors': {'ExpenseCost': 'Invalid ExpenseCost value'}},
+                    status=400,
+                )
 
-        expense.save()
+        with transaction.atomic():
+            expense.ChangeSeq = bump_data_version(expense.User_id)[expense.User_id]
+            expense.save()
+            # Re-file the expense so edits that change month, item or cost
+            # leave both the old and new rollup buckets correct.
+            remove_from_rollups(expense.User_id, *previous)
+            add_to_rollups(expense.User_id, expense.ExpenseDate, expense.ExpenseItem, expense.ExpenseCost)
+            check_edited_expense(expense, previous)
+        invalidate_user_insights(expense.User_id)
         return JsonResponse({'message': 'Expense updated successfully'}, status=200)
 
     if request.method == 'DELETE':
-        expense.delete()
+        with transaction.atomic():
+            expense_id = expense.id
+            change_seq = bump_data_version(expense.User_id)[expense.User_id]
+            expense.delete()
+            ExpenseTombstone.objects.create(User_id=expense.User_id, ExpenseId=expense_id, ChangeSeq=change_seq)
+            remove_from_rollups(expense.User_id, expense.ExpenseDate, expense.ExpenseItem, expense.ExpenseCost)
+            forget_expense(expense.User_id, expense.ExpenseItem, expense.ExpenseCost)
+        invalidate_user_insights(expense.User_id)
         return JsonResponse({'message': 'Expense deleted successfully'}, status=200)
 
     return JsonResponse({'message': 'Invalid request method'}, status=405)
 
 
+CHANGES_PAGE_SIZE = 500
+CHANGES_PAGE_SIZE_MAX = 5000
+
+
+def _parse_change_cursor(value):
+    # "<seq>" resumes after a whole change sequence; "<seq>.<id>" resumes
+    # part-way through one, e.g. a bulk insert that shares a single sequence.
+    seq, _, last_id = value.partition('.')
+    return int(seq), int(last_id) if last_id else None
+
+
 @csrf_exempt
-def expense_ai_insights(request, user_id):
-    if request.method != 'POST':
+@replica_reads
+def expense_changes(request):
+    if request.method != 'GET':
         return JsonResponse({'message': 'Invalid request method'}, status=405)
 
-    expenses = list(
-        ExpenseDetails.objects.filter(User_id=user_id)
-        .order_by('-ExpenseDate')
-        .values('ExpenseDate', 'ExpenseItem', 'ExpenseCost')[:100]
-    )
+    user_id = getattr(request, 'auth_user_id', None) or request.GET.get('user_id')
+    if not user_id or not str(user_id).isdigit():
+        return JsonResponse({'message': 'Invalid user ID format'}, status=400)
+    denied = authorize(request, user_id)
+    if denied:
+        return denied
 
-    if not expenses:
-        return JsonResponse({'message': 'No expenses found for user', 'provider': 'none'}, status=404)
+    since = request.GET.get('since')
+    try:
+        limit = max(1, min(int(request.GET.get('limit') or CHANGES_PAGE_SIZE), CHANGES_PAGE_SIZE_MAX))
+        since_seq, since_id = _parse_change_cursor(since) if since else (None, None)
+    except ValueError:
+        return JsonResponse({'message': 'Invalid sync parameters'}, status=400)
 
-    total_expenses = sum(float(e.get('ExpenseCost') or 0) for e in expenses)
-    avg_expense = total_expenses / len(expenses) if expenses else 0
+    # Everything is read up to the version seen now; later writes carry a
+    # higher sequence and are picked up by the next call.
+    version = UserDetails.objects.filter(id=user_id).values_list('DataVersion', flat=True).first()
+    if version is None:
+        return JsonResponse({'message': 'User does not exist'}, status=404)
 
-    def generate_fallback_insights():
-        costs = [float(e.get('ExpenseCost') or 0) for e in expenses if e.get('ExpenseCost') is not None]
-        items = [(e.get('ExpenseItem') or 'Other').strip() or 'Other' for e in expenses]
-        item_totals = {}
-        for e in expenses:
-            key = (e.get('ExpenseItem') or 'Other').strip() or 'Other'
-            try:
-                item_totals[key] = item_totals.get(key, 0) + float(e.get('ExpenseCost') or 0)
-            except Exception:
-                pass
-
-        top_items = sorted(item_totals.items(), key=lambda kv: kv[1], reverse=True)[:3]
-        frequent_items = Counter(items).most_common(2)
-        small_spends = [c for c in costs if c < (avg_expense * 0.5 if avg_expense else 0)]
-
-        lines = []
-        if top_items:
-            parts = [f"{name}: ₹{amt:,.0f}" for name, amt in top_items]
-            lines.append(f"Top spend categories -> {', '.join(parts)}.")
-        if frequent_items:
-            freq = [f"{name} x{cnt}" for name, cnt in frequent_items]
-            lines.append(f"Most frequent items -> {', '.join(freq)}.")
-        if small_spends and len(small_spends) >= 3:
-            lines.append("Many small purchases detected; try batching or weekly caps.")
-        if avg_expense:
-            lines.append(f"Average per expense: ₹{avg_expense:,.0f}. Set a per-purchase limit to stay on budget.")
-        lines.append("Pick one top category and aim to trim 10-15% this month.")
-
-        return "\n".join(f"- {line}" for line in lines) if lines else "- Keep tracking; not enough data for insights yet."
-
-    def build_prompt():
-        summary_lines = [
-            f"Total expenses: ₹{total_expenses:,.2f}",
-            f"Average per expense: ₹{avg_expense:,.2f}",
-            f"Expense count: {len(expenses)}",
-        ]
-        top_counts = Counter((e.get('ExpenseItem') or 'Other').strip() or 'Other' for e in expenses).most_common(5)
-        if top_counts:
-            summary_lines.append(
-                "Top items: " + ", ".join([f"{name} x{cnt}" for name, cnt in top_counts])
-            )
-        details = "\n".join(
-            [f"- {e.get('ExpenseItem') or 'Item'} | ₹{float(e.get('ExpenseCost') or 0):.2f}" for e in expenses[:30]]
-        )
-        prompt = (
-            "You are a concise financial coach."
-            " Give 3-5 bullet insights and 2 actionable suggestions tailored to the data."
-            " Avoid repeating the raw numbers; focus on patterns and next steps."
-            " Keep it under 120 words."
-            f"\nSummary:\n{os.linesep.join(summary_lines)}\nDetails:\n{details}"
+    rows = ExpenseDetails.objects.filter(User_id=user_id, ChangeSeq__lte=version)
+    if since_seq is not None:
+        after = Q(ChangeSeq__gt=since_seq)
+        if since_id is not None:
+            after |= Q(ChangeSeq=since_seq, id__gt=since_id)
+        rows = rows.filter(ChangeSeq__gte=since_seq).filter(after)
+    rows = list(
+        rows.order_by('ChangeSeq', 'id')
+        .values('id', 'ExpenseDate', 'ExpenseItem', 'ExpenseCost', 'UpdatedAt', 'ChangeSeq')[:limit + 1]
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    upper = rows[-1]['ChangeSeq'] if has_more else version
+
+    # Without a cursor the rows are a full snapshot and deletes are moot.
+    deleted = []
+    if since_seq is not None:
+        deleted = list(
+            ExpenseTombstone.objects.filter(User_id=user_id, ChangeSeq__gt=since_seq, ChangeSeq__lte=upper)
+            .order_by('ChangeSeq')
+            .values_list('ExpenseId', flat=True)
         )
-        return prompt
 
-    def call_gemini(prompt_text):
-        api_key = os.environ.get('GEMINI_API_KEY')
-        if not api_key:
-            return None, 'GEMINI_API_KEY not configured'
+    cursor = f"{rows[-1]['ChangeSeq']}.{rows[-1]['id']}" if has_more else str(version)
+    for row in rows:
+        del row['ChangeSeq']
+    return JsonResponse({'changes': rows, 'deleted': deleted, 'cursor': cursor, 'has_more': has_more}, status=200)
 
-        # Allow overriding the Gemini model via env; default to requested 2.5 Flash
-        model = os.environ.get('GEMINI_MODEL', 'gemini-2.5-flash')
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-        params = {'key': api_key}
-        payload = {
-            "contents": [
-                {"parts": [{"text": prompt_text}]}
-            ]
-        }
 
-        response = requests.post(url, params=params, json=payload, timeout=30)
-        if response.status_code == 429:
-            return 'quota', 'Gemini quota exceeded'
-        if not response.ok:
-            return None, f"Gemini API error: {response.status_code} {response.text}"
-        data = response.json()
-        try:
-            text = data['candidates'][0]['content']['parts'][0]['text']
-            return text.strip(), None
-        except Exception as exc:  # keep narrow surface
-            return None, f"Gemini response parse error: {exc}"
-
-    def call_openai(prompt_text):
-        api_key = os.environ.get('OPENAI_API_KEY')
-        if not api_key:
-            return None, 'OPENAI_API_KEY not configured'
+@csrf_exempt
+def user_budgets(request, user_id):
+    denied = authorize(request, user_id)
+    if denied:
+        return denied
+
+    if request.method in ['PUT', 'POST']:
         try:
-            from openai import OpenAI
-        except ImportError:
-            return None, 'OpenAI package not installed'
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({'message': 'Invalid JSON format'}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({'message': 'Expected a JSON object'}, status=400)
 
+        errors = {}
+        category = data.get('Category')
+        if category is not None and not isinstance(category, str):
+            errors['Category'] = 'Category must be a string'
+        limit = data.get('MonthlyLimit')
         try:
-            client = OpenAI(api_key=api_key)
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a concise financial coach for personal expenses."},
-                    {"role": "user", "content": prompt_text},
-                ],
-                max_tokens=300,
-                temperature=0.6,
-            )
-            if response.choices and response.choices[0].message.content:
-                return response.choices[0].message.content.strip(), None
-            return None, 'OpenAI returned empty response'
-        except Exception as exc:
-            status_code = (
-                getattr(getattr(exc, 'response', None), 'status_code', None)
-                or getattr(exc, 'status_code', None)
-                or getattr(exc, 'http_status', None)
-            )
-            if status_code == 429 or 'insufficient_quota' in str(exc).lower():
-                return 'quota', 'OpenAI quota exceeded'
-            return None, f"OpenAI API error: {exc}"
+            limit = _clean_cost(limit) if limit is not None else 0.0
+        except ValueError:
+            errors['MonthlyLimit'] = 'Invalid MonthlyLimit value'
+        else:
+            if limit < 0:
+                errors['MonthlyLimit'] = 'Invalid MonthlyLimit value'
+        if errors:
+            return JsonResponse({'message': 'Invalid budget', 'errors': errors}, status=400)
+        if not UserDetails.objects.filter(id=user_id).exists():
+            return JsonResponse({'message': 'User does not exist'}, status=400)
+
+        # No category means the budget on the month's total spending.
+        category = normalize_category(category) if (category or '').strip() else ''
+
+        if not limit:
+            UserBudget.objects.filter(User_id=user_id, Category=category).delete()
+            invalidate_user_budgets(user_id)
+            return JsonResponse({'message': 'Budget removed'}, status=200)
+        UserBudget.objects.update_or_create(User_id=user_id, Category=category, defaults={'MonthlyLimit': limit})
+        invalidate_user_budgets(user_id)
+        return JsonResponse({'message': 'Budget saved', 'category': category, 'monthly_limit': round(limit, 2)}, status=200)
+
+    if request.method == 'GET':
+        # This month's spend against each budget, from the rollup rows.
+        month = month_of(timezone.now())
+        budgets = list(UserBudget.objects.filter(User_id=user_id).order_by('Category'))
+        overall = UserMonthlyRollup.objects.filter(User_id=user_id, Month=month).values_list('TotalCost', flat=True).first()
+        by_category = dict(
+            UserMonthlyItemRollup.objects.filter(
+                User_id=user_id, Month=month, Category__in=[budget.Category for budget in budgets if budget.Category]
+            ).values_list('Category', 'TotalCost')
+        ) if budgets else {}
+        return JsonResponse({
+            'month': month.strftime('%Y-%m'),
+            'budgets': [
+                {
+                    'category': budget.Category,
+                    'monthly_limit': round(budget.MonthlyLimit, 2),
+                    'spent': round((by_category.get(budget.Category) if budget.Category else overall) or 0, 2),
+                }
+                for budget in budgets
+            ],
+        }, status=200)
+
+    return JsonResponse({'message': 'Invalid request method'}, status=405)
+
+
+ALERTS_PAGE_SIZE = 50
+ALERTS_PAGE_SIZE_MAX = 500
+
+
+@csrf_exempt
+@replica_reads
+def spending_alerts(request, user_id):
+    if request.method != 'GET':
+        return JsonResponse({'message': 'Invalid request method'}, status=405)
+    denied = authorize(request, user_id)
+    if denied:
+        return denied
+
+    since = request.GET.get('since')
+    try:
+        limit = max(1, min(int(request.GET.get('limit') or ALERTS_PAGE_SIZE), ALERTS_PAGE_SIZE_MAX))
+        since = int(since) if since else None
+    except ValueError:
+        return JsonResponse({'message': 'Invalid alert parameters'}, status=400)
+
+    # Both reads walk the (User, id) index, so a poll with the last id seen is
+    # one short range scan, usually an empty one.
+    alerts = SpendingAlert.objects.filter(User_id=user_id)
+    if since is None:
+        rows = list(alerts.order_by('-id')[:limit])[::-1]
+        has_more = False
+    else:
+        rows = list(alerts.filter(id__gt=since).order_by('id')[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
 
-    provider = (request.GET.get('provider') or 'gemini').lower()
-    prompt = build_prompt()
-
-    if provider == 'gemini':
-        insight, err = call_gemini(prompt)
-        if insight == 'quota':
-            insight = generate_fallback_insights()
-            return JsonResponse({
-                'insight': insight,
-                'provider': 'fallback',
-                'note': 'Gemini quota exceeded; showing local insights.',
-                'total_expenses': total_expenses,
-                'average_expense': avg_expense,
-                'expense_count': len(expenses)
-            }, status=200)
-        if insight:
-            return JsonResponse({
-                'insight': insight,
-                'provider': 'gemini',
-                'total_expenses': total_expenses,
-                'average_expense': avg_expense,
-                'expense_count': len(expenses)
-            }, status=200)
-
-    if provider == 'openai':
-        insight, err = call_openai(prompt)
-        if insight == 'quota':
-            insight = generate_fallback_insights()
-            return JsonResponse({
-                'insight': insight,
-                'provider': 'fallback',
-                'note': 'OpenAI quota exceeded; showing local insights.',
-                'total_expenses': total_expenses,
-                'average_expense': avg_expense,
-                'expense_count': len(expenses)
-            }, status=200)
-        if insight:
-            return JsonResponse({
-                'insight': insight,
-                'provider': 'openai',
-                'total_expenses': total_expenses,
-                'average_expense': avg_expense,
-                'expense_count': len(expenses)
-            }, status=200)
-
-    # If provider missing or errors, return fallback insights
     return JsonResponse({
-        'insight': generate_fallback_insights(),
-        'provider': 'fallback',
-        'note': err if 'err' in locals() else 'Using local fallback insights.',
-        'total_expenses': total_expenses,
-        'average_expense': avg_expense,
-        'expense_count': len(expenses)
+        'alerts': [
+            {
+                'id': alert.id,
+                'kind': alert.Kind,
+                'category': alert.Category,
+                'expense_id': alert.ExpenseId,
+                'month': alert.Month.strftime('%Y-%m') if alert.Month else None,
+                'amount': alert.Amount,
+                'baseline': alert.Baseline,
+                'message': alert.Message,
+                'created_at': alert.CreatedAt,
+            }
+            for alert in rows
+        ],
+        'cursor': str(rows[-1].id if rows else since or 0),
+        'has_more': has_more,
     }, status=200)
 
 
+def _hedge_deadline(request, provider):
+    if provider != 'hedged':
+        return None
+    try:
+        deadline = float(request.GET.get('deadline') or settings.AI_HEDGE_DEADLINE)
+    except ValueError:
+        deadline = settings.AI_HEDGE_DEADLINE
+    return max(0.5, min(deadline, settings.AI_HTTP_READ_TIMEOUT))
+
+
+def _wants_job(request):
+    return (request.GET.get('async') or '').lower() in ('1', 'true')
+
+
+def _job_accepted(job, created):
+    return JsonResponse({
+        **job_payload(job),
+        'coalesced': not created,
+        'status_url': reverse('insight-job', args=[job.id]),
+        'stream_url': reverse('insight-job-stream', args=[job.id]),
+    }, status=202)
+
+
+RATE_LIMIT_NOTE = 'Insight requests are over their limit; showing local insights.'
+
+
+def _rate_limited(decision):
+    response = JsonResponse({
+        'message': 'Too many insight requests',
+        'scope': decision.scope,
+        'retry_after': round(decision.retry_after, 1),
+    }, status=429)
+    response['Retry-After'] = retry_after_header(decision)
+    return response
+
+
+def _limited_fallback(payload, status, decision):
+    return JsonResponse({**payload, 'rate_limited': decision.scope, 'retry_after': round(decision.retry_after, 1)}, status=status)
+
+
+@csrf_exempt
+@replica_reads
+def expense_ai_insights(request, user_id):
+    if request.method != 'POST':
+        return JsonResponse({'message': 'Invalid request method'}, status=405)
+    denied = authorize(request, user_id)
+    if denied:
+        return denied
+
+    provider = (request.GET.get('provider') or 'gemini').lower()
+    cache_key = insight_cache_key(user_id, provider, expense_fingerprint(user_id))
+    cached = get_cached_insight(cache_key)
+    if cached:
+        return JsonResponse({**cached, 'cached': True}, status=200)
+
+    # Cached answers are cheap; only requests that would reach a provider
+    # spend the user's and the deployment's allowance.
+    decision = take_insight_token(user_id)
+    if not decision.allowed:
+        request_metrics.record_provider_call(provider, 'rate_limited')
+        if not settings.AI_RATE_LIMIT_FALLBACK:
+            return _rate_limited(decision)
+        return _limited_fallback(*local_insight(user_id, provider, RATE_LIMIT_NOTE), decision)
+
+    deadline = _hedge_deadline(request, provider)
+    if _wants_job(request):
+        if not ExpenseDetails.objects.filter(User_id=user_id).exists():
+            return JsonResponse({'message': 'No expenses found for user', 'provider': 'none'}, status=404)
+        return _job_accepted(*enqueue_insight_job(user_id, provider, cache_key, deadline))
+
+    payload, status = generate_insight(user_id, provider, cache_key, deadline)
+    return JsonResponse(payload, status=status)
+
+
+@csrf_exempt
+def insight_job(request, job_id):
+    if request.method != 'GET':
+        return JsonResponse({'message': 'Invalid request method'}, status=405)
+    try:
+        job = InsightJob.objects.get(id=job_id)
+    except InsightJob.DoesNotExist:
+        return JsonResponse({'message': 'Job not found'}, status=404)
+    denied = authorize(request, job.User_id)
+    if denied:
+        return denied
+    return JsonResponse(job_payload(job), status=200)
+
+
+def _event_stream_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@csrf_exempt
+def insight_job_stream(request, job_id):
+    if request.method != 'GET':
+        return JsonResponse({'message': 'Invalid request method'}, status=405)
+    owner_id = InsightJob.objects.filter(id=job_id).values_list('User_id', flat=True).first()
+    if owner_id is None:
+        return JsonResponse({'message': 'Job not found'}, status=404)
+    denied = authorize(request, owner_id)
+    if denied:
+        return denied
+    return _event_stream_response(job_event_stream(job_id))
+
+
+# Async versions of the AI endpoints, routed in place of the ones above when
+# the app is served through backend/asgi.py (ASYNC_VIEWS). Waiting on a
+# provider then holds a socket rather than a worker thread.
+
+def _async_csrf_exempt(view):
+    # Django 4.2's csrf_exempt wraps views in a sync function, which would
+    # hide the coroutine; flag the view itself instead.
+    view.csrf_exempt = True
+    return view
+
+
+@_async_csrf_exempt
+@replica_reads
+async def expense_ai_insights_async(request, user_id):
+    if request.method != 'POST':
+        return JsonResponse({'message': 'Invalid request method'}, status=405)
+    denied = authorize(request, user_id)
+    if denied:
+        return denied
+
+    provider = (request.GET.get('provider') or 'gemini').lower()
+    cache_key = insight_cache_key(user_id, provider, await sync_to_async(expense_fingerprint)(user_id))
+    cached = await aget_cached_insight(cache_key)
+    if cached:
+        return JsonResponse({**cached, 'cached': True}, status=200)
+
+    decision = await atake_insight_token(user_id)
+    if not decision.allowed:
+        request_metrics.record_provider_call(provider, 'rate_limited')
+        if not settings.AI_RATE_LIMIT_FALLBACK:
+            return _rate_limited(decision)
+        return _limited_fallback(*await sync_to_async(local_insight)(user_id, provider, RATE_LIMIT_NOTE), decision)
+
+    deadline = _hedge_deadline(request, provider)
+    if _wants_job(request):
+        if not await ExpenseDetails.objects.filter(User_id=user_id).aexists():
+            return JsonResponse({'message': 'No expenses found for user', 'provider': 'none'}, status=404)
+        return _job_accepted(*await sync_to_async(enqueue_insight_job)(user_id, provider, cache_key, deadline))
+
+    payload, status = await agenerate_insight(user_id, provider, cache_key, deadline)
+    return JsonResponse(payload, status=status)
+
+
+@_async_csrf_exempt
+async def insight_job_async(request, job_id):
+    if request.method != 'GET':
+        return JsonResponse({'message': 'Invalid request method'}, status=405)
+    try:
+        job = await InsightJob.objects.aget(id=job_id)
+    except InsightJob.DoesNotExist:
+        return JsonResponse({'message': 'Job not found'}, status=404)
+    denied = authorize(request, job.User_id)
+    if denied:
+        return denied
+    return JsonResponse(job_payload(job), status=200)
+
+
+@_async_csrf_exempt
+async def insight_job_stream_async(request, job_id):
+    if request.method != 'GET':
+        return JsonResponse({'message': 'Invalid request method'}, status=405)
+    owner_id = await InsightJob.objects.filter(id=job_id).values_list('User_id', flat=True).afirst()
+    if owner_id is None:
+        return JsonResponse({'message': 'Job not found'}, status=404)
+    denied = authorize(request, owner_id)
+    if denied:
+        return denied
+    return _event_stream_response(ajob_event_stream(job_id))
+
+
+@csrf_exempt
+def metrics(request):
+    if request.method != 'GET':
+        return JsonResponse({'message': 'Invalid request method'}, status=405)
+    return HttpResponse(request_metrics.REGISTRY.render(), content_type=request_metrics.CONTENT_TYPE)
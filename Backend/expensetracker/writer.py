@@ -0,0 +1,136 @@
+import os
+import queue
+import threading
+import time
+from concurrent import futures
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .alerts import check_new_expenses
+from .insights import invalidate_user_insights
+from .models import ExpenseDetails, normalize_category
+from .rollups import add_batch_to_rollups
+from .versions import bump_data_version
+
+
+class WriteTimeout(Exception):
+    """The expense was still queued when the caller gave up; it was not saved."""
+
+
+def insert_expenses(expenses):
+    """Insert new expenses with their change stamps, rollups and alerts. Run inside a transaction."""
+    versions = bump_data_version(*{expense.User_id for expense in expenses})
+    for expense in expenses:
+        # bulk_create bypasses save(), so the category key is set here.
+        expense.Category = normalize_category(expense.ExpenseItem)
+        expense.ChangeSeq = versions[expense.User_id]
+    ExpenseDetails.objects.bulk_create(expenses)
+    add_batch_to_rollups(expenses)
+    check_new_expenses(expenses)
+
+
+class ExpenseWriter:
+    """One thread per process that commits queued inserts in grouped transactions.
+
+    SQLite takes a database-wide write lock and syncs on every commit, so
+    request threads inserting one row each mostly wait on each other (or
+    fail with "database is locked"). Here they hand their row to the writer
+    and block on a Future; the writer takes whatever is queued, waits up to
+    ``max_delay`` seconds for more, and commits the lot at once.
+    """
+
+    def __init__(self, max_batch, max_delay):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='expense-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, expense):
+        future = futures.Future()
+        self._queue.put((expense, future))
+        return future
+
+    def save(self, expense, timeout=None):
+        """Queue ``expense`` and wait until it is committed; raises the insert's error."""
+        future = self.submit(expense)
+        try:
+            return future.result(timeout)
+        except futures.TimeoutError:
+            if future.cancel():
+                raise WriteTimeout('Expense write timed out') from None
+            # Already in a transaction: its outcome is moments away.
+            return future.result()
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            # Callers that timed out cancelled their futures; skip those rows.
+            batch = [(expense, future) for expense, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                connection.close_if_unusable_or_obsolete()
+                commit_batch(batch)
+            except Exception as exc:
+                # Never leave a request waiting on a future nobody will resolve.
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+
+    def _take_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+
+def commit_batch(batch):
+    """Insert ``[(expense, future), ...]`` in one transaction and resolve the futures."""
+    try:
+        with transaction.atomic():
+            insert_expenses([expense for expense, _ in batch])
+    except Exception:
+        # One bad row must not fail the requests grouped with it.
+        for expense, future in batch:
+            expense.pk = None
+            try:
+                with transaction.atomic():
+                    insert_expenses([expense])
+            except Exception as exc:
+                future.set_exception(exc)
+            else:
+                _resolve([(expense, future)])
+        return
+    _resolve(batch)
+
+
+def _resolve(batch):
+    for user_id in {expense.User_id for expense, _ in batch}:
+        invalidate_user_insights(user_id)
+    for expense, future in batch:
+        future.set_result(expense)
+
+
+_lock = threading.Lock()
+_writer = None
+_owner_pid = None
+
+
+def get_expense_writer():
+    global _writer, _owner_pid
+    with _lock:
+        # A forked worker does not inherit the parent's thread; start its own.
+        if _writer is None or _owner_pid != os.getpid():
+            _writer = ExpenseWriter(
+                max_batch=settings.EXPENSE_WRITE_BATCH_SIZE,
+                max_delay=settings.EXPENSE_WRITE_MAX_DELAY_MS / 1000,
+            )
+            _owner_pid = os.getpid()
+        return _writer
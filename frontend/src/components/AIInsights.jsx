@@ -1,6 +1,12 @@
 import React, { useState } from 'react';
 import './AIInsights.css';
-import { API_BASE_URL } from '../config/api';
+import { API_BASE_URL, authHeaders } from '../config/api';
+
+const PROVIDER_NAMES = {
+    gemini: 'Gemini',
+    openai: 'OpenAI GPT-3.5',
+    fallback: 'Local insights',
+};
 
 const AIInsights = ({ userId }) => {
     const [insights, setInsights] = useState(null);
@@ -13,12 +19,12 @@ const AIInsights = ({ userId }) => {
         
         try {
             const response = await fetch(
-                `${API_BASE_URL}/ai/insights/${userId}/`,
+                `${API_BASE_URL}/ai/insights/${userId}/?provider=hedged`,
                 {
                     method: 'POST',
-                    headers: {
+                    headers: authHeaders({
                         'Content-Type': 'application/json'
-                    }
+                    })
                 }
             );
 
@@ -117,7 +123,7 @@ const AIInsights = ({ userId }) => {
                         <div className="analysis-header">
                             <h3>AI Analysis</h3>
                             <span className="provider-badge">
-                                🤖 OpenAI GPT-3.5
+                                🤖 {PROVIDER_NAMES[insights.provider] || 'AI'}
                             </span>
                         </div>
                         <div className="analysis-content">
@@ -3,7 +3,7 @@ import { useState, useEffect } from 'react';
 import { toast, ToastContainer } from 'react-toastify'
 import 'react-toastify/dist/ReactToastify.css'
 import { useNavigate } from 'react-router-dom'
-import { API_BASE_URL } from '../config/api'
+import { API_BASE_URL, authHeaders } from '../config/api'
 
 const AddExpense = () => {
 
@@ -47,9 +47,9 @@ const AddExpense = () => {
 
             const response = await fetch(`${API_BASE_URL}/add-expense/`, {
                 method: 'POST',
-                headers: {
+                headers: authHeaders({
                     'Content-Type': 'application/json',
-                },
+                }),
                 body: JSON.stringify(payload),
             });
 
@@ -9,7 +9,7 @@ import {
     Legend,
 } from 'chart.js';
 import { Pie } from 'react-chartjs-2';
-import { API_BASE_URL } from '../config/api';
+import { API_BASE_URL, authHeaders } from '../config/api';
 
 ChartJS.register(ArcElement, Tooltip, Legend);
 
@@ -18,7 +18,7 @@ const Dashboard = () => {
     const userName = localStorage.getItem('userName');
     const userId = localStorage.getItem('userId');
 
-    const [expenses, setExpenses] = useState([]);
+    const [summary, setSummary] = useState(null);
     const [isLoading, setIsLoading] = useState(true);
 
     useEffect(() => {
@@ -29,14 +29,11 @@ const Dashboard = () => {
 
         const fetchDashboardData = async () => {
             try {
-                const response = await fetch(`${API_BASE_URL}/manage-expense/${userId}/`);
+                const response = await fetch(`${API_BASE_URL}/summary/${userId}/`, { headers: authHeaders() });
                 const data = await response.json().catch(() => ({}));
 
                 if (response.ok) {
-                    const nextExpenses = Array.isArray(data)
-                        ? data
-                        : data?.expenses || [];
-                    setExpenses(nextExpenses);
+                    setSummary(data);
                 } else {
                     toast.error(data?.message || 'Unable to load expenses');
                 }
@@ -56,62 +53,26 @@ const Dashboard = () => {
         return Number.isFinite(parsed) ? parsed : 0;
     };
 
-    const { totalExpense, averageExpense, highestExpense, recentExpenses } = useMemo(() => {
-        if (!expenses.length) {
-            return {
-                totalExpense: 0,
-                averageExpense: 0,
-                highestExpense: null,
-                recentExpenses: [],
-            };
-        }
-
-        const total = expenses.reduce((sum, expense) => sum + toAmount(expense.ExpenseCost), 0);
-        const highest = expenses.reduce((max, expense) =>
-            toAmount(expense.ExpenseCost) > toAmount(max?.ExpenseCost)
-                ? expense
-                : max,
-            expenses[0]
-        );
-
-        const recent = [...expenses]
-            .sort((a, b) => new Date(b.ExpenseDate) - new Date(a.ExpenseDate))
-            .slice(0, 5);
-
-        return {
-            totalExpense: total,
-            averageExpense: total / expenses.length,
-            highestExpense: highest,
-            recentExpenses: recent,
-        };
-    }, [expenses]);
+    const totalExpense = toAmount(summary?.total_expenses);
+    const averageExpense = toAmount(summary?.average_expense);
+    const expenseCount = summary?.expense_count || 0;
+    const highestExpense = summary?.highest_expense || null;
+    const recentExpenses = summary?.recent_expenses || [];
 
     const monthlyChart = useMemo(() => {
-        if (!expenses.length) {
+        if (!summary?.monthly_totals?.length) {
             return [];
         }
 
-        const monthlyTotals = expenses.reduce((acc, expense) => {
-            if (!expense.ExpenseDate) {
-                return acc;
-            }
-            const date = new Date(expense.ExpenseDate);
-            if (Number.isNaN(date.getTime())) return acc;
-
-            const key = `${date.getFullYear()}-${String(date.getMonth() + 1).padStart(2, '0')}`;
-            const label = `${date.toLocaleString('default', { month: 'short' })} ${date.getFullYear()}`;
-
-            if (!acc[key]) {
-                acc[key] = { label, total: 0, order: date.getTime() };
-            }
-            acc[key].total += toAmount(expense.ExpenseCost);
-            return acc;
-        }, {});
-
-        return Object.values(monthlyTotals)
-            .sort((a, b) => a.order - b.order)
-            .slice(-6);
-    }, [expenses]);
+        return summary.monthly_totals.map((month) => {
+            const [year, monthIndex] = month.month.split('-').map(Number);
+            const date = new Date(year, monthIndex - 1, 1);
+            return {
+                label: `${date.toLocaleString('default', { month: 'short' })} ${year}`,
+                total: toAmount(month.total),
+            };
+        });
+    }, [summary]);
 
     const chartMaxValue = monthlyChart.reduce(
         (max, month) => Math.max(max, month.total),
@@ -119,22 +80,13 @@ const Dashboard = () => {
     ) || 1;
 
     const categoryChart = useMemo(() => {
-        if (!expenses.length) return [];
-
-        const totals = expenses.reduce((acc, expense) => {
-            const key = expense.ExpenseItem || 'Other';
-            const amount = toAmount(expense.ExpenseCost);
-            if (!acc[key]) {
-                acc[key] = { label: key, total: 0 };
-            }
-            acc[key].total += amount;
-            return acc;
-        }, {});
+        if (!summary?.top_items?.length) return [];
 
-        return Object.values(totals)
-            .sort((a, b) => b.total - a.total)
-            .slice(0, 6);
-    }, [expenses]);
+        return summary.top_items.map((item) => ({
+            label: item.item,
+            total: toAmount(item.total),
+        }));
+    }, [summary]);
 
     const pieChartData = useMemo(() => {
         if (!categoryChart.length) {
@@ -202,7 +154,7 @@ const Dashboard = () => {
                     <div className='card h-100 text-dark bg-warning'>
                         <div className='card-body'>
                             <p className='text-uppercase small mb-2'>Entries logged</p>
-                            <h3 className='fw-bold'>{expenses.length}</h3>
+                            <h3 className='fw-bold'>{expenseCount}</h3>
                         </div>
                     </div>
                 </div>
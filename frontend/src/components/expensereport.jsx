@@ -2,7 +2,7 @@ import React, { useEffect, useMemo, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { toast, ToastContainer } from 'react-toastify';
 import 'react-toastify/dist/ReactToastify.css';
-import { API_BASE_URL } from '../config/api';
+import { API_BASE_URL, authHeaders } from '../config/api';
 
 const ExpenseReport = () => {
     const navigate = useNavigate();
@@ -31,7 +31,7 @@ const ExpenseReport = () => {
     const fetchExpenses = async (id) => {
         setIsLoading(true);
         try {
-            const response = await fetch(`${API_BASE_URL}/manage-expense/${id}/`);
+            const response = await fetch(`${API_BASE_URL}/manage-expense/${id}/`, { headers: authHeaders() });
             const data = await response.json().catch(() => ({}));
             if (response.ok) {
                 const nextExpenses = Array.isArray(data)
@@ -167,7 +167,7 @@ const ExpenseReport = () => {
         try {
             const response = await fetch(`${API_BASE_URL}/ai/insights/${userId}/`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
+                headers: authHeaders({ 'Content-Type': 'application/json' }),
                 body: JSON.stringify({ filters })
             });
             const data = await response.json().catch(() => ({}));
@@ -47,7 +47,7 @@ const login = () => {
                 toast.success('Login successful! Redirecting to home page.');
                 localStorage.setItem('userId', data.userId);
                 localStorage.setItem('userEmail', data.userEmail);
-                // localStorage.setItem('token', data.token);
+                localStorage.setItem('token', data.token);
                 localStorage.setItem('userName', data.userName);
                 setTimeout(() => {
                     navigate('/dashboard');
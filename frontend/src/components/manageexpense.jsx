@@ -2,7 +2,9 @@ import React, { useEffect, useState } from 'react'
 import { useNavigate } from 'react-router-dom'
 import { toast, ToastContainer } from 'react-toastify';
 import 'react-toastify/dist/ReactToastify.css'
-import { API_BASE_URL } from '../config/api'
+import { API_BASE_URL, authHeaders } from '../config/api'
+
+const PAGE_SIZE = 50;
 
 const ManageExpense = () => {
 
@@ -13,6 +15,9 @@ const ManageExpense = () => {
     const [editForm, setEditForm] = useState({ ExpenseItem: '', ExpenseCost: '' });
     const [isSaving, setIsSaving] = useState(false);
     const [deletingId, setDeletingId] = useState(null);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [isLoadingMore, setIsLoadingMore] = useState(false);
+    const [syncCursor, setSyncCursor] = useState(null);
 
     const userId = localStorage.getItem('userId');
 
@@ -27,17 +32,30 @@ const ManageExpense = () => {
     }, [userId, navigate]);
 
 
-    const fetchExpenses = async (userId) => {
-        setIsLoading(true);
+    const fetchExpenses = async (userId, cursor = null) => {
+        if (cursor) {
+            setIsLoadingMore(true);
+        } else {
+            setIsLoading(true);
+        }
         try {
-            const response = await fetch(`${API_BASE_URL}/manage-expense/${userId}/`);
+            const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+            if (cursor) params.set('cursor', cursor);
+            const response = await fetch(`${API_BASE_URL}/manage-expense/${userId}/?${params}`, { headers: authHeaders() });
             const data = await response.json().catch(() => ({}));
 
             if (response.ok) {
                 const nextExpenses = Array.isArray(data)
                     ? data
                     : data?.expenses || [];
-                setExpenses(nextExpenses);
+                setExpenses((prev) => {
+                    if (!cursor) return nextExpenses;
+                    // A delta sync may already have pulled in some of these rows.
+                    const known = new Set(prev.map((expense) => expense.id));
+                    return [...prev, ...nextExpenses.filter((expense) => !known.has(expense.id))];
+                });
+                setNextCursor(data?.next_cursor || null);
+                if (!cursor) setSyncCursor(data?.sync_cursor || null);
             } else {
                 const msg = (data && data.message) ? data.message : response.statusText;
                 toast.error(`Failed to fetch expenses: ${msg}`);
@@ -48,9 +66,51 @@ const ManageExpense = () => {
             console.error('Fetch expenses error:', error);
         } finally {
             setIsLoading(false);
+            setIsLoadingMore(false);
         }
     };
 
+    // Pull only what changed since the last sync instead of reloading the list.
+    const syncChanges = async () => {
+        if (!syncCursor) {
+            fetchExpenses(userId);
+            return;
+        }
+
+        const changed = [];
+        const deleted = new Set();
+        let since = syncCursor;
+        try {
+            while (true) {
+                const params = new URLSearchParams({ user_id: userId, since });
+                const response = await fetch(`${API_BASE_URL}/expenses/changes/?${params}`, { headers: authHeaders() });
+                const data = await response.json().catch(() => ({}));
+                if (!response.ok) throw new Error(data?.message || response.statusText);
+                changed.push(...(data.changes || []));
+                (data.deleted || []).forEach((id) => deleted.add(id));
+                since = data.cursor;
+                if (!data.has_more) break;
+            }
+        } catch (error) {
+            console.error('Sync expenses error:', error);
+            fetchExpenses(userId);
+            return;
+        }
+
+        setSyncCursor(since);
+        setExpenses((prev) => {
+            const updates = new Map(changed.map((expense) => [expense.id, expense]));
+            const known = new Set(prev.map((expense) => expense.id));
+            const kept = prev
+                .filter((expense) => !deleted.has(expense.id))
+                .map((expense) => updates.get(expense.id) || expense);
+            const added = changed.filter((expense) => !known.has(expense.id) && !deleted.has(expense.id));
+            return [...added, ...kept].sort(
+                (a, b) => new Date(b.ExpenseDate) - new Date(a.ExpenseDate) || b.id - a.id
+            );
+        });
+    };
+
     const startEdit = (expense) => {
         setEditingId(expense.id);
         setEditForm({
@@ -89,7 +149,7 @@ const ManageExpense = () => {
         try {
             const response = await fetch(`${API_BASE_URL}/expenses/${editingId}/`, {
                 method: 'PUT',
-                headers: { 'Content-Type': 'application/json' },
+                headers: authHeaders({ 'Content-Type': 'application/json' }),
                 body: JSON.stringify({
                     ExpenseItem: editForm.ExpenseItem.trim(),
                     ExpenseCost: Number(editForm.ExpenseCost)
@@ -101,7 +161,7 @@ const ManageExpense = () => {
             if (response.ok) {
                 toast.success(data?.message || 'Expense updated');
                 cancelEdit();
-                fetchExpenses(userId);
+                syncChanges();
             } else {
                 toast.error(data?.message || 'Unable to update expense');
             }
@@ -120,7 +180,8 @@ const ManageExpense = () => {
         setDeletingId(expenseId);
         try {
             const response = await fetch(`${API_BASE_URL}/expenses/${expenseId}/`, {
-                method: 'DELETE'
+                method: 'DELETE',
+                headers: authHeaders()
             });
             const data = await response.json().catch(() => ({}));
 
@@ -256,6 +317,18 @@ const ManageExpense = () => {
                     </tbody>
                 </table>
             </div>
+            {nextCursor && !isLoading && (
+                <div className='text-center mb-4'>
+                    <button
+                        type='button'
+                        className='btn btn-outline-secondary'
+                        onClick={() => fetchExpenses(userId, nextCursor)}
+                        disabled={isLoadingMore}
+                    >
+                        {isLoadingMore ? 'Loading...' : 'Load more'}
+                    </button>
+                </div>
+            )}
             <ToastContainer position="bottom-center" />
             <title>Manage Expenses - Expense Tracker</title>
             <meta name="description" content="Manage Expenses - Expense Tracker" />
@@ -8,6 +8,7 @@ const navbar = () => {
     const userID = localStorage.getItem('userId');
     const handlelogout = () => {
         localStorage.removeItem('userId');
+        localStorage.removeItem('token');
         navigate('/login');
         toast.warn('Logged out successfully');
     }
@@ -2,3 +2,9 @@ const rawApiBaseUrl = import.meta.env.VITE_API_BASE_URL?.trim() ||
     (typeof window !== 'undefined' ? window.location.origin : 'http://localhost:8000')
 
 export const API_BASE_URL = `${rawApiBaseUrl.replace(/\/$/, '')}/api`
+
+// Login stores a signed token; send it so the API can tell which user is calling.
+export const authHeaders = (headers = {}) => {
+    const token = localStorage.getItem('token')
+    return token ? { ...headers, Authorization: `Bearer ${token}` } : headers
+}